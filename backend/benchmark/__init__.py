@@ -0,0 +1,9 @@
+"""Reproducible end-to-end benchmarks for the sensor backend.
+
+    python -m benchmark --sensors 200 --samples 20000 --output report.json
+    python -m benchmark compare before.json after.json
+
+Generates a dataset, ingests it with ingest_csv.py, replays dashboard workloads
+against the FastAPI app in-process and writes a JSON report (see report.py).
+Run from the backend directory.
+"""
@@ -0,0 +1,170 @@
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+
+from .datasets import PRESETS, generate_dataset
+from .report import compare, environment, peak_rss_bytes, summarize, write_report
+from .workloads import WORKLOADS, Context, run_workload
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_WORKDIR = os.path.join(BACKEND_DIR, "benchmark_run")
+
+
+def storage_bytes(ingest_csv):
+    """Size of the ingested data: the database file or the Parquet store directory."""
+    if ingest_csv.STORAGE_MODE == "parquet":
+        return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(ingest_csv.STORE_DIR) for f in files)
+    return os.path.getsize(ingest_csv.DB_PATH)
+
+
+def prepare(workdir, dataset, reuse, quiet):
+    """Generates and ingests the dataset in workdir (ingest_csv.py's data/ + database or store).
+
+    With --reuse an existing database for the same dataset parameters and storage mode
+    is kept, so repeated runs only measure the API. Returns the ingest section of the report.
+    """
+    import ingest_csv
+    marker = os.path.join(workdir, f"dataset_{ingest_csv.STORAGE_MODE}.json")
+    if reuse and os.path.exists(marker):
+        with open(marker) as f:
+            previous = json.load(f)
+        if previous["dataset"] == dataset:
+            return previous["ingest"]
+
+    data_dir = os.path.join(workdir, "data")
+    if os.path.isdir(data_dir):
+        for name in os.listdir(data_dir):
+            os.remove(os.path.join(data_dir, name))
+
+    started = time.perf_counter()
+    with quieted(quiet):
+        rows = generate_dataset(data_dir, dataset["sensors"], dataset["samples"], dataset["duration"],
+                                dataset["irregular"], dataset["seed"])
+    generate_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    with quieted(quiet):
+        ingest_csv.ingest_data(full=True)
+    ingest_s = time.perf_counter() - started
+
+    ingest = {
+        "rows": rows,
+        "generate_s": round(generate_s, 3),
+        "ingest_s": round(ingest_s, 3),
+        "ingest_rows_per_s": round(rows / ingest_s),
+        "db_bytes": storage_bytes(ingest_csv),
+    }
+    with open(marker, "w") as f:
+        json.dump({"dataset": dataset, "ingest": ingest}, f)
+    return ingest
+
+
+@contextlib.contextmanager
+def quieted(quiet):
+    """The API and ingest log every request/batch to stdout; keep that out of the timings."""
+    if not quiet:
+        yield
+        return
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def run(args):
+    dataset = dict(PRESETS[args.dataset])
+    for key in ("sensors", "samples", "duration", "irregular"):
+        if getattr(args, key) is not None:
+            dataset[key] = getattr(args, key)
+    dataset["seed"] = args.seed
+    workloads = args.workloads.split(",") if args.workloads else list(WORKLOADS)
+    unknown = [w for w in workloads if w not in WORKLOADS]
+    if unknown:
+        sys.exit(f"Unknown workload(s) {', '.join(unknown)}. Use: {', '.join(WORKLOADS)}")
+
+    # ingest_csv.py and main.py use paths relative to the working directory
+    os.makedirs(args.workdir, exist_ok=True)
+    output = os.path.abspath(args.output) if args.output not in (None, "-") else args.output
+    os.chdir(args.workdir)
+    sys.path.insert(0, BACKEND_DIR)
+    os.environ["STORAGE_MODE"] = args.storage  # read by ingest_csv.py and main.py at import
+
+    print(f"Dataset: {dataset}", file=sys.stderr)
+    ingest = prepare(".", dataset, args.reuse, not args.verbose)
+    ingest["peak_rss_bytes"] = peak_rss_bytes()
+    print(f"Ingest: {ingest}", file=sys.stderr)
+
+    # Configuration main.py reads at import time
+    os.environ["LIVE_INGEST"] = "0"
+    if args.no_cache:
+        os.environ["TILE_CACHE_BYTES"] = "0"
+    from fastapi.testclient import TestClient
+    import main
+
+    results = {}
+    with TestClient(main.app) as client:
+        status = client.get("/api/status").json()
+        sensors = [name for names in client.get("/api/sensors").json().values() for name in names]
+        start, end = status["time_range"]
+        ctx = Context(sensors, start, end, repeat=args.repeat, concurrency=args.concurrency,
+                      view_sensors=args.view_sensors, fmt=args.format, agg=args.agg)
+        for name in workloads:
+            with quieted(not args.verbose):
+                samples, wall = run_workload(name, client, ctx)
+            results[name] = summarize(samples, wall)
+            print(f"{name}: {results[name].get('p50_ms')} ms p50, {results[name].get('p99_ms')} ms p99, "
+                  f"{results[name]['requests']} requests", file=sys.stderr)
+        cache = main.tile_cache.stats()
+
+    report = {
+        "environment": environment(),
+        "dataset": dataset,
+        "config": {"repeat": args.repeat, "concurrency": args.concurrency, "view_sensors": ctx.view_sensors,
+                   "format": args.format, "agg": args.agg, "tile_cache": not args.no_cache,
+                   "storage": args.storage},
+        "ingest": ingest,
+        "workloads": results,
+        "cache": cache,
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+    write_report(report, output)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmark",
+                                     description="Generate a dataset, ingest it and replay dashboard workloads "
+                                                 "against the API in-process. Run from the backend directory.")
+    sub = parser.add_subparsers(dest="command")
+    cmp = sub.add_parser("compare", help="Compare two JSON reports")
+    cmp.add_argument("before")
+    cmp.add_argument("after")
+
+    parser.add_argument("--dataset", choices=PRESETS, default="small", help="Dataset preset (default: small)")
+    parser.add_argument("--sensors", type=int, help="Override the preset's sensor count")
+    parser.add_argument("--samples", type=int, help="Override the preset's samples per sensor")
+    parser.add_argument("--duration", type=float, help="Override the preset's duration (seconds)")
+    parser.add_argument("--irregular", type=float, help="0 = even sampling, 1 = fully random intervals")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workloads", help=f"Comma-separated subset of: {', '.join(WORKLOADS)}")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions per workload")
+    parser.add_argument("--concurrency", type=int, default=4, help="Dashboards in the concurrent workload")
+    parser.add_argument("--view-sensors", type=int, default=10, help="Sensors per chart")
+    parser.add_argument("--format", choices=("json", "arrow", "f64"), default="f64")
+    parser.add_argument("--agg", default="avg")
+    parser.add_argument("--storage", choices=("duckdb", "parquet"), default="duckdb", help="STORAGE_MODE to ingest and serve")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the tile cache (TILE_CACHE_BYTES=0)")
+    parser.add_argument("--workdir", default=DEFAULT_WORKDIR, help="Where the dataset and database are written")
+    parser.add_argument("--reuse", action="store_true", help="Keep an already ingested dataset with the same parameters")
+    parser.add_argument("--output", "-o", default="-", help="Report path (default: stdout)")
+    parser.add_argument("--verbose", action="store_true", help="Don't hide ingest and API logging")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        compare(args.before, args.after)
+    else:
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+# Named presets for --dataset; every field can be overridden on the command line
+PRESETS = {
+    "tiny": {"sensors": 20, "samples": 5_000, "duration": 3600.0, "irregular": 0.0},
+    "small": {"sensors": 200, "samples": 10_000, "duration": 3600.0, "irregular": 0.2},
+    "medium": {"sensors": 500, "samples": 40_000, "duration": 86400.0, "irregular": 0.2},
+    "full": {"sensors": 2000, "samples": 10_000, "duration": 3600.0, "irregular": 0.0},  # generate_signals.py scale
+}
+
+
+def generate_dataset(out_dir, sensors, samples, duration, irregular=0.0, seed=0):
+    """Writes `sensors` CSV files (time,value) to out_dir with generate_signals.py.
+
+    Deterministic for a given seed, so reports from different commits compare like for like.
+    Returns the total number of rows written.
+    """
+    import generate_signals
+    return generate_signals.generate(sensors, samples, duration, seed, "csv", out_dir, irregular=irregular)
@@ -0,0 +1,109 @@
+import json
+import os
+import platform
+import subprocess
+import sys
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Metrics compared by `python -m benchmark compare`, lower is better for all of them
+COMPARED = ("p50_ms", "p95_ms", "p99_ms", "mean_payload_bytes")
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process so far (None where getrusage is missing)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if not peak:
+        return None
+    return peak if sys.platform == "darwin" else peak * 1024  # Linux reports KiB
+
+
+def summarize(samples, wall_seconds):
+    """Latency percentiles, throughput and payload size for one workload's samples."""
+    ok = [s for s in samples if s["status"] == 200]
+    summary = {"requests": len(samples), "errors": len(samples) - len(ok),
+               "wall_s": round(wall_seconds, 3),
+               "throughput_rps": round(len(samples) / wall_seconds, 2) if wall_seconds else None}
+    if not ok:
+        return summary
+
+    latency = np.array([s["latency_ms"] for s in ok])
+    payload = np.array([s["bytes"] for s in ok])
+    p50, p95, p99 = np.percentile(latency, [50, 95, 99])
+    summary.update({
+        "p50_ms": round(p50, 3),
+        "p95_ms": round(p95, 3),
+        "p99_ms": round(p99, 3),
+        "mean_ms": round(latency.mean(), 3),
+        "max_ms": round(latency.max(), 3),
+        "mean_payload_bytes": int(payload.mean()),
+        "total_payload_bytes": int(payload.sum()),
+    })
+    # Median per Server-Timing stage, to see where a regression went
+    stages = {}
+    for s in ok:
+        for name, ms in s["stages"].items():
+            stages.setdefault(name, []).append(ms)
+    summary["stage_p50_ms"] = {name: round(float(np.median(v)), 3) for name, v in stages.items()}
+    return summary
+
+
+def environment():
+    repo = os.path.dirname(os.path.abspath(__file__))  # the benchmark chdirs into its work directory
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True, cwd=repo).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                                    text=True, check=True, cwd=repo).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        commit, dirty = None, None
+
+    import duckdb
+    import fastapi
+    return {
+        "commit": commit,
+        "dirty": dirty,
+        "python": platform.python_version(),
+        "duckdb": duckdb.__version__,
+        "fastapi": fastapi.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def write_report(report, path):
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if path in (None, "-"):
+        print(text)
+    else:
+        with open(path, "w") as f:
+            f.write(text + "\n")
+
+
+def compare(before_path, after_path):
+    """Prints per-workload changes between two reports (negative % = faster/smaller)."""
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+
+    print(f"before: {before['environment'].get('commit')}  after: {after['environment'].get('commit')}")
+    if before["dataset"] != after["dataset"]:
+        print("warning: the reports were run on different datasets")
+    print(f"{'workload':<14}{'metric':<20}{'before':>12}{'after':>12}{'change':>10}")
+    for name, new in after["workloads"].items():
+        old = before["workloads"].get(name)
+        if old is None:
+            continue
+        for metric in COMPARED:
+            if metric not in old or metric not in new:
+                continue
+            change = (new[metric] - old[metric]) / old[metric] * 100 if old[metric] else 0.0
+            print(f"{name:<14}{metric:<20}{old[metric]:>12}{new[metric]:>12}{change:>+9.1f}%")
@@ -0,0 +1,152 @@
+import re
+import threading
+import time
+
+# One request per chart redraw, as the dashboard issues them
+CHART_WIDTH = 1200
+HEATMAP_HEIGHT = 400
+
+_TIMING = re.compile(r"(\w+);dur=([0-9.]+)")
+
+
+def parse_server_timing(header):
+    """{stage: ms} from a Server-Timing header."""
+    return {name: float(ms) for name, ms in _TIMING.findall(header or "")}
+
+
+class Recorder:
+    """Collects one sample per request; safe to share between client threads."""
+
+    def __init__(self):
+        self.samples = []
+        self._lock = threading.Lock()
+
+    def get(self, client, url, params):
+        started = time.perf_counter()
+        response = client.get(url, params=params)
+        sample = {
+            "latency_ms": (time.perf_counter() - started) * 1000,
+            "status": response.status_code,
+            "bytes": len(response.content),
+            "stages": parse_server_timing(response.headers.get("server-timing")),
+        }
+        with self._lock:
+            self.samples.append(sample)
+        return response
+
+
+def full_range(client, rec, ctx):
+    """Dashboard open: every selected sensor over the whole recording."""
+    for _ in range(ctx.repeat):
+        rec.get(client, "/api/data", ctx.params(ctx.selection(ctx.view_sensors)))
+
+
+def zoom_sequence(client, rec, ctx):
+    """Repeated 2x zoom into the middle of the recording, ten steps deep."""
+    ids = ctx.selection(ctx.view_sensors)
+    for r in range(ctx.repeat):
+        start, end = ctx.start, ctx.end
+        for _ in range(10):
+            mid, half = (start + end) / 2, (end - start) / 4
+            start, end = mid - half, mid + half
+            rec.get(client, "/api/data", ctx.params(ids, start, end, gen=r))
+
+
+def pan_sequence(client, rec, ctx):
+    """A 10% wide window dragged across the recording in 5% steps."""
+    ids = ctx.selection(ctx.view_sensors)
+    span = (ctx.end - ctx.start) / 10
+    for _ in range(ctx.repeat):
+        start = ctx.start
+        while start + span <= ctx.end:
+            rec.get(client, "/api/data", ctx.params(ids, start, start + span))
+            start += span / 2
+
+
+def many_sensors(client, rec, ctx):
+    """Selection grown 1, 10, 100, ... up to every sensor, full range and a 1% window."""
+    counts = sorted({min(n, len(ctx.sensors)) for n in (1, 10, 100, 1000, len(ctx.sensors))})
+    span = (ctx.end - ctx.start) / 100
+    for _ in range(ctx.repeat):
+        for n in counts:
+            ids = ctx.selection(n)
+            rec.get(client, "/api/data", ctx.params(ids))
+            rec.get(client, "/api/data", ctx.params(ids, ctx.start, ctx.start + span))
+
+
+def heatmap(client, rec, ctx):
+    """Overview grid of every sensor, full range then a 10% window."""
+    span = (ctx.end - ctx.start) / 10
+    for _ in range(ctx.repeat):
+        for start, end in ((ctx.start, ctx.end), (ctx.start, ctx.start + span)):
+            rec.get(client, "/api/heatmap", {"start": start, "end": end, "width": CHART_WIDTH,
+                                             "height": HEATMAP_HEIGHT, "dtype": "uint8"})
+
+
+def concurrent(client, rec, ctx):
+    """`concurrency` dashboards zooming and panning at once, each with its own client id
+    and sensor subset (so the executor's per-client limits apply as in production)."""
+    errors = []
+
+    def dashboard(n):
+        try:
+            offset = n * ctx.view_sensors
+            ids = [ctx.sensors[(offset + i) % len(ctx.sensors)] for i in range(ctx.view_sensors)]
+            span = (ctx.end - ctx.start) / (n + 2)
+            for r in range(ctx.repeat):
+                start = ctx.start + (r * span / 4) % (ctx.end - ctx.start - span)
+                for gen, step in enumerate((1.0, 0.5, 0.25)):
+                    rec.get(client, "/api/data", ctx.params(ids, start, start + span * step, client=f"bench-{n}", gen=gen))
+        except Exception as e:  # surfaced after join, a dead thread would just look fast
+            errors.append(e)
+
+    threads = [threading.Thread(target=dashboard, args=(n,)) for n in range(ctx.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if errors:
+        raise errors[0]
+
+
+WORKLOADS = {
+    "full_range": full_range,
+    "zoom": zoom_sequence,
+    "pan": pan_sequence,
+    "many_sensors": many_sensors,
+    "heatmap": heatmap,
+    "concurrent": concurrent,
+}
+
+
+class Context:
+    """What the workloads know about the dataset, plus the request parameters they share."""
+
+    def __init__(self, sensors, start, end, repeat=3, concurrency=4, view_sensors=10, fmt="f64", agg="avg"):
+        self.sensors = sensors
+        self.start = start
+        self.end = end
+        self.repeat = repeat
+        self.concurrency = concurrency
+        self.view_sensors = min(view_sensors, len(sensors))
+        self.fmt = fmt
+        self.agg = agg
+
+    def selection(self, n):
+        return self.sensors[:n]
+
+    def params(self, ids, start=None, end=None, client=None, gen=None):
+        params = {"ids": ",".join(ids), "width": CHART_WIDTH, "agg": self.agg, "format": self.fmt}
+        if start is not None:
+            params.update(start=start, end=end)
+        if client is not None:
+            params.update(client=client, gen=gen)
+        return params
+
+
+def run_workload(name, client, ctx):
+    """Runs one workload and returns (samples, wall seconds)."""
+    rec = Recorder()
+    started = time.perf_counter()
+    WORKLOADS[name](client, rec, ctx)
+    return rec.samples, time.perf_counter() - started
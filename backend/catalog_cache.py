@@ -0,0 +1,95 @@
+import threading
+
+import numpy as np
+
+
+class SensorCatalog:
+    """In-memory copy of sensor_catalog (plus the rollup levels present), one load per
+    database change.
+
+    Per-sensor stats are kept as NumPy columns aligned with `keys`, so the extents of
+    a selection are a few vectorized min/max calls instead of a query.
+    """
+
+    def __init__(self, rows, levels, compact=False):
+        # rows: (sensor_key, name, sensor_group, first_ts, last_ts, row_count, min_val, max_val) ordered by name
+        self.levels = levels
+        self.compact = compact  # samples in a compact layout, read via ingest_csv.samples_between
+        self.keys = np.array([r[0] for r in rows], dtype=np.int64)
+        self.names = [r[1] for r in rows]
+        self.groups = [r[2] for r in rows]
+        self.key_of = dict(zip(self.names, self.keys.tolist()))
+        self.name_of = dict(zip(self.keys.tolist(), self.names))
+        self._index = {k: i for i, k in enumerate(self.keys.tolist())}
+        # Sensors registered but not populated yet (live ingest) have NULL stats -> NaN
+        stats = np.array([r[3:] for r in rows], dtype=np.float64).reshape(len(rows), 5)
+        self.first_ts, self.last_ts, self.row_count, self.min_val, self.max_val = stats.T
+
+    def __len__(self):
+        return len(self.names)
+
+    def rows_of(self, sensor_keys=None):
+        """Row indexes of `sensor_keys` (all sensors for None/empty), in name order."""
+        if not sensor_keys:
+            return np.arange(len(self.names))
+        return np.sort([self._index[k] for k in sensor_keys if k in self._index])
+
+    def time_range(self, sensor_keys=None):
+        """(first_ts, last_ts) over the selected sensors, or None without data."""
+        rows = self.rows_of(sensor_keys)
+        first, last = self.first_ts[rows], self.last_ts[rows]
+        if not len(rows) or np.all(np.isnan(first)):
+            return None
+        return float(np.nanmin(first)), float(np.nanmax(last))
+
+    def extents(self, sensor_keys=None):
+        """Per-sensor stats of the selection: {name: {first_ts, last_ts, count, min, max}}."""
+        nan_to_none = lambda v: None if np.isnan(v) else float(v)
+        return {
+            self.names[i]: {"first_ts": nan_to_none(self.first_ts[i]), "last_ts": nan_to_none(self.last_ts[i]),
+                            "count": 0 if np.isnan(self.row_count[i]) else int(self.row_count[i]),
+                            "min": nan_to_none(self.min_val[i]), "max": nan_to_none(self.max_val[i])}
+            for i in self.rows_of(sensor_keys)
+        }
+
+
+class CatalogCache:
+    """Holds the current SensorCatalog until invalidate() is called.
+
+    Follows the generation scheme of TileCache: a load started before an invalidate()
+    is returned to its caller but not kept, so a write committing mid-load can't leave
+    a stale catalog behind.
+    """
+
+    def __init__(self, load):
+        self._load = load  # con -> SensorCatalog
+        self._lock = threading.Lock()
+        self._catalog = None
+        self.generation = 0
+
+        # Metrics
+        self.hits = 0
+        self.loads = 0
+
+    def get(self, con):
+        with self._lock:
+            catalog, generation = self._catalog, self.generation
+            if catalog is not None:
+                self.hits += 1
+                return catalog
+        catalog = self._load(con)
+        with self._lock:
+            self.loads += 1
+            if generation == self.generation:
+                self._catalog = catalog
+        return catalog
+
+    def invalidate(self):
+        with self._lock:
+            self._catalog = None
+            self.generation += 1
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "loads": self.loads, "cached": self._catalog is not None,
+                    "sensors": len(self._catalog) if self._catalog is not None else None}
@@ -0,0 +1,227 @@
+import hashlib
+import itertools
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+def sensor_name_for(filename):
+    """Sensor name for an uploaded file: its base name restricted to [A-Za-z0-9._-],
+    with a .csv suffix (sensor names are CSV file names, see ingest_csv.py)."""
+    base = re.sub(r"[^A-Za-z0-9._-]", "_", os.path.basename(filename or "").strip())
+    stem, suffix = (base[:-4], base[-4:]) if base.lower().endswith(".csv") else (base, ".csv")
+    stem = stem.lstrip(".")
+    if not stem:
+        raise ValueError("Upload needs a file name, e.g. ?name=sensor_01.csv")
+    return stem + suffix
+
+
+class MultipartFile:
+    """The `field` file part of a multipart/form-data body, parsed while the body streams in.
+
+    start() reads up to the part's headers and returns its file name; iterating then
+    yields the part's bytes chunk by chunk as they arrive, so a multipart upload is
+    written to disk once, like a raw one (request.form() spools the whole body first).
+    Parts before and after the file are skipped; the rest of the body is left unread.
+    """
+
+    def __init__(self, chunks, content_type, field="file"):
+        _, params = parse_options_header(content_type)
+        boundary = params.get(b"boundary")
+        if not boundary:
+            raise ValueError("Multipart upload without a boundary")
+        self.field = field.encode()
+        self.filename = None
+        self._chunks = chunks.__aiter__()
+        self._headers = {}
+        self._header_field = self._header_value = b""
+        self._in_file = self._file_done = False
+        self._data = []  # file bytes parsed from the last body chunk
+        self._parser = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    def _on_part_begin(self):
+        self._headers = {}
+
+    def _on_header_field(self, data, start, end):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if self.filename is None and options.get(b"name") == self.field and b"filename" in options:
+            self.filename = options[b"filename"].decode("utf-8", "replace")
+            self._in_file = True
+
+    def _on_part_data(self, data, start, end):
+        if self._in_file:
+            self._data.append(data[start:end])
+
+    def _on_part_end(self):
+        if self._in_file:
+            self._in_file, self._file_done = False, True
+
+    async def _feed(self):
+        """Parses the next body chunk; False once the body has ended."""
+        try:
+            chunk = await self._chunks.__anext__()
+        except StopAsyncIteration:
+            return False
+        self._parser.write(chunk)
+        return True
+
+    async def start(self):
+        while self.filename is None:
+            if not await self._feed():
+                raise ValueError(f"Multipart upload needs a '{self.field.decode()}' field")
+        return self.filename
+
+    async def __aiter__(self):
+        while True:
+            data, self._data = self._data, []
+            if data:
+                yield b"".join(data)
+            if self._file_done:
+                return
+            if not await self._feed():
+                raise ValueError("Multipart body ended inside the file")
+
+
+class UploadJob:
+    """One /api/ingest-csv upload, from the first body byte to the ingested sensor."""
+
+    def __init__(self, job_id, name, path, bytes_total):
+        self.id = job_id
+        self.name = name
+        self.path = path  # final place in the upload directory
+        self.part = os.path.join(os.path.dirname(path), f".{name}.upload-{job_id}.part")  # spooled body
+        self.stage = "receiving"
+        self.bytes_total = bytes_total
+        self.bytes_received = 0
+        self.rows = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.size = self.mtime = self.digest = None
+
+    def to_dict(self):
+        return {
+            "id": self.id, "sensor": self.name, "stage": self.stage,
+            "bytes_received": self.bytes_received, "bytes_total": self.bytes_total,
+            "rows": self.rows, "error": self.error, "created": self.created, "finished": self.finished,
+        }
+
+
+class UploadManager:
+    """Spools uploaded CSV files to disk and ingests them one at a time in the background.
+
+    receive() writes the body chunk by chunk to the job's part file and hashes it on the
+    way (the manifest's content hash), so memory use is one chunk whatever the file size.
+    A single worker thread then calls `ingest(job, on_stage)`, which moves the part file
+    to `job.path` once it has been ingested, and keeps the returned row count; a failed
+    upload leaves nothing behind in the upload directory. The last `max_jobs` jobs stay
+    queryable.
+    """
+
+    def __init__(self, ingest, upload_dir, max_jobs=100):
+        self._ingest = ingest
+        self.upload_dir = upload_dir
+        self.max_jobs = max_jobs
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="csv-upload")
+
+        # Metrics
+        self.bytes_received = 0
+        self.completed = 0
+        self.failed = 0
+
+    def create(self, name, bytes_total=None):
+        with self._lock:
+            job = UploadJob(next(self._ids), name, os.path.join(self.upload_dir, name), bytes_total)
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.max_jobs:
+                del self._jobs[next(iter(self._jobs))]
+            return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())[::-1]
+
+    async def receive(self, job, chunks, write):
+        """Writes the async iterable `chunks` to the job's part file. `write(f, chunk)` is an
+        awaitable doing the blocking write (e.g. run in a thread)."""
+        os.makedirs(self.upload_dir, exist_ok=True)
+        digest = hashlib.blake2b(digest_size=16)
+        try:
+            with open(job.part, "wb") as f:
+                async for chunk in chunks:
+                    if not chunk:
+                        continue
+                    digest.update(chunk)
+                    await write(f, chunk)
+                    job.bytes_received += len(chunk)
+                    self.bytes_received += len(chunk)
+        except BaseException as e:
+            self._fail(job, f"Upload interrupted: {e}" if str(e) else "Upload interrupted")
+            if os.path.exists(job.part):
+                os.remove(job.part)
+            raise
+        st = os.stat(job.part)
+        job.size, job.mtime, job.digest = st.st_size, st.st_mtime, digest.hexdigest()
+
+    def submit(self, job):
+        job.stage = "queued"
+        self._worker.submit(self._run, job)
+
+    def _run(self, job):
+        def on_stage(stage):
+            job.stage = stage
+        try:
+            job.rows = self._ingest(job, on_stage)
+        except Exception as e:
+            self._fail(job, str(e))
+            return
+        finally:
+            if os.path.exists(job.part):
+                os.remove(job.part)
+        job.stage = "done"
+        job.finished = time.time()
+        self.completed += 1
+
+    def _fail(self, job, error):
+        job.stage, job.error, job.finished = "failed", error, time.time()
+        self.failed += 1
+
+    def shutdown(self):
+        self._worker.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            active = sum(1 for job in self._jobs.values() if job.stage not in ("done", "failed"))
+        return {"active": active, "completed": self.completed, "failed": self.failed,
+                "bytes_received": self.bytes_received}
@@ -0,0 +1,94 @@
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import duckdb
+
+
+class PoolTimeout(Exception):
+    """No cursor became free within the pool's acquire timeout."""
+
+
+class DuckDBPool:
+    """One application-lifetime DuckDB connection with a bounded set of cursors.
+
+    Every cursor shares the parent connection's database instance (and therefore its
+    buffer cache), but is safe to use from its own thread. Requests borrow a cursor via
+    `with pool.cursor() as con:` and hand it back afterwards instead of reopening the file.
+    """
+
+    def __init__(self, path, size=8, threads=None, memory_limit=None, read_only=True, acquire_timeout=30.0):
+        self.path = path
+        self.size = size
+        self.threads = threads
+        self.memory_limit = memory_limit
+        self.read_only = read_only
+        self.acquire_timeout = acquire_timeout
+
+        self.con = None
+        self._free = queue.Queue()
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.in_use = 0
+        self.acquired = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def open(self):
+        config = {}
+        if self.threads:
+            config["threads"] = self.threads
+        if self.memory_limit:
+            config["memory_limit"] = self.memory_limit
+
+        self.con = duckdb.connect(self.path, read_only=self.read_only, config=config)
+        for _ in range(self.size):
+            self._free.put(self.con.cursor())
+        return self
+
+    def close(self):
+        while not self._free.empty():
+            self._free.get_nowait().close()
+        if self.con is not None:
+            self.con.close()
+            self.con = None
+
+    @contextmanager
+    def cursor(self):
+        waited = time.perf_counter()
+        try:
+            cur = self._free.get(timeout=self.acquire_timeout)
+        except queue.Empty:
+            with self._lock:
+                self.timeouts += 1
+            raise PoolTimeout(f"No DuckDB cursor free after {self.acquire_timeout}s ({self.size} in use)")
+        waited = time.perf_counter() - waited
+
+        with self._lock:
+            self.in_use += 1
+            self.acquired += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        try:
+            yield cur
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            self._free.put(cur)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.size,
+                "in_use": self.in_use,
+                "idle": self.size - self.in_use,
+                "acquired": self.acquired,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": round(1000 * self.wait_seconds / self.acquired, 3) if self.acquired else 0.0,
+                "max_wait_ms": round(1000 * self.max_wait_seconds, 3),
+                "threads": self.threads,
+                "memory_limit": self.memory_limit,
+            }
@@ -1,12 +1,13 @@
 import duckdb
 import os
 import time
-from datetime import datetime
+from datetime import datetime, timezone
 
 DB_PATH = "sensor_data.duckdb"
 
 def to_epoch(val):
-    if hasattr(val, 'timestamp'): return val.timestamp()
+    # Naive timestamps from DuckDB are UTC
+    if isinstance(val, datetime): return val.replace(tzinfo=timezone.utc).timestamp()
     if type(val) is int or type(val) is float: return val
     return float(val)
 
@@ -27,12 +28,12 @@ def debug_query():
 
         # 1. Range
         log("Fetching Range...")
-        # COMPARE: Raw datetime vs Epoch from DB
-        range_row = con.execute("SELECT min(time), max(time), min(epoch(time)), max(epoch(time)) FROM sensors").fetchone()
-        db_min, db_max, db_min_epoch, db_max_epoch = range_row
+        # ts is stored as epoch seconds; compare it with the timestamp DuckDB derives from it
+        range_row = con.execute("SELECT min(ts), max(ts), to_timestamp(min(ts))::TIMESTAMP FROM sensors").fetchone()
+        db_min_epoch, db_max_epoch, db_min = range_row
         
-        log(f"Raw DB Min: {db_min} ({type(db_min)})")
-        log(f"DB Min Epoch: {db_min_epoch}")
+        log(f"DB Min Epoch: {db_min_epoch} ({type(db_min_epoch)})")
+        log(f"DB Min Timestamp: {db_min}")
         
         py_epoch = to_epoch(db_min)
         log(f"Python Converted Epoch: {py_epoch}")
@@ -40,7 +41,6 @@ def debug_query():
         diff = db_min_epoch - py_epoch
         log(f"Difference (DB - Python): {diff} seconds")
 
-        # USE DB EPOCH for correctness
         start = db_min_epoch
         end = db_max_epoch
         
@@ -63,15 +63,15 @@ def debug_query():
         
         log(f"Query Params: f_start={f_start}, f_end={f_end}, f_bucket={f_bucket}")
         
-        where_clause = f"epoch(time) >= {f_start} AND epoch(time) <= {f_end}"
+        where_clause = f"ts >= {f_start} AND ts <= {f_end}"
         
         query = f"""
             SELECT 
-                CAST(FLOOR((epoch(time) - {f_start}) / {f_bucket}) AS INTEGER) as bucket_idx,
+                CAST(FLOOR((ts - {f_start}) / {f_bucket}) AS INTEGER) as bucket_idx,
                 avg(value) as avg_val,
                 count(*) as count,
-                min(epoch(time)) as min_t,
-                max(epoch(time)) as max_t
+                min(ts) as min_t,
+                max(ts) as max_t
             FROM sensors 
             WHERE {where_clause}
             GROUP BY bucket_idx
@@ -7,13 +7,13 @@ print(f"Connecting to {DB_PATH}...")
 con = duckdb.connect(DB_PATH, read_only=True)
 
 # 1. Get Limits
-times = con.execute("SELECT min(time), max(time) FROM sensors").fetchone()
+times = con.execute("SELECT min(ts), max(ts) FROM sensors").fetchone()
 db_min, db_max = times
 print(f"DB Range: {db_min} -> {db_max}")
 
-# 2. Simulate Params from Log
-start = db_min.timestamp()
-end = db_max.timestamp()
+# 2. Simulate Params from Log (ts is already epoch seconds)
+start = db_min
+end = db_max
 width = 1000
 duration = end - start
 bucket_size = duration / width
@@ -24,9 +24,9 @@ print(f"Params: start={start}, end={end}, bucket_size={bucket_size}")
 # Just check bucket IDs for first 10 rows
 test_query = f"""
     SELECT 
-        time,
-        epoch(time) as ep,
-        (FLOOR((epoch(time) - {start}) / {bucket_size}) * {bucket_size} + {start}) as bucket_start
+        ts,
+        sensor_key,
+        (FLOOR((ts - {start}) / {bucket_size}) * {bucket_size} + {start}) as bucket_start
     FROM sensors 
     LIMIT 10
 """
@@ -38,10 +38,10 @@ for r in res:
 # 4. Run the Full Aggregate Query
 agg_query = f"""
     SELECT 
-        (FLOOR((epoch(time) - {start}) / {bucket_size}) * {bucket_size} + {start}) as time_bucket,
+        (FLOOR((ts - {start}) / {bucket_size}) * {bucket_size} + {start}) as time_bucket,
         avg(value) as avg_val
     FROM sensors 
-    WHERE epoch(time) >= {start} AND epoch(time) <= {end}
+    WHERE ts >= {start} AND ts <= {end}
     GROUP BY time_bucket
     ORDER BY time_bucket ASC
 """
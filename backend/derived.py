@@ -0,0 +1,247 @@
+import ast
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from downsample import EXTREMA_FIELDS
+
+# Derived signals for /api/derived: expressions over sensors, evaluated with NumPy on a
+# uniform analysis grid (see main.derived_series), e.g.
+#
+#   s("signal_0001.csv") - s("signal_0002.csv")
+#   rolling_std(derivative(s("signal_0003.csv")), 30)
+#   band_power(s("signal_0004.csv"), 0.01, 0.05, 300)
+#
+# Only the nodes and functions below are accepted; anything else is an ExpressionError.
+MAX_EXPR_LENGTH = 500
+MAX_NODES = 200
+MAX_SENSORS = 32
+
+
+class ExpressionError(ValueError):
+    """The expression is malformed or uses something outside the whitelist (HTTP 400)."""
+
+
+def rolling_sums(x, n):
+    """Trailing n-sample sums of x, x**2 and the count of non-NaN samples."""
+    valid = ~np.isnan(x)
+    filled = np.where(valid, x, 0.0)
+    csum = np.concatenate([[0.0], np.cumsum(filled)])
+    csq = np.concatenate([[0.0], np.cumsum(filled * filled)])
+    ccount = np.concatenate([[0], np.cumsum(valid)])
+    hi = np.arange(1, len(x) + 1)
+    lo = np.maximum(hi - n, 0)
+    return csum[hi] - csum[lo], csq[hi] - csq[lo], ccount[hi] - ccount[lo]
+
+
+def rolling_mean(x, n):
+    total, _, count = rolling_sums(x, n)
+    return np.where(count > 0, total / np.maximum(count, 1), np.nan)
+
+
+def rolling_std(x, n):
+    total, squares, count = rolling_sums(x, n)
+    mean = total / np.maximum(count, 1)
+    var = np.maximum(squares / np.maximum(count, 1) - mean * mean, 0.0)
+    return np.where(count > 1, np.sqrt(var), np.nan)
+
+
+def band_power(x, lo_hz, hi_hz, n, step):
+    """Power of x between lo_hz and hi_hz over trailing n-sample windows.
+
+    Windows advance by n // 2 samples; each window is demeaned (gaps count as the mean),
+    Hann-weighted and FFT'd, and its band power is placed at the window's last sample.
+    Samples between window ends are linearly interpolated.
+    """
+    n = max(n, 4)
+    out = np.full(len(x), np.nan)
+    if len(x) < n:
+        return out
+    hop = max(n // 2, 1)
+    frames = sliding_window_view(x, n)[::hop]
+    present = ~np.all(np.isnan(frames), axis=1)
+    frames = np.nan_to_num(frames - np.nanmean(np.where(present[:, None], frames, 0.0), axis=1, keepdims=True))
+    window = np.hanning(n)
+    spectrum = np.abs(np.fft.rfft(frames * window, axis=1)) ** 2
+    freqs = np.fft.rfftfreq(n, step)
+    band = (freqs >= lo_hz) & (freqs <= hi_hz)
+    # One-sided spectrum, normalized so a full band returns the windowed variance
+    power = 2.0 * spectrum[:, band].sum(axis=1) / (n * (window ** 2).sum())
+    power[~present] = np.nan
+
+    ends = np.arange(len(frames)) * hop + n - 1
+    filled = ~np.isnan(power)
+    if filled.any():
+        span = slice(ends[filled][0], ends[filled][-1] + 1)
+        out[span] = np.interp(np.arange(len(x))[span], ends[filled], power[filled])
+    return out
+
+
+def integral(x, step, origin):
+    """Running integral of x from sample `origin` (the requested start) on, gaps as 0.
+    Samples before `origin` are lookback for other functions and stay NaN."""
+    out = np.full(len(x), np.nan)
+    out[origin:] = np.cumsum(np.nan_to_num(x[origin:])) * step
+    return out
+
+
+def seconds_to_samples(seconds, step):
+    return max(int(round(seconds / step)), 1)
+
+
+# name -> (argument count, indexes of arguments that must be constants, index of the
+# window argument in seconds or None, implementation). Implementations get the analysis
+# grid step, the grid index of the requested start and the evaluated arguments.
+FUNCTIONS = {
+    "abs": (1, (), None, lambda step, origin, x: np.abs(x)),
+    "sqrt": (1, (), None, lambda step, origin, x: np.sqrt(x)),
+    "log": (1, (), None, lambda step, origin, x: np.log(x)),
+    "exp": (1, (), None, lambda step, origin, x: np.exp(x)),
+    "min": (2, (), None, lambda step, origin, a, b: np.minimum(a, b)),
+    "max": (2, (), None, lambda step, origin, a, b: np.maximum(a, b)),
+    "clip": (3, (), None, lambda step, origin, x, lo, hi: np.clip(x, lo, hi)),
+    "rolling_mean": (2, (1,), 1, lambda step, origin, x, w: rolling_mean(x, seconds_to_samples(w, step))),
+    "rolling_std": (2, (1,), 1, lambda step, origin, x, w: rolling_std(x, seconds_to_samples(w, step))),
+    "derivative": (1, (), None, lambda step, origin, x: np.diff(x, prepend=np.nan) / step),  # per second
+    "integral": (1, (), None, lambda step, origin, x: integral(x, step, origin)),
+    "band_power": (4, (1, 2, 3), 3,
+                   lambda step, origin, x, lo, hi, w: band_power(x, lo, hi, seconds_to_samples(w, step), step)),
+}
+
+# Functions whose first argument is a time series (a constant is broadcast to one)
+SERIES_FUNCTIONS = {"rolling_mean", "rolling_std", "derivative", "integral", "band_power"}
+
+# Lookback in analysis grid steps rather than seconds: derivative differences each
+# sample with the one before it
+STEP_LOOKBACK = {"derivative": 1}
+
+BINARY_OPS = {ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply, ast.Div: np.divide, ast.Pow: np.power}
+UNARY_OPS = {ast.USub: np.negative, ast.UAdd: np.positive}
+
+
+class Expression:
+    """A parsed, validated derived-signal expression.
+
+    `sensors` are the sensor names it reads (via s("name")). `lookback` is the seconds
+    of data before the requested start its rolling windows need to be complete there,
+    and `lookback_steps` the analysis grid steps needed on top of that (derivative).
+    """
+
+    def __init__(self, text):
+        self.text = text.strip()
+        if not self.text:
+            raise ExpressionError("Empty expression")
+        if len(self.text) > MAX_EXPR_LENGTH:
+            raise ExpressionError(f"Expression longer than {MAX_EXPR_LENGTH} characters")
+        try:
+            self.tree = ast.parse(self.text, mode="eval").body
+        except SyntaxError as e:
+            raise ExpressionError(f"Invalid expression '{self.text}': {e.msg}")
+        if sum(1 for _ in ast.walk(self.tree)) > MAX_NODES:
+            raise ExpressionError(f"Expression has more than {MAX_NODES} nodes")
+        self.sensors = set()
+        self.lookback, self.lookback_steps = self._check(self.tree)
+        if len(self.sensors) > MAX_SENSORS:
+            raise ExpressionError(f"Expression reads more than {MAX_SENSORS} sensors")
+
+    def _check(self, node):
+        """Validates `node` and returns its lookback as (seconds, grid steps)."""
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+            return 0.0, 0
+        if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPS:
+            return widest(self._check(node.left), self._check(node.right))
+        if isinstance(node, ast.UnaryOp) and type(node.op) in UNARY_OPS:
+            return self._check(node.operand)
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+            name = node.func.id
+            if name == "s":
+                if len(node.args) != 1 or not isinstance(node.args[0], ast.Constant) or not isinstance(node.args[0].value, str):
+                    raise ExpressionError('s() takes one sensor name in quotes, e.g. s("signal_0001.csv")')
+                self.sensors.add(node.args[0].value)
+                return 0.0, 0
+            if name not in FUNCTIONS:
+                raise ExpressionError(f"Unknown function '{name}'. Use one of: s, {', '.join(FUNCTIONS)}")
+            n_args, constant_args, window_arg, _ = FUNCTIONS[name]
+            if len(node.args) != n_args:
+                raise ExpressionError(f"{name}() takes {n_args} argument(s)")
+            lookback, steps = widest(*(self._check(arg) for arg in node.args))
+            constants = {i: self._constant(node.args[i], name) for i in constant_args}
+            if window_arg is not None:
+                if not 0 < constants[window_arg] < np.inf:
+                    raise ExpressionError(f"{name}() window must be positive seconds")
+                lookback += constants[window_arg]
+            return lookback, steps + STEP_LOOKBACK.get(name, 0)
+        raise ExpressionError(f"Unsupported syntax in expression: '{ast.unparse(node)}'")
+
+    def _constant(self, node, name):
+        value = evaluate(node, {}, 1.0, 0)
+        if np.ndim(value) != 0:
+            raise ExpressionError(f"{name}() parameters must be numbers, not sensor data")
+        return float(value)
+
+    def evaluate(self, series, step, origin=0):
+        """Evaluates the expression over `series` ({sensor name: values on the analysis
+        grid}), whose sample `origin` is the requested start (the samples before it are
+        lookback). Returns an array like the series (a constant is broadcast)."""
+        with np.errstate(all="ignore"):
+            result = evaluate(self.tree, series, step, origin)
+        length = len(next(iter(series.values()))) if series else 1
+        result = np.broadcast_to(np.asarray(result, dtype=np.float64), (length,)).copy()
+        result[~np.isfinite(result)] = np.nan
+        return result
+
+
+def widest(*lookbacks):
+    """The (seconds, grid steps) lookback covering all of `lookbacks`."""
+    return max(seconds for seconds, _ in lookbacks), max(steps for _, steps in lookbacks)
+
+
+def evaluate(node, series, step, origin):
+    if isinstance(node, ast.Constant):
+        if not isinstance(node.value, (int, float)):
+            raise ExpressionError("Sensor names are only allowed inside s()")
+        return float(node.value)
+    if isinstance(node, ast.BinOp):
+        return BINARY_OPS[type(node.op)](evaluate(node.left, series, step, origin),
+                                         evaluate(node.right, series, step, origin))
+    if isinstance(node, ast.UnaryOp):
+        return UNARY_OPS[type(node.op)](evaluate(node.operand, series, step, origin))
+    name = node.func.id
+    if name == "s":
+        if node.args[0].value not in series:
+            raise ExpressionError("Function parameters must be numbers, not sensor data")
+        return series[node.args[0].value]
+    args = [evaluate(arg, series, step, origin) for arg in node.args]
+    if name in SERIES_FUNCTIONS:
+        length = len(next(iter(series.values()))) if series else 1
+        args[0] = np.broadcast_to(np.asarray(args[0], dtype=np.float64), (length,))
+    return FUNCTIONS[name][3](step, origin, *args)
+
+
+def bucket_reduce(times, values, per_bucket, agg):
+    """Reduces analysis-grid rows to output buckets of `per_bucket` samples.
+
+    `values` is (n_series, n_buckets * per_bucket) with NaN gaps, `times` the grid
+    times. Returns the per-field (n_series, n_buckets) grids downsample.finish_buckets
+    expects for `agg` (avg_val, or the EXTREMA_FIELDS), NaN for empty buckets.
+    """
+    n_series = values.shape[0]
+    v = values.reshape(n_series, -1, per_bucket)
+    valid = ~np.isnan(v)
+    count = valid.sum(axis=-1)
+    empty = count == 0
+    if agg == "avg":
+        return {"avg_val": np.where(empty, np.nan, np.nansum(v, axis=-1) / np.maximum(count, 1))}
+
+    t = np.broadcast_to(times.reshape(1, -1, per_bucket), v.shape)
+    pick = lambda idx, arr: np.take_along_axis(arr, idx[..., None], axis=-1)[..., 0]
+    i_min = np.argmin(np.where(valid, v, np.inf), axis=-1)
+    i_max = np.argmax(np.where(valid, v, -np.inf), axis=-1)
+    i_first = np.argmax(valid, axis=-1)
+    i_last = per_bucket - 1 - np.argmax(valid[..., ::-1], axis=-1)
+    cols = {
+        "min_val": pick(i_min, v), "max_val": pick(i_max, v),
+        "min_t": pick(i_min, t), "max_t": pick(i_max, t),
+        "first_val": pick(i_first, v), "last_val": pick(i_last, v),
+    }
+    return {f: np.where(empty, np.nan, cols[f]) for f in EXTREMA_FIELDS}
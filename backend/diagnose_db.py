@@ -8,12 +8,12 @@ try:
     con = duckdb.connect(DB_PATH, read_only=True)
     
     print("\n--- General Stats ---")
-    count = con.execute("SELECT count(*) FROM sensors").fetchone()[0]
-    print(f"Total Rows: {count}")
+    count, sensors = con.execute("SELECT count(*), count(DISTINCT sensor_key) FROM sensors").fetchone()
+    print(f"Total Rows: {count} ({sensors} sensors)")
     
     print("\n--- Time Range Stats ---")
     # stats
-    times = con.execute("SELECT min(time), max(time), min(epoch(time)), max(epoch(time)) FROM sensors").fetchone()
+    times = con.execute("SELECT to_timestamp(min(ts))::TIMESTAMP, to_timestamp(max(ts))::TIMESTAMP, min(ts), max(ts) FROM sensors").fetchone()
     min_time_s, max_time_s, min_epoch, max_epoch = times
     
     print(f"Min Time: {min_time_s} (Epoch: {min_epoch})")
@@ -38,7 +38,7 @@ try:
     # Check for Outliers
     print("\n--- Distribution Check ---")
     # Check counts by year
-    years = con.execute("SELECT year(time), count(*) FROM sensors GROUP BY year(time)").fetchall()
+    years = con.execute("SELECT year(to_timestamp(ts)) AS y, count(*) FROM sensors GROUP BY y ORDER BY y").fetchall()
     print("Rows per Year:")
     for y in years:
         print(f"  {y[0]}: {y[1]} rows")
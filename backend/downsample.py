@@ -0,0 +1,121 @@
+import numpy as np
+
+# Points emitted per output (pixel) bucket for every supported `agg=` mode.
+# avg    -> mean value
+# minmax -> min and max, in the order they occurred
+# m4     -> first, min, max, last (min/max in the order they occurred)
+# lttb   -> one representative point chosen by Largest-Triangle-Three-Buckets, at its own time
+AGG_SLOTS = {"avg": 1, "minmax": 2, "m4": 4, "lttb": 1}
+
+# Per-bucket columns every non-avg mode needs from SQL (see main.py).
+EXTREMA_FIELDS = ["min_val", "max_val", "min_t", "max_t", "first_val", "last_val"]
+
+# lttb points are drawn at their own timestamps, on a time axis merged across the
+# response's sensors (align_points). That axis can grow to sensors * buckets points,
+# so larger responses keep the points on the bucket grid.
+LTTB_EXACT_MAX_SENSORS = 16
+
+
+def agg_fields(agg):
+    """Per-bucket columns the SQL aggregation has to produce for `agg`."""
+    return ["avg_val"] if agg == "avg" else EXTREMA_FIELDS
+
+
+def finish_buckets(agg, cols, times):
+    """(times, matrix) output from the per-field bucket grids, with `times` the time
+    axis of the bucket grid layout (grid_points). lttb returns its own axis instead,
+    unless the response has more than LTTB_EXACT_MAX_SENSORS sensors."""
+    if agg == "lttb" and len(cols["min_t"]) <= LTTB_EXACT_MAX_SENSORS:
+        return align_points(*lttb_select(cols["min_t"], cols["min_val"], cols["max_t"], cols["max_val"]))
+    return times, grid_points(agg, cols)
+
+
+def grid_points(agg, cols):
+    """(n_sensors, n_buckets * slots) output matrix on the bucket grid, bucket i
+    occupying columns [i * slots, (i + 1) * slots)."""
+    if agg == "avg":
+        return cols["avg_val"]
+    if agg == "lttb":
+        return lttb_select(cols["min_t"], cols["min_val"], cols["max_t"], cols["max_val"])[1]
+    return expand_extrema(agg, cols)
+
+
+def expand_extrema(agg, cols):
+    """Turns per-bucket extrema into the point layout of `agg` (m4 or minmax).
+
+    `cols` maps each EXTREMA_FIELDS name to a (n_sensors, n_buckets) float array
+    with NaN for empty buckets. Returns a (n_sensors, n_buckets * slots) array,
+    bucket i occupying columns [i * slots, (i + 1) * slots).
+    """
+    # Keep min/max in chronological order so the drawn line follows the real signal.
+    min_first = cols["min_t"] <= cols["max_t"]
+    lo = np.where(min_first, cols["min_val"], cols["max_val"])
+    hi = np.where(min_first, cols["max_val"], cols["min_val"])
+
+    if agg == "minmax":
+        stacked = [lo, hi]
+    else:
+        stacked = [cols["first_val"], lo, hi, cols["last_val"]]
+
+    n_sensors, n_buckets = lo.shape
+    return np.stack(stacked, axis=-1).reshape(n_sensors, n_buckets * len(stacked))
+
+
+def lttb_select(min_t, min_v, max_t, max_v):
+    """MinMax-preselected LTTB, vectorized across sensors.
+
+    Every bucket offers two candidates (its min and its max point, already computed
+    in SQL); LTTB keeps the one forming the largest triangle with the previously
+    selected point and the mean of the next bucket's candidates. The loop runs over
+    buckets only, so the cost does not grow with the number of raw rows.
+    Returns the (n_sensors, n_buckets) times and values of the selected points.
+    """
+    n_sensors, n_buckets = min_v.shape
+    out_t = np.full((n_sensors, n_buckets), np.nan)
+    out = np.full((n_sensors, n_buckets), np.nan)
+    if n_buckets == 0:
+        return out_t, out
+
+    # Min and max are either both present or both missing, so no NaN-aware mean is needed.
+    next_t = (min_t + max_t) / 2
+    next_v = (min_v + max_v) / 2
+
+    prev_t = min_t[:, 0].copy()
+    prev_v = min_v[:, 0].copy()
+    out_t[:, 0] = prev_t
+    out[:, 0] = prev_v
+
+    for i in range(1, n_buckets):
+        if i + 1 < n_buckets:
+            nt = np.where(np.isnan(next_t[:, i + 1]), next_t[:, i], next_t[:, i + 1])
+            nv = np.where(np.isnan(next_v[:, i + 1]), next_v[:, i], next_v[:, i + 1])
+        else:
+            nt, nv = next_t[:, i], next_v[:, i]
+
+        area_min = np.abs((prev_t - nt) * (min_v[:, i] - prev_v) - (prev_t - min_t[:, i]) * (nv - prev_v))
+        area_max = np.abs((prev_t - nt) * (max_v[:, i] - prev_v) - (prev_t - max_t[:, i]) * (nv - prev_v))
+        # NaN previous point (leading gap) -> just take the min candidate.
+        take_max = area_max > area_min
+
+        sel_t = np.where(take_max, max_t[:, i], min_t[:, i])
+        sel_v = np.where(take_max, max_v[:, i], min_v[:, i])
+        out_t[:, i] = sel_t
+        out[:, i] = sel_v
+
+        # Empty buckets keep the last real point as the triangle anchor.
+        has_point = ~np.isnan(sel_v)
+        prev_t = np.where(has_point, sel_t, prev_t)
+        prev_v = np.where(has_point, sel_v, prev_v)
+
+    return out_t, out
+
+
+def align_points(point_t, values):
+    """Puts per-sensor points ((n_sensors, n) times and values, NaN where a sensor has
+    no point) on one sorted time axis. Returns (times, matrix), the matrix NaN wherever
+    a sensor has no point at that time."""
+    has_point = ~np.isnan(point_t) & ~np.isnan(values)
+    times, column = np.unique(point_t[has_point], return_inverse=True)
+    matrix = np.full((len(values), len(times)), np.nan)
+    matrix[np.nonzero(has_point)[0], column] = values[has_point]
+    return times, matrix
@@ -0,0 +1,106 @@
+import json
+import struct
+
+import numpy as np
+import orjson
+import pyarrow as pa
+
+# Media types for the binary /api/data formats (selected via ?format= or Accept)
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+F64_MEDIA_TYPE = "application/vnd.sensor.f64"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"  # streamed, one sensor per line (see main.stream_sensor_data)
+
+FORMATS = {"json": "application/json", "arrow": ARROW_MEDIA_TYPE, "f64": F64_MEDIA_TYPE, "ndjson": NDJSON_MEDIA_TYPE}
+
+F64_MAGIC = b"SF64"
+
+# /api/heatmap grid frame
+GRID_MEDIA_TYPE = "application/vnd.sensor.grid"
+GRID_MAGIC = b"SGRD"
+GRID_DTYPES = {"uint8": "u1", "float32": "<f4"}
+GRID_NO_DATA = 255  # uint8 cells without data; values are scaled to 0..254
+
+
+def negotiate_format(fmt, accept):
+    """Explicit ?format= wins, otherwise the first binary type found in Accept, otherwise JSON."""
+    if fmt:
+        return fmt
+    accept = accept or ""
+    if ARROW_MEDIA_TYPE in accept:
+        return "arrow"
+    if F64_MEDIA_TYPE in accept:
+        return "f64"
+    if NDJSON_MEDIA_TYPE in accept:
+        return "ndjson"
+    return "json"
+
+
+def encode_json(payload):
+    """orjson with NumPy support: arrays serialize from their buffers, NaN becomes null."""
+    return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+def encode_ndjson_line(payload):
+    """One NDJSON record (encode_json plus the newline)."""
+    return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_APPEND_NEWLINE)
+
+
+def encode_f64(times, ids, matrix, meta):
+    """Packs the aligned series as raw little-endian Float64 arrays.
+
+    Layout:
+        4 bytes   magic "SF64"
+        4 bytes   uint32 LE header length (includes padding)
+        N bytes   UTF-8 JSON header {"ids": [...], "points": n, ...meta}, space padded
+                  so the arrays start on an 8-byte boundary (zero-copy Float64Array views)
+        8*n bytes time axis
+        8*n bytes per series, in header "ids" order (NaN = no data)
+    """
+    header = json.dumps({"ids": list(ids), "points": len(times), **meta}).encode("utf-8")
+    header += b" " * (-(8 + len(header)) % 8)
+    return b"".join([
+        F64_MAGIC,
+        struct.pack("<I", len(header)),
+        header,
+        np.ascontiguousarray(times, dtype="<f8").tobytes(),
+        np.ascontiguousarray(matrix, dtype="<f8").tobytes(),
+    ])
+
+
+def encode_arrow(times, ids, matrix, meta):
+    """Arrow IPC stream: one 'time' column plus one float64 column per sensor id."""
+    columns = [pa.array(times, type=pa.float64())]
+    columns += [pa.array(matrix[i], type=pa.float64(), from_pandas=True) for i in range(len(ids))]
+    schema_meta = {k: str(v) for k, v in meta.items()}
+    table = pa.Table.from_arrays(columns, names=["time", *ids]).replace_schema_metadata(schema_meta)
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def encode_grid(grid, dtype, meta):
+    """Packs a (rows, cols) heatmap grid as one row-major uint8 or float32 buffer.
+
+    Layout (same header scheme as encode_f64):
+        4 bytes   magic "SGRD"
+        4 bytes   uint32 LE header length (includes padding)
+        N bytes   UTF-8 JSON header {"rows": r, "cols": c, "dtype": ..., ...meta}, space
+                  padded to an 8-byte boundary
+        r*c cells uint8 (0..254, GRID_NO_DATA = no data) or float32 LE (NaN = no data)
+
+    uint8 expects `grid` already normalized to [0, 1].
+    """
+    if dtype == "uint8":
+        cells = np.where(np.isnan(grid), GRID_NO_DATA, np.rint(np.clip(grid, 0.0, 1.0) * (GRID_NO_DATA - 1)))
+    else:
+        cells = grid
+    header = json.dumps({"rows": grid.shape[0], "cols": grid.shape[1], "dtype": dtype, **meta}).encode("utf-8")
+    header += b" " * (-(8 + len(header)) % 8)
+    return b"".join([
+        GRID_MAGIC,
+        struct.pack("<I", len(header)),
+        header,
+        np.ascontiguousarray(cells, dtype=GRID_DTYPES[dtype]).tobytes(),
+    ])
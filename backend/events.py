@@ -0,0 +1,156 @@
+import numpy as np
+import pyarrow as pa
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Event index (sensor_events, /api/anomalies): vectorized detectors run once per sensor
+# at ingest. Every event gets a robust z-score-like `score`, so one threshold and one
+# top-N ranking work across kinds:
+#
+#   spike  isolated outliers: deviation from a short rolling median, in robust noise std devs
+#   step   level shifts: gap between line fits just before/after, in standard errors
+#   burst  windows of raised activity: rolling mean |deviation| from a slow baseline, in MADs
+EVENT_KINDS = ("spike", "step", "burst")
+MIN_SAMPLES = 64          # shorter series are not indexed
+
+SPIKE_WINDOW = 9          # samples in the rolling median spikes are measured against
+SPIKE_SCORE = 8.0
+STEP_WINDOW = 20          # samples fitted on each side of a candidate step
+STEP_SCORE = 8.0
+BURST_BASELINE = 128      # samples per block of the slow baseline (block medians, interpolated)
+BURST_BASELINE_BLOCKS = 5 # blocks in the rolling median over them
+BURST_WINDOW = 32         # samples in the rolling activity mean
+BURST_SCORE = 6.0
+BURST_MIN_SAMPLES = 16    # shortest run of raised activity reported as a burst
+
+EVENT_SCHEMA = pa.schema([
+    ("sensor_name", pa.string()),
+    ("kind", pa.string()),
+    ("start_ts", pa.float64()),
+    ("end_ts", pa.float64()),
+    ("peak_ts", pa.float64()),
+    ("magnitude", pa.float64()),
+    ("score", pa.float64()),
+])
+
+
+def robust_sigma(x):
+    """Standard deviation estimate from the median absolute deviation (outlier-proof)."""
+    mad = np.median(np.abs(x - np.median(x)))
+    return 1.4826 * mad if mad > 0 else np.std(x) or 1.0
+
+
+def centered(x, window, reduce):
+    """reduce() over a centered sliding window. The ends are padded with x mirrored
+    through its end points, so a trend carries on into the padding."""
+    half = window // 2
+    padded = np.pad(x, (half, window - 1 - half), mode="reflect", reflect_type="odd")
+    return reduce(sliding_window_view(padded, window), axis=1)
+
+
+def runs(mask):
+    """(start, end) index pairs (end exclusive) of the True runs in `mask`."""
+    edges = np.diff(np.concatenate([[0], mask.astype(np.int8), [0]]))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def detect_spikes(t, v):
+    residual = v - centered(v, SPIKE_WINDOW, np.median)
+    # Noise level from second differences: a steep trend makes the median filter track
+    # the samples exactly, which would shrink a MAD of the residual itself
+    z = np.abs(residual) / (robust_sigma(np.diff(v, 2)) / np.sqrt(6))
+    # A spike spanning a few samples is one event, peaking at its largest deviation
+    events = []
+    for lo, hi in zip(*runs(z >= SPIKE_SCORE)):
+        peak = lo + np.argmax(z[lo:hi])
+        events.append(("spike", t[lo], t[hi - 1], t[peak], residual[peak], z[peak]))
+    return events
+
+
+def detect_steps(t, v):
+    w = STEP_WINDOW
+    if len(v) < 2 * w + 1:
+        return []
+    # Least-squares line through every w-sample window (per window, centered for precision)
+    windows = sliding_window_view(v, w)
+    k = np.arange(w) - (w - 1) / 2
+    mean = windows.mean(axis=1)
+    slope = (windows - mean[:, None]) @ k / (k @ k)
+    rss = np.maximum(((windows - mean[:, None]) ** 2).sum(axis=1) - slope ** 2 * (k @ k), 0.0)
+
+    # A step between samples i - 1 and i: the lines of the windows before and after it,
+    # both extrapolated to the boundary, disagree. Trends and smooth oscillations are
+    # followed by both lines, so only abrupt changes score high.
+    i = np.arange(w, len(v) - w + 1)
+    before, after = i - w, i
+    delta = (mean[after] - slope[after] * w / 2) - (mean[before] + slope[before] * w / 2)
+    sigma = np.sqrt((rss[before] + rss[after]) / (2 * w - 4))
+    se = sigma * np.sqrt(2 * (1 / w + (w / 2) ** 2 / (k @ k)))
+    # Wandering signals (random walks) have residuals far larger than their sample-to-sample
+    # noise; deflate their scores by that ratio so drift isn't reported as steps
+    white = robust_sigma(np.diff(v)) / np.sqrt(2)
+    drift = np.sqrt(max(np.median(rss) / (w - 2) / white ** 2, 1.0))
+    score = np.abs(delta) / np.maximum(se * drift, 1e-12)
+
+    # Keep the local maxima within +-w only
+    padded = np.concatenate([np.zeros(w), score, np.zeros(w)])
+    is_peak = (score >= STEP_SCORE) & (score == sliding_window_view(padded, 2 * w + 1).max(axis=1))
+    return [("step", t[at - 1], t[at], t[at], delta[j], score[j])
+            for j, at in zip(np.flatnonzero(is_peak), i[is_peak])]
+
+
+def detect_bursts(t, v):
+    n_blocks = len(v) // BURST_BASELINE
+    if n_blocks < BURST_BASELINE_BLOCKS:
+        return []
+    # Slow baseline from block medians: a cubic through them takes out the overall trend,
+    # and a rolling median over the block medians of what is left follows slower wander
+    # without being pulled up by a burst covering a block or two
+    centers = (np.arange(n_blocks) + 0.5) * BURST_BASELINE - 0.5
+    block_median = lambda x: np.median(x[:n_blocks * BURST_BASELINE].reshape(n_blocks, BURST_BASELINE), axis=1)
+    idx = np.arange(len(v))
+    x = (idx - len(v) / 2) / len(v)  # well-conditioned fit
+    trend = np.polyval(np.polyfit((centers - len(v) / 2) / len(v), block_median(v), 3), x)
+    residual = v - trend
+    residual -= np.interp(idx, centers, centered(block_median(residual), BURST_BASELINE_BLOCKS, np.median))
+    activity = centered(np.abs(residual), BURST_WINDOW, np.mean)
+    z = (activity - np.median(activity)) / robust_sigma(activity)
+
+    events = []
+    for lo, hi in zip(*runs(z >= BURST_SCORE)):
+        if hi - lo < BURST_MIN_SAMPLES:
+            continue
+        peak = lo + np.argmax(np.abs(residual[lo:hi]))
+        events.append(("burst", t[lo], t[hi - 1], t[peak], residual[peak], z[lo:hi].max()))
+    return events
+
+
+def detect_events(t, v):
+    """Events of one sensor's time-sorted series as (kind, start_ts, end_ts, peak_ts,
+    magnitude, score) tuples. Gaps (NaN) are dropped first."""
+    keep = ~np.isnan(v)
+    t, v = t[keep], v[keep]
+    if len(v) < MIN_SAMPLES:
+        return []
+    steps = detect_steps(t, v)
+    # Level shifts would show up as bursts until the baseline catches up; take them out first
+    levels = np.zeros(len(v))
+    for _, _, end_ts, _, delta, _ in steps:
+        levels[np.searchsorted(t, end_ts):] += delta
+    return detect_spikes(t, v) + steps + detect_bursts(t, v - levels)
+
+
+def events_table(series):
+    """Arrow table (EVENT_SCHEMA) of the events of every (sensor_name, times, values) in `series`."""
+    rows = [(name, *event) for name, t, v in series for event in detect_events(t, v)]
+    columns = list(zip(*rows)) if rows else [[] for _ in EVENT_SCHEMA]
+    return pa.table([pa.array(col, type=field.type) for col, field in zip(columns, EVENT_SCHEMA)],
+                    schema=EVENT_SCHEMA)
+
+
+def split_series(names, times, values):
+    """(sensor_name, times, values) per sensor from columns sorted by name, then time."""
+    if not len(names):
+        return
+    bounds = np.concatenate([[0], np.flatnonzero(names[1:] != names[:-1]) + 1, [len(names)]])
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        yield names[lo], times[lo:hi], values[lo:hi]
@@ -1,89 +1,233 @@
-# This script generates 5,000 CSV files, each with 20,000 simulated signal values.
-import numpy as np
-import pandas as pd
+# Generates simulated sensor signals for testing and capacity runs.
+#
+#   python generate_signals.py                                   # 2000 x 10k rows as CSV in data/ (20M rows)
+#   python generate_signals.py --sensors 5000 --samples 20000 --format parquet
+#   python generate_signals.py --sensors 10000 --samples 10000 --format duckdb   # 100M rows, no CSV step
+#
+# Signals are generated with NumPy a batch at a time (one 2-D array per signal family)
+# and batches are spread over a process pool.
+import argparse
 import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from events import events_table
+
+FORMATS = ("csv", "parquet", "duckdb")
+DEFAULT_OUTPUT = {"csv": "data", "parquet": "signals_parquet", "duckdb": "sensor_data.duckdb"}
+NUM_FAMILIES = 6      # signal patterns, assigned round-robin by sensor index
+BATCH_SIZE = 50       # signals per worker task
+ANOMALY_CHANCE = 0.1  # share of signals that get a few isolated outliers
+
+
+def signal_name(i):
+    return f"signal_{i + 1:04d}.csv"  # same names as the CSV files, so ingest_csv.py sees the same sensors
+
+
+def sample_times(rng, n, num_samples, duration, irregular):
+    """(n, num_samples) sample times in [0, duration].
 
-output_dir = 'data'
-os.makedirs(output_dir, exist_ok=True)
+    irregular=0 gives an even grid. Higher values mix in exponentially distributed
+    intervals, so some stretches are dense and others sparse (event-driven loggers).
+    """
+    if irregular <= 0:
+        return np.broadcast_to(np.linspace(0.0, duration, num_samples), (n, num_samples))
+    steps = (1.0 - irregular) + irregular * rng.exponential(1.0, (n, num_samples))
+    t = np.cumsum(steps, axis=1)
+    t -= t[:, :1]
+    return t / t[:, -1:] * duration
 
-num_signals = 2000 # Full Scale: 2000 files
-num_samples = 10000 # 10k points each
-# Total = 20 Million Rows
 
-# Time range: 0 to 60 minutes (3600 seconds)
-time_range = 3600
+def generate_family(rng, family, t):
+    """Signals of one family for every row of `t` (n, num_samples)."""
+    n, num_samples = t.shape
+    col = lambda values: values[:, None]  # per-signal parameter -> broadcast over samples
 
-for i in range(num_signals):
-    # Create time array from 0 to 3600 seconds (60 minutes)
-    t = np.linspace(0, time_range, num_samples)
-    
-    # Generate varied signal types with different characteristics
-    signal_type = i % 6  # 6 different signal patterns
-    
-    if signal_type == 0:
+    if family == 0:
         # Slow trend with random walk
-        trend = np.linspace(0, np.random.uniform(-2, 2), num_samples)
-        noise = np.cumsum(np.random.normal(0, 0.05, num_samples))
-        signal = trend + noise
-        
-    elif signal_type == 1:
+        trend = np.linspace(0, 1, num_samples) * col(rng.uniform(-2, 2, n))
+        return trend + np.cumsum(rng.normal(0, 0.05, (n, num_samples)), axis=1)
+
+    if family == 1:
         # Multiple frequency components (realistic oscillation)
-        freq1 = np.random.uniform(0.001, 0.005)
-        freq2 = np.random.uniform(0.01, 0.02)
-        signal = (np.sin(2 * np.pi * freq1 * t) * np.random.uniform(1, 3) +
-                 np.sin(2 * np.pi * freq2 * t) * np.random.uniform(0.3, 1) +
-                 np.random.normal(0, 0.1, num_samples))
-        
-    elif signal_type == 2:
-        # Step changes with noise (sensor switching states)
-        signal = np.zeros(num_samples)
-        num_steps = np.random.randint(3, 8)
-        step_positions = sorted(np.random.choice(num_samples, num_steps, replace=False))
-        current_value = np.random.uniform(-1, 1)
-        prev_pos = 0
-        for pos in step_positions:
-            signal[prev_pos:pos] = current_value
-            current_value += np.random.uniform(-1, 1)
-            prev_pos = pos
-        signal[prev_pos:] = current_value
-        signal += np.random.normal(0, 0.05, num_samples)
-        
-    elif signal_type == 3:
+        freq1, freq2 = col(rng.uniform(0.001, 0.005, n)), col(rng.uniform(0.01, 0.02, n))
+        return (np.sin(2 * np.pi * freq1 * t) * col(rng.uniform(1, 3, n)) +
+                np.sin(2 * np.pi * freq2 * t) * col(rng.uniform(0.3, 1, n)) +
+                rng.normal(0, 0.1, (n, num_samples)))
+
+    if family == 2:
+        # Step changes with noise (sensor switching states): 3-7 jumps at random positions
+        jumps = np.zeros((n, num_samples))
+        positions = rng.integers(1, num_samples, (n, 7))
+        sizes = rng.uniform(-1, 1, (n, 7)) * (np.arange(7) < col(rng.integers(3, 8, n)))
+        np.add.at(jumps, (np.repeat(np.arange(n), 7), positions.ravel()), sizes.ravel())
+        jumps[:, 0] = rng.uniform(-1, 1, n)
+        return np.cumsum(jumps, axis=1) + rng.normal(0, 0.05, (n, num_samples))
+
+    if family == 3:
         # Exponential decay/growth with periodic component
-        decay_rate = np.random.uniform(-0.001, 0.001)
-        base = np.random.uniform(0.5, 2)
-        signal = base * np.exp(decay_rate * t) + np.sin(2 * np.pi * np.random.uniform(0.002, 0.01) * t) * 0.5
-        signal += np.random.normal(0, 0.1, num_samples)
-        
-    elif signal_type == 4:
-        # Burst/spike pattern
-        signal = np.random.normal(0, 0.1, num_samples)
-        num_bursts = np.random.randint(5, 15)
-        for _ in range(num_bursts):
-            burst_center = np.random.randint(0, num_samples)
-            burst_width = np.random.randint(50, 200)
-            burst_amplitude = np.random.uniform(1, 3)
-            start = max(0, burst_center - burst_width)
-            end = min(num_samples, burst_center + burst_width)
-            signal[start:end] += burst_amplitude * np.exp(-((np.arange(start, end) - burst_center)**2) / (2 * (burst_width/3)**2))
-    
-    else:
-        # Smooth polynomial trend with noise
-        coeffs = np.random.uniform(-0.00001, 0.00001, 4)
-        signal = (coeffs[0] * t**3 + coeffs[1] * t**2 + coeffs[2] * t + coeffs[3] * 10)
-        signal += np.random.normal(0, 0.2, num_samples)
-    
+        decay, base = col(rng.uniform(-0.001, 0.001, n)), col(rng.uniform(0.5, 2, n))
+        freq = col(rng.uniform(0.002, 0.01, n))
+        return (base * np.exp(decay * t) + np.sin(2 * np.pi * freq * t) * 0.5 +
+                rng.normal(0, 0.1, (n, num_samples)))
+
+    if family == 4:
+        # Burst/spike pattern: 5-14 Gaussian bursts, 50-200 samples wide
+        signal = rng.normal(0, 0.1, (n, num_samples))
+        idx = np.arange(num_samples)
+        count = rng.integers(5, 15, n)
+        for k in range(14):
+            center, width = col(rng.integers(0, num_samples, n)), col(rng.integers(50, 200, n))
+            amplitude = col(rng.uniform(1, 3, n) * (k < count))
+            burst = amplitude * np.exp(-((idx - center) ** 2) / (2 * (width / 3) ** 2))
+            signal += np.where(np.abs(idx - center) < width, burst, 0.0)
+        return signal
+
+    # Smooth polynomial trend with noise
+    coeffs = rng.uniform(-0.00001, 0.00001, (4, n, 1))
+    return (coeffs[0] * t ** 3 + coeffs[1] * t ** 2 + coeffs[2] * t + coeffs[3] * 10 +
+            rng.normal(0, 0.2, (n, num_samples)))
+
+
+def generate_batch(first, count, num_samples, duration, seed, irregular=0.0):
+    """Times and values (count, num_samples) for signals first..first+count-1.
+
+    Deterministic for a given seed and batch layout.
+    """
+    rng = np.random.default_rng([seed, first])
+    t = sample_times(rng, count, num_samples, duration, irregular)
+    values = np.empty((count, num_samples))
+    families = np.arange(first, first + count) % NUM_FAMILIES
+    for family in range(NUM_FAMILIES):
+        rows = np.flatnonzero(families == family)
+        if len(rows):
+            values[rows] = generate_family(rng, family, t[rows])
+
     # Add occasional anomalies to some signals
-    if np.random.random() < 0.1:  # 10% chance
-        num_anomalies = np.random.randint(1, 5)
-        for _ in range(num_anomalies):
-            anomaly_pos = np.random.randint(0, num_samples)
-            signal[anomaly_pos] += np.random.uniform(-5, 5)
-    
-    df = pd.DataFrame({'time': t, 'value': signal})
-    df.to_csv(os.path.join(output_dir, f'signal_{i+1:04d}.csv'), index=False)
-    
-    if (i + 1) % 500 == 0:
-        print(f'Generated {i + 1}/{num_signals} signals...')
-
-print('✅ All CSV files generated successfully!')
+    hit = np.flatnonzero(rng.random(count) < ANOMALY_CHANCE)
+    for row in hit:
+        positions = rng.integers(0, num_samples, rng.integers(1, 5))
+        values[row, positions] += rng.uniform(-5, 5, len(positions))
+    return t, values
+
+
+def write_batch(fmt, output, first, count, num_samples, duration, seed, irregular):
+    """Worker task: generates one batch and writes it. Returns the number of rows."""
+    t, values = generate_batch(first, count, num_samples, duration, seed, irregular)
+    if fmt == "csv":
+        options = pa_csv.WriteOptions(include_header=False)
+        for row in range(count):
+            with open(os.path.join(output, signal_name(first + row)), "wb") as f:
+                f.write(b"time,value\n")
+                pa_csv.write_csv(pa.table({"time": t[row], "value": values[row]}), f, options)
+    else:
+        # Long format, one file per batch: time (relative seconds), sensor, value.
+        # Hive-style directories keep batches separate, so readers can prune by sensor range.
+        names = pa.DictionaryArray.from_arrays(np.repeat(np.arange(count, dtype=np.int32), num_samples),
+                                               [signal_name(first + row) for row in range(count)])
+        table = pa.table({"time": np.ascontiguousarray(t).ravel(), "sensor": names, "value": values.ravel()})
+        part = os.path.join(output, f"sensor_bucket={first // BATCH_SIZE:05d}")
+        os.makedirs(part, exist_ok=True)
+        pq.write_table(table, os.path.join(part, f"part-{first:06d}.parquet"), row_group_size=1_000_000)
+        if fmt == "duckdb":
+            # The event index ingest_csv.py would build, in relative time like the rows
+            series = ((signal_name(first + row), t[row], values[row]) for row in range(count))
+            pq.write_table(events_table(series), os.path.join(output, "events", f"part-{first:06d}.parquet"))
+    return count * num_samples
+
+
+def load_duckdb(db_path, staging):
+    """Loads staged Parquet batches into a database laid out like ingest_csv.py builds it
+    (catalog keys, sensor-clustered rows, rollups), anchored at the current time."""
+    import duckdb
+    from ingest_csv import (DB_SENSOR_COL, DB_TIME_COL, DB_VALUE_COL, ROLLUP_LEVELS, SCHEMA_VERSION, build_rollups,
+                            build_sketches, create_schema, drop_samples, refresh_catalog, register_sensors,
+                            rollup_table)
+
+    con = duckdb.connect(db_path)
+    try:
+        for level in ROLLUP_LEVELS:
+            con.execute(f"DROP TABLE IF EXISTS {rollup_table(level)}")
+        drop_samples(con)
+        for table in ("sensor_catalog", "ingest_manifest", "ingest_meta", "sensor_events", "sensor_sketch"):
+            con.execute(f"DROP TABLE IF EXISTS {table}")
+        create_schema(con)
+        time_anchor = time.time()
+        con.execute("INSERT INTO ingest_meta VALUES ('time_anchor', ?), ('schema_version', ?)",
+                    [repr(time_anchor), str(SCHEMA_VERSION)])
+
+        source = f"read_parquet('{staging}/sensor_bucket=*/*.parquet')"
+        register_sensors(con, f"SELECT DISTINCT sensor AS name FROM {source}")
+        con.execute(f"""
+            INSERT INTO sensors
+            SELECT {time_anchor!r} + s.time AS {DB_TIME_COL}, c.sensor_key AS {DB_SENSOR_COL}, s.value AS {DB_VALUE_COL}
+            FROM {source} s JOIN sensor_catalog c ON c.name = s.sensor
+            ORDER BY {DB_SENSOR_COL}, {DB_TIME_COL}
+        """)
+        con.execute(f"""
+            INSERT INTO sensor_events
+            SELECT c.sensor_key, e.kind, {time_anchor!r} + e.start_ts, {time_anchor!r} + e.end_ts,
+                   {time_anchor!r} + e.peak_ts, e.magnitude, e.score
+            FROM read_parquet('{staging}/events/*.parquet') e JOIN sensor_catalog c ON c.name = e.sensor_name
+            ORDER BY c.sensor_key, e.start_ts
+        """)
+        build_rollups(con)
+        refresh_catalog(con)
+        build_sketches(con)
+    finally:
+        con.close()
+
+
+def generate(num_signals, num_samples, duration=3600.0, seed=0, fmt="csv", output=None, workers=None,
+             irregular=0.0):
+    """Generates num_signals x num_samples rows into `output` and returns the row count."""
+    output = output or DEFAULT_OUTPUT[fmt]
+    target = output
+    if fmt == "duckdb":
+        output = f"{output}.staging"  # Parquet batches, loaded in one pass at the end
+    if fmt != "csv":
+        shutil.rmtree(output, ignore_errors=True)
+    os.makedirs(os.path.join(output, "events") if fmt == "duckdb" else output, exist_ok=True)
+
+    batches = [(first, min(BATCH_SIZE, num_signals - first)) for first in range(0, num_signals, BATCH_SIZE)]
+    rows = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(write_batch, fmt, output, first, count, num_samples, duration, seed, irregular)
+                   for first, count in batches]
+        for done, future in enumerate(as_completed(futures), 1):
+            rows += future.result()
+            if done % 10 == 0 or done == len(futures):
+                print(f"Generated {min(done * BATCH_SIZE, num_signals)}/{num_signals} signals...")
+
+    if fmt == "duckdb":
+        print(f"Loading into {target}...")
+        load_duckdb(target, output)
+        shutil.rmtree(output, ignore_errors=True)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate simulated sensor signals.")
+    parser.add_argument("--sensors", type=int, default=2000, help="Number of signals (default: 2000)")
+    parser.add_argument("--samples", type=int, default=10000, help="Samples per signal (default: 10000)")
+    parser.add_argument("--duration", type=float, default=3600.0, help="Seconds covered by each signal (default: 3600)")
+    parser.add_argument("--irregular", type=float, default=0.0, help="0 = even sampling, 1 = fully random intervals")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--format", choices=FORMATS, default="csv",
+                        help="csv: one file per signal for ingest_csv.py; parquet: long-format files "
+                             "partitioned by sensor_bucket=; duckdb: a ready-to-serve database")
+    parser.add_argument("--output", help=f"Output path (default: {', '.join(f'{k}={v}' for k, v in DEFAULT_OUTPUT.items())})")
+    parser.add_argument("--workers", type=int, default=None, help="Generator processes (default: CPU count)")
+    args = parser.parse_args()
+
+    started = time.time()
+    rows = generate(args.sensors, args.samples, args.duration, args.seed, args.format, args.output, args.workers,
+                    args.irregular)
+    elapsed = time.time() - started
+    print(f"Done: {rows:,} rows in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s).")
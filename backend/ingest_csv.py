@@ -1,11 +1,34 @@
+import argparse
 import duckdb
 import glob
+import hashlib
+import math
 import os
+import shutil
+import threading
 import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from events import events_table, split_series
+from parquet_store import SENSOR_BUCKET_SIZE, ParquetStore, sql_list
 
 DB_PATH = "sensor_data.duckdb"
+STORE_DIR = "sensor_store"      # partitioned Parquet files for STORAGE_MODE=parquet
 DATA_DIR = "data"
 CSV_PATTERN = f"{DATA_DIR}/*.csv"
+STAGING_DIR = "ingest_staging"  # Parquet files written by the parser processes
+EVENTS_DIR = os.path.join(STAGING_DIR, "events")  # their per-batch event index rows (events.py)
+BATCH_SIZE = 64                 # CSV files per parser batch
+
+# Where ingested data lives (main.py reads the same setting):
+#   duckdb  - everything in DB_PATH, rewritten in place; the API can't be running meanwhile
+#   parquet - date=/sensor_bucket= partitioned files under STORE_DIR, published as versioned
+#             snapshots, so ingest can run while the API keeps serving (see parquet_store.py)
+STORAGE_MODE = os.environ.get("STORAGE_MODE", "duckdb")
 
 # --- CONFIGURATION (Match this to your CSV file headers!) ---
 # Input Component (What are the headers in your CSV files?)
@@ -14,77 +37,862 @@ CSV_VALUE_HEADER = "value" # e.g., 'value', 'voltage', 'data'
 HAS_HEADER = True          # Set to False if files have no header row
 
 # Output Component (Schema in DuckDB) - Do not change these unless you update main.py
-DB_TIME_COL = "time"
+DB_TIME_COL = "ts"         # DOUBLE, Unix epoch seconds (plain numeric so zone maps can prune)
 DB_VALUE_COL = "value"
-DB_SENSOR_COL = "sensor_id" 
+DB_SENSOR_COL = "sensor_key" # INTEGER, see sensor_catalog for the name
 # ------------------------------------------------------------
 
-def ingest_data():
-    print(f"Initializing DuckDB at {DB_PATH}...")
-    con = duckdb.connect(DB_PATH)
+# Sensor group shown in the UI, derived from the sensor name (signal_0001.csv -> signal)
+SENSOR_GROUP_EXPR = r"regexp_replace(name, '[_-]?[0-9]*\.csv$', '')"
+
+# Bump when the table layout changes; an incremental run against an older layout rebuilds fully.
+SCHEMA_VERSION = 6
+
+# Rollup pyramid (LOD levels) - bucket width in seconds, finest first.
+# Each bucket keeps min/max/sum/count plus the extrema main.py needs for agg=m4/minmax/lttb.
+# main.py picks the coarsest level whose buckets fit whole into the output buckets; powers
+# of two, so every bucket of the tile grid (tile_cache.grid_bucket_size) from 8 s up can
+# read a level coarser than 1 s.
+ROLLUP_LEVELS = [1, 8, 64, 512]
+
+# Segments per sensor in sensor_sketch (PAA over the sensor's time range, see build_sketches)
+SKETCH_SEGMENTS = 256
+
+# Sample storage (duckdb mode; --encoding/--blocks or VALUE_ENCODING/REGULAR_BLOCKS).
+# "double" without blocks is the plain `sensors` table. Any other layout keeps the
+# samples in the tables below, behind a `sensors` view that decodes them, so readers
+# don't change (see create_sample_tables):
+#   value encodings  double (8 bytes), float (4, ~7 significant digits),
+#                    int32 / int16 (4 / 2, scaled to each sensor's min..max: value = offset + scale * q)
+#   blocks           evenly sampled sensors stored as (start_ts, interval, BLOCK_SAMPLES values)
+#                    rows, dropping the timestamp column; a sensor counts as evenly sampled
+#                    when every sample is within REGULAR_JITTER intervals of the even grid
+VALUE_ENCODINGS = {"double": "DOUBLE", "float": "FLOAT", "int32": "INTEGER", "int16": "SMALLINT"}
+VALUE_ENCODING = os.environ.get("VALUE_ENCODING")  # None = keep the database's current layout
+REGULAR_BLOCKS = {"1": True, "0": False}.get(os.environ.get("REGULAR_BLOCKS", ""))
+BLOCK_SAMPLES = 4096
+REGULAR_JITTER = 1e-3
+RAW_ROW_BYTES = 20  # ts DOUBLE + sensor_key INTEGER + value DOUBLE, uncompressed
+
+def rollup_table(level):
+    return f"sensors_rollup_{level}s"
+
+def build_rollups(con, sensor_keys=None, since=None, verbose=True):
+    """Builds one pre-aggregated table per ROLLUP_LEVELS entry.
+
+    The finest level is aggregated from the raw rows, every coarser level from the
+    level below it, so each pass only reads the (much smaller) previous table.
+    With sensor_keys, only those sensors' rollup rows are replaced (incremental ingest).
+    With since (epoch seconds) as well, only their buckets from the one containing
+    `since` onwards are replaced (live appends).
+    """
+    if sensor_keys is not None:
+        con.execute("CREATE OR REPLACE TEMP TABLE rollup_sensors AS SELECT unnest(?::INTEGER[]) AS sensor_key", [list(sensor_keys)])
+        sensor_where = f"WHERE {DB_SENSOR_COL} IN (SELECT sensor_key FROM rollup_sensors)"
+    else:
+        sensor_where = ""
+
+    # Appends only need the samples since `since`; compact layouts can skip the rest
+    raw = "sensors" if since is None else samples_between(
+        has_table(con, "sensor_rows"), math.floor(since / ROLLUP_LEVELS[0]) * ROLLUP_LEVELS[0], math.inf)
+    prev_table = None
+    for level in ROLLUP_LEVELS:
+        table = rollup_table(level)
+        # Levels are multiples of each other, so buckets before this one are still valid
+        since_floor = None if since is None else math.floor(since / level) * level
+        def newer(time_col):
+            return "" if since_floor is None else f" AND {time_col} >= {since_floor!r}"
+        if prev_table is None:
+            source = f"""
+                SELECT
+                    FLOOR({DB_TIME_COL} / {level}) * {level} AS bucket,
+                    {DB_SENSOR_COL},
+                    min({DB_VALUE_COL}) AS min_val,
+                    max({DB_VALUE_COL}) AS max_val,
+                    sum({DB_VALUE_COL}) AS sum_val,
+                    count({DB_VALUE_COL}) AS cnt,
+                    min({DB_TIME_COL}) AS t_min,
+                    max({DB_TIME_COL}) AS t_max,
+                    arg_min({DB_TIME_COL}, {DB_VALUE_COL}) AS min_t,
+                    arg_max({DB_TIME_COL}, {DB_VALUE_COL}) AS max_t,
+                    arg_min({DB_VALUE_COL}, {DB_TIME_COL}) AS first_val,
+                    arg_max({DB_VALUE_COL}, {DB_TIME_COL}) AS last_val
+                FROM {raw}
+                {sensor_where}{newer(DB_TIME_COL)}
+                GROUP BY bucket, {DB_SENSOR_COL}
+            """
+        else:
+            source = f"""
+                SELECT
+                    FLOOR(bucket / {level}) * {level} AS bucket,
+                    {DB_SENSOR_COL},
+                    min(min_val) AS min_val,
+                    max(max_val) AS max_val,
+                    sum(sum_val) AS sum_val,
+                    sum(cnt) AS cnt,
+                    min(t_min) AS t_min,
+                    max(t_max) AS t_max,
+                    arg_min(min_t, min_val) AS min_t,
+                    arg_max(max_t, max_val) AS max_t,
+                    arg_min(first_val, t_min) AS first_val,
+                    arg_max(last_val, t_max) AS last_val
+                FROM {prev_table}
+                {sensor_where}{newer("bucket")}
+                GROUP BY 1, {DB_SENSOR_COL}
+            """
+
+        rows = f"""
+            SELECT *, sum_val / cnt AS avg_val
+            FROM ({source})
+            ORDER BY {DB_SENSOR_COL}, bucket
+        """
+        if sensor_keys is None:
+            if verbose:
+                print(f"Building rollup {table}...")
+            con.execute(f"DROP TABLE IF EXISTS {table}")
+            con.execute(f"CREATE TABLE {table} AS {rows}")
+        else:
+            if verbose:
+                print(f"Updating rollup {table} for {len(sensor_keys)} sensors...")
+            con.execute(f"DELETE FROM {table} {sensor_where}{newer('bucket')}")
+            con.execute(f"INSERT INTO {table} {rows}")
+        prev_table = table
+
+def register_sensors(con, names_query):
+    """Adds a sensor_catalog row for every name from `names_query` (a query with a
+    `name` column) that has no key yet.
+
+    New sensors get the next free keys; known sensors keep theirs, so cached tiles
+    and the rollups of untouched sensors stay valid.
+    """
+    con.execute(f"""
+        INSERT INTO sensor_catalog (sensor_key, name, sensor_group)
+        SELECT (SELECT coalesce(max(sensor_key), 0) FROM sensor_catalog) + row_number() OVER (ORDER BY name),
+               name, {SENSOR_GROUP_EXPR}
+        FROM ({names_query})
+        WHERE name NOT IN (SELECT name FROM sensor_catalog)
+    """)
+
+# Serializes sensor key allocation between writers sharing one database (live flushes,
+# uploads): register_sensors takes max(sensor_key) + 1 from its transaction's snapshot
+CATALOG_LOCK = threading.Lock()
+
+def rollback(con):
+    """ROLLBACK that tolerates a transaction a failed COMMIT already ended."""
+    try:
+        con.execute("ROLLBACK")
+    except duckdb.TransactionException:
+        pass
+
+def register_sensor_keys(con, names_query):
+    """register_sensors in a short transaction of its own, under CATALOG_LOCK, for
+    writers whose long transaction runs next to others'. The keys are committed before
+    the caller's transaction starts, so two writers never both commit the same key."""
+    with CATALOG_LOCK:
+        con.execute("BEGIN TRANSACTION")
+        try:
+            register_sensors(con, names_query)
+            con.execute("COMMIT")
+        except Exception:
+            rollback(con)
+            raise
+
+def refresh_catalog(con, sensor_keys=None):
+    """Recomputes the per-sensor stats in sensor_catalog from the coarsest rollup.
+
+    The coarsest rollup keeps exact first/last times, counts and extrema, so this reads
+    a few rows per sensor instead of the raw table. With sensor_keys, only those rows.
+    """
+    key_where = f"WHERE {DB_SENSOR_COL} IN (SELECT sensor_key FROM rollup_sensors)" if sensor_keys is not None else ""
+    con.execute(f"""
+        UPDATE sensor_catalog SET
+            first_ts = s.first_ts, last_ts = s.last_ts, row_count = s.row_count,
+            min_val = s.min_val, max_val = s.max_val
+        FROM (
+            SELECT {DB_SENSOR_COL} AS sensor_key, min(t_min) AS first_ts, max(t_max) AS last_ts,
+                   sum(cnt) AS row_count, min(min_val) AS min_val, max(max_val) AS max_val
+            FROM {rollup_table(ROLLUP_LEVELS[-1])}
+            {key_where}
+            GROUP BY 1
+        ) s
+        WHERE sensor_catalog.sensor_key = s.sensor_key
+    """)
+
+def build_sketches(con, sensor_keys=None):
+    """Recomputes sensor_sketch, the shape signatures /api/similar ranks sensors by.
+
+    Per sensor: SKETCH_SEGMENTS segment means (PAA) over its own time range, NaN for
+    empty segments, plus mean/std/min/max/slope of the raw values. Covers every sensor
+    in the `sensors` table, or only `sensor_keys`; their previous rows are replaced.
+    Run after refresh_catalog, whose first_ts/last_ts define the segments.
+    """
+    if sensor_keys is not None:
+        con.execute("CREATE OR REPLACE TEMP TABLE sketch_sensors AS SELECT unnest(?::INTEGER[]) AS sensor_key",
+                    [list(sensor_keys)])
+        key_where = f"WHERE s.{DB_SENSOR_COL} IN (SELECT sensor_key FROM sketch_sensors)"
+    else:
+        key_where = ""
+    stats = con.execute(f"""
+        SELECT s.{DB_SENSOR_COL} AS sensor_key, any_value(c.first_ts) AS start_ts, any_value(c.last_ts) AS end_ts,
+               avg(s.{DB_VALUE_COL}) AS mean, coalesce(stddev_pop(s.{DB_VALUE_COL}), 0) AS std,
+               min(s.{DB_VALUE_COL}) AS min_val, max(s.{DB_VALUE_COL}) AS max_val,
+               coalesce(regr_slope(s.{DB_VALUE_COL}, s.{DB_TIME_COL}), 0) AS slope
+        FROM sensors s JOIN sensor_catalog c ON c.sensor_key = s.{DB_SENSOR_COL}
+        {key_where}
+        GROUP BY 1 ORDER BY 1
+    """).fetchnumpy()
+    segments = con.execute(f"""
+        SELECT s.{DB_SENSOR_COL} AS sensor_key,
+               least(floor((s.{DB_TIME_COL} - c.first_ts) / greatest(c.last_ts - c.first_ts, 1e-9)
+                           * {SKETCH_SEGMENTS}), {SKETCH_SEGMENTS - 1})::INTEGER AS segment,
+               avg(s.{DB_VALUE_COL}) AS value
+        FROM sensors s JOIN sensor_catalog c ON c.sensor_key = s.{DB_SENSOR_COL}
+        {key_where}
+        GROUP BY 1, 2
+    """).fetchnumpy()
+
+    keys = stats["sensor_key"].astype(np.int64)
+    sketch = np.full((len(keys), SKETCH_SEGMENTS), np.nan)
+    sketch[np.searchsorted(keys, segments["sensor_key"]), segments["segment"]] = segments["value"]
+    table = pa.table({
+        **{name: pa.array(np.asarray(col)) for name, col in stats.items()},
+        "sketch": pa.ListArray.from_arrays(np.arange(len(keys) + 1, dtype=np.int32) * SKETCH_SEGMENTS,
+                                           pa.array(sketch.ravel())),
+    })
+    replaced = "sketch_sensors" if sensor_keys is not None else "sketch_batch"
+    con.register("sketch_batch", table)
+    try:
+        con.execute(f"DELETE FROM sensor_sketch WHERE sensor_key IN (SELECT sensor_key FROM {replaced})")
+        con.execute("INSERT INTO sensor_sketch SELECT * FROM sketch_batch")
+    finally:
+        con.unregister("sketch_batch")
+
+def has_table(con, name):
+    return con.execute("SELECT count(*) FROM duckdb_tables() WHERE table_name = ?", [name]).fetchone()[0] > 0
+
+def file_hash(path):
+    """Content hash used by the manifest to tell a touched file from a changed one."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def stage_batch(batch_no, paths, time_anchor):
+    """Process-pool worker: parses one batch of CSV files into a staging Parquet file.
+
+    Each worker uses its own single-threaded in-memory DuckDB, so batches parse in
+    parallel without touching the main database (which only the parent process writes).
+    The batch's anomaly events are detected here too, while its series are at hand, and
+    written to EVENTS_DIR. Returns (parquet_path, {sensor_name: row_count}).
+    """
+    out = os.path.join(STAGING_DIR, f"batch_{batch_no:05d}.parquet")
+    file_list = ", ".join(f"'{p}'" for p in paths)
+    con = duckdb.connect(config={"threads": 1})
+    try:
+        # Map your CSV headers to our standardized DB columns.
+        # The sensor name comes from the filename (e.g. data/sensor_01.csv -> sensor_01.csv);
+        # the writer maps it to an integer sensor_key via sensor_catalog.
+        con.execute(f"""
+            COPY (
+                SELECT 
+                    {time_anchor} + "{CSV_TIME_HEADER}" as {DB_TIME_COL}, 
+                    regexp_replace(filename, '.*[\\\\/]', '') as sensor_name, 
+                    "{CSV_VALUE_HEADER}" as {DB_VALUE_COL}
+                FROM read_csv([{file_list}], filename=True, header={HAS_HEADER}, union_by_name=True, auto_detect=True)
+            ) TO '{out}' (FORMAT PARQUET)
+        """)
+        counts = dict(con.execute(f"SELECT sensor_name, count(*) FROM read_parquet('{out}') GROUP BY 1").fetchall())
+        batch = con.execute(f"""
+            SELECT sensor_name, {DB_TIME_COL}::DOUBLE, {DB_VALUE_COL}::DOUBLE
+            FROM read_parquet('{out}') ORDER BY 1, 2
+        """).to_arrow_table()
+        names, times, values = (col.to_numpy(zero_copy_only=False) for col in batch.columns)
+        pq.write_table(events_table(split_series(names, times, values)),
+                       os.path.join(EVENTS_DIR, f"batch_{batch_no:05d}.parquet"))
+    finally:
+        con.close()
+    return out, counts
+
+def plan_ingest(con, files):
+    """Compares the CSV files on disk against the manifest.
+
+    Returns (to_ingest, removed): files that are new or whose content changed, and
+    manifest paths that no longer exist. Files with unchanged size and mtime are skipped
+    without reading them; otherwise the content hash decides.
+    """
+    manifest = {r[0]: r[1:] for r in con.execute("SELECT path, size, mtime, content_hash FROM ingest_manifest").fetchall()}
+    to_ingest = []
+    for path in files:
+        st = os.stat(path)
+        known = manifest.get(path)
+        if known and known[0] == st.st_size and known[1] == st.st_mtime:
+            continue
+        digest = file_hash(path)
+        if known and known[2] == digest:
+            # Touched but identical - just remember the new mtime
+            con.execute("UPDATE ingest_manifest SET mtime = ? WHERE path = ?", [st.st_mtime, path])
+            continue
+        to_ingest.append((path, st.st_size, st.st_mtime, digest))
+    removed = sorted(set(manifest) - set(files))
+    return to_ingest, removed
+
+def create_schema(con):
+    # We store everything in ONE efficient table, with a compact integer 'sensor_key' column to distinguish them.
+    # (Compact layouts have a `sensors` view instead, see create_sample_tables.)
+    if not has_table(con, "sensor_rows"):
+        con.execute(f"""
+            CREATE TABLE IF NOT EXISTS sensors (
+                {DB_TIME_COL} DOUBLE, 
+                {DB_SENSOR_COL} INTEGER, 
+                {DB_VALUE_COL} DOUBLE
+            )
+        """)
+    # One row per sensor: the key -> name dictionary plus stats, so listing sensors and
+    # finding their time range never scans the fact table
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS sensor_catalog (
+            sensor_key INTEGER PRIMARY KEY,
+            name VARCHAR,
+            sensor_group VARCHAR,
+            unit VARCHAR,
+            first_ts DOUBLE,
+            last_ts DOUBLE,
+            row_count BIGINT,
+            min_val DOUBLE,
+            max_val DOUBLE
+        )
+    """)
+    # One row per ingested CSV file, so re-runs only pick up new or changed files
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_manifest (
+            path VARCHAR PRIMARY KEY,
+            sensor_id VARCHAR,
+            size BIGINT,
+            mtime DOUBLE,
+            content_hash VARCHAR,
+            row_count BIGINT,
+            ingested_at TIMESTAMP
+        )
+    """)
+    con.execute("CREATE TABLE IF NOT EXISTS ingest_meta (key VARCHAR PRIMARY KEY, value VARCHAR)")
+    # Anomaly/event index (events.py), detected per sensor at ingest and served by /api/anomalies
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS sensor_events (
+            sensor_key INTEGER,
+            kind VARCHAR,       -- spike | step | burst
+            start_ts DOUBLE,
+            end_ts DOUBLE,
+            peak_ts DOUBLE,
+            magnitude DOUBLE,   -- signed deviation (spike, burst) or level change (step)
+            score DOUBLE        -- robust z-score, comparable across kinds
+        )
+    """)
+    # Shape signature per sensor for /api/similar (build_sketches)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS sensor_sketch (
+            sensor_key INTEGER,
+            start_ts DOUBLE,    -- time range the segments divide evenly
+            end_ts DOUBLE,
+            mean DOUBLE,
+            std DOUBLE,
+            min_val DOUBLE,
+            max_val DOUBLE,
+            slope DOUBLE,       -- least-squares trend, value units per second
+            sketch DOUBLE[]     -- {SKETCH_SEGMENTS} segment means
+        )
+    """)
+
+def sample_layout(con):
+    """(value encoding, blocks) the samples are stored with; ("double", False) for the
+    plain `sensors` table or an empty database."""
+    if not has_table(con, "ingest_meta"):
+        return "double", False
+    meta = dict(con.execute(
+        "SELECT key, value FROM ingest_meta WHERE key IN ('value_encoding', 'regular_blocks')").fetchall())
+    return meta.get("value_encoding", "double"), meta.get("regular_blocks") == "1"
+
+def is_compact(layout):
+    return layout != ("double", False)
+
+def samples_between(compact, lo, hi):
+    """FROM item for the raw samples in [lo, hi]. Compact layouts read them through the
+    sensors_between macro, which also skips blocks outside the range and slices the
+    rest; the plain table is filtered by the caller's ts predicate as before."""
+    return f"sensors_between('{float(lo)!r}'::DOUBLE, '{float(hi)!r}'::DOUBLE)" if compact else "sensors"
+
+def create_sample_tables(con, layout):
+    """Creates the sample storage for `layout` (see VALUE_ENCODINGS) and records it in
+    ingest_meta. Expects no sample tables yet, or ones of the same layout."""
+    encoding, blocks = layout
+    if is_compact(layout):
+        create_compact_tables(con, encoding)
+    create_schema(con)
+    con.execute("INSERT OR REPLACE INTO ingest_meta VALUES ('value_encoding', ?), ('regular_blocks', ?)",
+                [encoding, "1" if blocks else "0"])
+
+def create_compact_tables(con, encoding):
+    value_type = VALUE_ENCODINGS[encoding]
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS sensor_rows (
+            {DB_TIME_COL} DOUBLE, {DB_SENSOR_COL} INTEGER, {DB_VALUE_COL} {value_type}
+        )
+    """)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS sensor_blocks (
+            {DB_SENSOR_COL} INTEGER,
+            start_ts DOUBLE,        -- time of vals[1]; vals[i] is at start_ts + (i - 1) * interval
+            end_ts DOUBLE,
+            interval DOUBLE,
+            value_offset DOUBLE,
+            value_scale DOUBLE,
+            vals {value_type}[]
+        )
+    """)
+    # Live appends aren't known to be regular or in range of a scale; they stay plain
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS sensor_live (
+            {DB_TIME_COL} DOUBLE, {DB_SENSOR_COL} INTEGER, {DB_VALUE_COL} DOUBLE
+        )
+    """)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS sensor_scale (
+            {DB_SENSOR_COL} INTEGER, value_offset DOUBLE, value_scale DOUBLE
+        )
+    """)
+    if encoding in ("int32", "int16"):
+        rows_value, rows_join = "sc.value_offset + sc.value_scale * r.value", f"JOIN sensor_scale sc USING ({DB_SENSOR_COL})"
+    else:
+        rows_value, rows_join = "r.value::DOUBLE", ""
+    # Blocks are pruned by their own time range, then only the samples in [lo, hi] (plus
+    # one either side against rounding) are unnested
+    con.execute(f"""
+        CREATE OR REPLACE MACRO sensors_between(lo, hi) AS TABLE
+            SELECT r.{DB_TIME_COL}, r.{DB_SENSOR_COL}, {rows_value} AS {DB_VALUE_COL}
+            FROM sensor_rows r {rows_join}
+            WHERE r.{DB_TIME_COL} >= lo AND r.{DB_TIME_COL} <= hi
+            UNION ALL
+            SELECT * FROM (
+                SELECT start_ts + interval * unnest(range(i_lo, i_hi + 1)) AS {DB_TIME_COL}, {DB_SENSOR_COL},
+                       value_offset + value_scale * unnest(list_slice(vals, i_lo + 1, i_hi + 1)) AS {DB_VALUE_COL}
+                FROM (
+                    SELECT *, greatest(floor((lo - start_ts) / interval) - 1, 0)::BIGINT AS i_lo,
+                              least(ceil((hi - start_ts) / interval) + 1, len(vals) - 1)::BIGINT AS i_hi
+                    FROM sensor_blocks WHERE end_ts >= lo AND start_ts <= hi
+                )
+            ) WHERE {DB_TIME_COL} >= lo AND {DB_TIME_COL} <= hi
+            UNION ALL
+            SELECT * FROM sensor_live WHERE {DB_TIME_COL} >= lo AND {DB_TIME_COL} <= hi
+    """)
+    con.execute("CREATE OR REPLACE VIEW sensors AS SELECT * FROM sensors_between('-infinity', 'infinity')")
+
+def drop_samples(con):
+    """Drops the sample storage of any layout."""
+    # DROP VIEW IF EXISTS fails on a table of that name (and vice versa), so look first
+    if con.execute("SELECT count(*) FROM duckdb_views() WHERE view_name = 'sensors'").fetchone()[0]:
+        con.execute("DROP VIEW sensors")
+    con.execute("DROP MACRO TABLE IF EXISTS sensors_between")
+    for table in ("sensors", "sensor_rows", "sensor_blocks", "sensor_live", "sensor_scale"):
+        con.execute(f"DROP TABLE IF EXISTS {table}")
+
+def delete_samples(con, keys_query):
+    """Deletes the samples of the sensors whose keys `keys_query` selects."""
+    tables = ("sensor_rows", "sensor_blocks", "sensor_live", "sensor_scale") if has_table(con, "sensor_rows") \
+        else ("sensors",)
+    for table in tables:
+        con.execute(f"DELETE FROM {table} WHERE {DB_SENSOR_COL} IN ({keys_query})")
+
+def append_table(con):
+    """Table that appended samples (live ingest) go to."""
+    return "sensor_live" if has_table(con, "sensor_live") else "sensors"
 
-    files = glob.glob(CSV_PATTERN)
+def write_samples(con, rows_query, layout):
+    """Stores the samples of `rows_query` (ts, sensor_key, value columns) in `layout`,
+    for sensors that have no samples stored (delete_samples first).
+
+    Both layouts are clustered by sensor, time-sorted within each sensor. Compact ones
+    get each sensor's scale from its min/max and, with blocks, each sensor's grid from
+    its first/last sample and count.
+    """
+    if not is_compact(layout):
+        con.execute(f"INSERT INTO sensors SELECT * FROM ({rows_query}) ORDER BY {DB_SENSOR_COL}, {DB_TIME_COL}")
+        return
+    encoding, blocks = layout
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE new_samples AS
+        SELECT {DB_TIME_COL}, {DB_SENSOR_COL}, {DB_VALUE_COL},
+               row_number() OVER (PARTITION BY {DB_SENSOR_COL} ORDER BY {DB_TIME_COL}) - 1 AS i
+        FROM ({rows_query})
+    """)
+    if encoding in ("int32", "int16"):
+        q_max = 2 ** (int(encoding[3:]) - 1) - 1
+        scale = f"""coalesce((max_val + min_val) / 2, 0) AS value_offset,
+                    coalesce(nullif(max_val - min_val, 0) / {2 * q_max}, 1) AS value_scale"""
+        encode = f"""CASE WHEN NOT isnan(s.{DB_VALUE_COL})
+                     THEN round((s.{DB_VALUE_COL} - l.value_offset) / l.value_scale)::{VALUE_ENCODINGS[encoding]} END"""
+    else:
+        scale = "0.0 AS value_offset, 1.0 AS value_scale"
+        encode = f"s.{DB_VALUE_COL}::{VALUE_ENCODINGS[encoding]}"
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE new_layout AS
+        WITH stats AS (
+            SELECT {DB_SENSOR_COL}, count(*) AS n, min({DB_TIME_COL}) AS first_ts, max({DB_TIME_COL}) AS last_ts,
+                   min({DB_VALUE_COL}) FILTER (WHERE NOT isnan({DB_VALUE_COL})) AS min_val,
+                   max({DB_VALUE_COL}) FILTER (WHERE NOT isnan({DB_VALUE_COL})) AS max_val
+            FROM new_samples GROUP BY 1
+        )
+        SELECT {DB_SENSOR_COL}, first_ts, (last_ts - first_ts) / greatest(n - 1, 1) AS interval, {scale}
+        FROM stats
+    """)
+    regular = "FALSE"
+    if blocks:
+        con.execute(f"""
+            CREATE OR REPLACE TEMP TABLE regular_sensors AS
+            SELECT s.{DB_SENSOR_COL} FROM new_samples s JOIN new_layout l USING ({DB_SENSOR_COL})
+            WHERE l.interval > 0
+            GROUP BY s.{DB_SENSOR_COL}, l.first_ts, l.interval
+            HAVING max(abs(s.{DB_TIME_COL} - (l.first_ts + s.i * l.interval))) <= {REGULAR_JITTER} * l.interval
+        """)
+        regular = f"l.{DB_SENSOR_COL} IN (SELECT {DB_SENSOR_COL} FROM regular_sensors)"
+    con.execute(f"""
+        INSERT INTO sensor_scale SELECT {DB_SENSOR_COL}, value_offset, value_scale FROM new_layout
+    """)
+    con.execute(f"""
+        INSERT INTO sensor_rows
+        SELECT s.{DB_TIME_COL}, s.{DB_SENSOR_COL}, {encode}
+        FROM new_samples s JOIN new_layout l USING ({DB_SENSOR_COL})
+        WHERE NOT ({regular})
+        ORDER BY s.{DB_SENSOR_COL}, s.{DB_TIME_COL}
+    """)
+    if blocks:
+        con.execute(f"""
+            INSERT INTO sensor_blocks
+            SELECT s.{DB_SENSOR_COL}, l.first_ts + s.i // {BLOCK_SAMPLES} * {BLOCK_SAMPLES} * l.interval AS start_ts,
+                   l.first_ts + max(s.i) * l.interval AS end_ts, l.interval, l.value_offset, l.value_scale,
+                   list({encode} ORDER BY s.i) AS vals
+            FROM new_samples s JOIN new_layout l USING ({DB_SENSOR_COL})
+            WHERE {regular}
+            GROUP BY s.{DB_SENSOR_COL}, s.i // {BLOCK_SAMPLES}, l.first_ts, l.interval, l.value_offset, l.value_scale
+            ORDER BY 1, 2
+        """)
+    con.execute("DROP TABLE new_samples")
+
+def sample_storage(con):
+    """(stored bytes, samples) of the sample tables: their distinct storage blocks times the
+    block size, so it is only meaningful after a CHECKPOINT and at block granularity."""
+    tables = [t for t in ("sensors", "sensor_rows", "sensor_blocks", "sensor_live") if has_table(con, t)]
+    if not tables:
+        return 0, 0
+    block_size = con.execute("SELECT block_size FROM pragma_database_size()").fetchone()[0]
+    blocks = sum(con.execute(f"""
+        SELECT count(DISTINCT block_id) FROM pragma_storage_info('{table}') WHERE persistent AND block_id >= 0
+    """).fetchone()[0] for table in tables)
+    samples = con.execute("SELECT coalesce(sum(row_count), 0) FROM sensor_catalog").fetchone()[0] \
+        if has_table(con, "sensor_catalog") else 0
+    return blocks * block_size, samples
+
+def storage_summary(stored, samples):
+    if not samples:
+        return "no samples"
+    return f"{stored / samples:.2f} bytes/row ({stored / 2 ** 20:.1f} MiB for {samples} rows)"
+
+def ingest_file(con, path, name, size, mtime, digest, source=None, on_stage=None):
+    """Loads one CSV file as sensor `name` through `con`, a read-write connection that
+    may already be serving queries (/api/ingest-csv in duckdb mode).
+
+    Does what an incremental run does for one changed file, in one transaction: the
+    sensor's rows, rollups, catalog stats and events are replaced and the file is
+    recorded in the manifest as `path`, so a later ingest_csv.py run skips it. `source`
+    is the file to read if it isn't at `path` yet. read_csv streams the file; events are
+    detected on the sensor's whole series, as in a batch ingest. The sensor's key is
+    committed before that transaction starts (see register_sensor_keys).
+    on_stage(stage) is called as the steps begin.
+    Returns (sensor_key, row_count).
+    """
+    on_stage = on_stage or (lambda stage: None)
+    create_schema(con)
+    known = con.execute("SELECT count(*) FROM sensor_catalog WHERE name = ?", [name]).fetchone()[0] > 0
+    quoted = name.replace("'", "''")
+    register_sensor_keys(con, f"SELECT '{quoted}' AS name")
+    key = con.execute("SELECT sensor_key FROM sensor_catalog WHERE name = ?", [name]).fetchone()[0]
+
+    con.execute("BEGIN TRANSACTION")
+    try:
+        anchor_row = con.execute("SELECT value FROM ingest_meta WHERE key = 'time_anchor'").fetchone()
+        if anchor_row is None:
+            con.execute("INSERT OR REPLACE INTO ingest_meta VALUES ('time_anchor', ?)", [repr(time.time())])
+            con.execute("INSERT OR REPLACE INTO ingest_meta VALUES ('schema_version', ?)", [str(SCHEMA_VERSION)])
+            anchor_row = con.execute("SELECT value FROM ingest_meta WHERE key = 'time_anchor'").fetchone()
+        time_anchor = float(anchor_row[0])
+
+        on_stage("loading")
+        delete_samples(con, str(key))
+        write_samples(con, f"""
+            SELECT {time_anchor!r} + "{CSV_TIME_HEADER}" AS {DB_TIME_COL}, {key} AS {DB_SENSOR_COL},
+                   "{CSV_VALUE_HEADER}" AS {DB_VALUE_COL}
+            FROM read_csv('{source or path}', header={HAS_HEADER}, auto_detect=True)
+        """, sample_layout(con))
+        rows = con.execute(f"SELECT count(*) FROM sensors WHERE {DB_SENSOR_COL} = ?", [key]).fetchone()[0]
+
+        on_stage("rollups")
+        if all(has_table(con, rollup_table(level)) for level in ROLLUP_LEVELS):
+            build_rollups(con, [key], verbose=False)
+            refresh_catalog(con, [key])
+        else:
+            build_rollups(con, verbose=False)
+            refresh_catalog(con)
+        build_sketches(con, [key])
+
+        on_stage("events")
+        con.execute("DELETE FROM sensor_events WHERE sensor_key = ?", [key])
+        # One pass over the whole series, like stage_batch: the detectors' windows and
+        # baselines must not restart partway through
+        series = con.execute(f"""
+            SELECT {DB_TIME_COL}::DOUBLE, {DB_VALUE_COL}::DOUBLE FROM sensors WHERE {DB_SENSOR_COL} = {key} ORDER BY 1
+        """).to_arrow_table()
+        times, values = (col.to_numpy() for col in series.columns)
+        con.register("upload_events", events_table([(name, times, values)]))
+        con.execute(f"""
+            INSERT INTO sensor_events
+            SELECT {key}, kind, start_ts, end_ts, peak_ts, magnitude, score FROM upload_events
+        """)
+        con.unregister("upload_events")
+
+        con.execute("INSERT OR REPLACE INTO ingest_manifest VALUES (?, ?, ?, ?, ?, ?, current_timestamp)",
+                    [path, name, size, mtime, digest, rows])
+        con.execute("COMMIT")
+    except Exception:
+        rollback(con)
+        if not known:
+            # Retire the key again unless live samples for the same name landed meanwhile
+            with CATALOG_LOCK:
+                con.execute("DELETE FROM sensor_catalog WHERE sensor_key = ? AND row_count IS NULL", [key])
+        raise
+    return key, rows
+
+def write_store(con, store, snapshot, changed_keys, full):
+    """Parquet mode: rewrites every sensor bucket holding one of `changed_keys` (all of
+    them with full) into a new store version and refreshes their catalog stats.
+
+    Expects the new rows in the `sensors` table. Per bucket, the previous version's rows
+    of unchanged sensors are merged with the new rows, rollups are rebuilt for just that
+    bucket, and the raw and rollup tables are written as date= partitions.
+    Returns (version, partitioned) for ParquetStore.publish.
+    """
+    version = store.new_version(snapshot)
+    previous = {} if full or snapshot is None else snapshot["partitioned"]
+    partitioned = {table: dict(buckets) for table, buckets in previous.items()}
+    if full:
+        changed_keys = [r[0] for r in con.execute("SELECT sensor_key FROM sensor_catalog").fetchall()]
+    buckets = sorted({key // SENSOR_BUCKET_SIZE for key in changed_keys})
+    tables = [("sensors", DB_TIME_COL)] + [(rollup_table(level), "bucket") for level in ROLLUP_LEVELS]
+
+    con.execute("ALTER TABLE sensors RENAME TO new_rows")
+    con.execute("CREATE TABLE sensors AS SELECT * FROM new_rows LIMIT 0")
+    con.execute("CREATE OR REPLACE TEMP TABLE rewritten_sensors AS SELECT unnest(?::INTEGER[]) AS sensor_key",
+                [changed_keys])
+    for bucket in buckets:
+        lo, hi = bucket * SENSOR_BUCKET_SIZE, (bucket + 1) * SENSOR_BUCKET_SIZE - 1
+        old_files = [store.path(f) for f in previous.get("sensors", {}).get(str(bucket), [])]
+        kept = f"""
+            SELECT {DB_TIME_COL}, {DB_SENSOR_COL}, {DB_VALUE_COL} FROM read_parquet({sql_list(old_files)})
+            WHERE {DB_SENSOR_COL} NOT IN (SELECT sensor_key FROM rewritten_sensors)
+            UNION ALL
+        """ if old_files else ""
+        con.execute("DELETE FROM sensors")
+        con.execute(f"""
+            INSERT INTO sensors
+            SELECT * FROM ({kept} SELECT * FROM new_rows WHERE {DB_SENSOR_COL} BETWEEN {lo} AND {hi})
+            ORDER BY {DB_SENSOR_COL}, {DB_TIME_COL}
+        """)
+        build_rollups(con, verbose=False)
+        refresh_catalog(con)  # only this bucket's sensors are in the rollups
+        build_sketches(con)
+        for table, time_col in tables:
+            files = store.write_partitions(con, table, time_col, version, bucket)
+            if files:
+                partitioned.setdefault(table, {})[str(bucket)] = files
+            else:
+                partitioned.get(table, {}).pop(str(bucket), None)
+    print(f"Wrote {len(buckets)} sensor buckets to {store.root}/v{version}.")
+    con.execute("DROP TABLE new_rows")
+    return version, partitioned
+
+# Small tables stored next to the partitions in parquet mode
+STORE_TABLES = ("sensor_catalog", "ingest_manifest", "ingest_meta", "sensor_events", "sensor_sketch")
+
+def ingest_data(full=False, workers=None, batch_size=BATCH_SIZE, encoding=VALUE_ENCODING, blocks=REGULAR_BLOCKS):
+    """Ingests new/changed CSV files (all with full). `encoding`/`blocks` pick the sample
+    layout (see VALUE_ENCODINGS); None keeps the current one, and a change rebuilds fully."""
+    if STORAGE_MODE == "parquet":
+        print(f"Initializing Parquet store at {STORE_DIR}...")
+        # Scratch database: the data is read from and written to the store's files
+        con = duckdb.connect()
+        store = ParquetStore(STORE_DIR)
+        snapshot = store.read_snapshot()
+        if snapshot is not None:
+            create_schema(con)
+            store.load_tables(con, snapshot)
+    else:
+        print(f"Initializing DuckDB at {DB_PATH}...")
+        con = duckdb.connect(DB_PATH)
+
+    files = sorted(glob.glob(CSV_PATTERN))
     if not files:
         print(f"No CSV files found matching {CSV_PATTERN}")
         print(f"Please put your .csv files in the '{DATA_DIR}' folder.")
         # Create table anyway to avoid API crash
-        con.execute(f"CREATE TABLE IF NOT EXISTS sensors ({DB_TIME_COL} TIMESTAMP, {DB_SENSOR_COL} VARCHAR, {DB_VALUE_COL} DOUBLE)")
+        create_schema(con)
+        if STORAGE_MODE == "parquet" and snapshot is None:
+            store.publish(con, store.new_version(None), {}, STORE_TABLES)
         return
 
     print(f"Found {len(files)} CSV files. Starting ingestion...")
     start_time = time.time()
 
     try:
-        # 1. Reset Database
-        con.execute("DROP TABLE IF EXISTS sensors")
-        
-        # 2. Create Normalized Schema
-        # We store everything in ONE efficient table, but with a 'sensor_id' column to distinguish them.
-        con.execute(f"""
-            CREATE TABLE sensors (
-                {DB_TIME_COL} TIMESTAMP, 
-                {DB_SENSOR_COL} VARCHAR, 
-                {DB_VALUE_COL} DOUBLE
-            )
-        """)
-        
-        print("Importing and normalizing data...")
-        # 3. Smart Insert with Filename Extraction
-        # We read all CSVs at once using read_csv_auto
-        # We map your CSV headers to our standardized DB columns
-        # We extract 'sensor_id' from the filename (e.g. data/sensor_01.csv -> sensor_01.csv)
-        
-        # TIME FIX: User data is relative (0.0, 0.1...). 
-        # We need to anchor this to a real date (e.g., NOW) so it shows up on the calendar.
-        # We add the current epoch (time.time()) to the relative value.
-        current_epoch = time.time()
-        
         # TIME FIX: User data is relative (0.0, 0.1...). 
         # We need to anchor this to a real date (e.g., NOW) so it shows up on the calendar.
-        # We add the current epoch (time.time()) to the relative value.
-        current_epoch = time.time()
-        
-        query = f"""
-            INSERT INTO sensors 
-            SELECT 
-                to_timestamp({current_epoch} + "{CSV_TIME_HEADER}") as {DB_TIME_COL}, 
-                regexp_replace(filename, '.*[\\\\/]', '') as {DB_SENSOR_COL}, 
-                "{CSV_VALUE_HEADER}" as {DB_VALUE_COL}
-            FROM read_csv('{CSV_PATTERN}', filename=True, header={HAS_HEADER}, union_by_name=True, auto_detect=True)
-        """
-        
-        print(f"Executing: {query}")
-        con.execute(query)
+        # The anchor is stored so files added by later incremental runs line up with earlier ones.
+        anchor_row = None
+        schema_ok = False
+        if not full and has_table(con, "ingest_meta"):
+            anchor_row = con.execute("SELECT value FROM ingest_meta WHERE key = 'time_anchor'").fetchone()
+            version_row = con.execute("SELECT value FROM ingest_meta WHERE key = 'schema_version'").fetchone()
+            schema_ok = version_row is not None and int(version_row[0]) == SCHEMA_VERSION
+        if anchor_row is None or not schema_ok or not has_table(con, "ingest_manifest"):
+            full = True
+
+        current = sample_layout(con)
+        layout = (encoding or current[0], current[1] if blocks is None else blocks)
+        if STORAGE_MODE == "parquet" and is_compact(layout):
+            # The store's Parquet files already compress values per column chunk
+            print("Sample encodings apply to STORAGE_MODE=duckdb only - storing plain samples.")
+            layout = ("double", False)
+        relayout = layout != current and not full
+        if relayout:
+            # Same data, re-encoded: keep the time anchor so nothing moves on the calendar
+            print(f"Sample layout changes from {current} to {layout} - rebuilding.")
+            full = True
+        stored_before = sample_storage(con) if STORAGE_MODE == "duckdb" else (0, 0)
+
+        # 1. Reset Database (only for --full, or when there's nothing to build on)
+        if full:
+            print("Full rebuild requested - dropping existing data.")
+            # Every rollup table, including levels an older layout had
+            for (table,) in con.execute(
+                    "SELECT table_name FROM duckdb_tables() WHERE table_name LIKE 'sensors_rollup_%'").fetchall():
+                con.execute(f"DROP TABLE {table}")
+            drop_samples(con)
+            con.execute("DROP TABLE IF EXISTS sensor_catalog")
+            con.execute("DROP TABLE IF EXISTS sensor_events")
+            con.execute("DROP TABLE IF EXISTS sensor_sketch")
+            con.execute("DROP TABLE IF EXISTS ingest_manifest")
+            con.execute("DROP TABLE IF EXISTS ingest_meta")
+            time_anchor = float(anchor_row[0]) if relayout else time.time()
+        else:
+            time_anchor = float(anchor_row[0])
+
+        # 2. Create Normalized Schema
+        create_sample_tables(con, layout)
+        con.execute("INSERT OR REPLACE INTO ingest_meta VALUES ('time_anchor', ?)", [repr(time_anchor)])
+        con.execute("INSERT OR REPLACE INTO ingest_meta VALUES ('schema_version', ?)", [str(SCHEMA_VERSION)])
 
-        # 4. Create Indexes for Performance
-        print("Indexing time column...")
-        con.execute(f"CREATE INDEX idx_time ON sensors({DB_TIME_COL})")
-        print("Indexing sensor_id...")
-        con.execute(f"CREATE INDEX idx_sensor ON sensors({DB_SENSOR_COL})")
+        # 3. Diff against the manifest
+        to_ingest, removed = plan_ingest(con, files)
+        print(f"{len(to_ingest)} new/changed files, {len(removed)} removed, {len(files) - len(to_ingest)} unchanged.")
+        if not to_ingest and not removed:
+            print("Nothing to do.")
+            return
+
+        # 4. Parse CSV batches in parallel into staging Parquet files
+        shutil.rmtree(STAGING_DIR, ignore_errors=True)
+        os.makedirs(EVENTS_DIR)
+        paths = [f[0] for f in to_ingest]
+        batches = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+        row_counts = {}
+        if batches:
+            print(f"Parsing {len(paths)} files in {len(batches)} batches on {workers or os.cpu_count()} workers...")
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(stage_batch, i, batch, time_anchor) for i, batch in enumerate(batches)]
+                for future in as_completed(futures):
+                    _, counts = future.result()
+                    row_counts.update(counts)
+
+        # 5. Single writer: swap the affected sensors' rows in one transaction
+        changed_sensors = sorted({os.path.basename(p) for p in paths} | {os.path.basename(p) for p in removed})
+        con.execute("BEGIN TRANSACTION")
+        con.execute("CREATE OR REPLACE TEMP TABLE changed_sensors AS SELECT unnest(?::VARCHAR[]) AS name", [changed_sensors])
+        if not full:
+            delete_samples(con, "SELECT sensor_key FROM sensor_catalog WHERE name IN (SELECT name FROM changed_sensors)")
+        if batches:
+            register_sensors(con, f"SELECT DISTINCT sensor_name AS name FROM read_parquet('{STAGING_DIR}/*.parquet')")
+            print("Appending staged data...")
+            # Physical layout: clustered by sensor, time-sorted within each sensor. Row groups
+            # then cover few sensors and a contiguous time span, so their min/max zone maps let
+            # DuckDB skip everything outside a query's sensors and time range. No ART indexes:
+            # they don't help range aggregations and only slow down the appends and deletes.
+            write_samples(con, f"""
+                SELECT s.{DB_TIME_COL}, c.sensor_key AS {DB_SENSOR_COL}, s.{DB_VALUE_COL}
+                FROM read_parquet('{STAGING_DIR}/*.parquet') s
+                JOIN sensor_catalog c ON c.name = s.sensor_name
+            """, layout)
+        changed_keys = [r[0] for r in con.execute(
+            "SELECT sensor_key FROM sensor_catalog WHERE name IN (SELECT name FROM changed_sensors)").fetchall()]
+        con.execute("DELETE FROM sensor_events WHERE sensor_key IN (SELECT unnest(?::INTEGER[]))", [changed_keys])
+        con.execute("DELETE FROM sensor_sketch WHERE sensor_key IN (SELECT unnest(?::INTEGER[]))", [changed_keys])
+        if batches:
+            con.execute(f"""
+                INSERT INTO sensor_events
+                SELECT c.sensor_key, e.kind, e.start_ts, e.end_ts, e.peak_ts, e.magnitude, e.score
+                FROM read_parquet('{EVENTS_DIR}/*.parquet') e
+                JOIN sensor_catalog c ON c.name = e.sensor_name
+                ORDER BY c.sensor_key, e.start_ts
+            """)
+
+        # 6. Build Rollup Pyramid (so full-range views never touch raw rows)
+        if STORAGE_MODE == "parquet":
+            version, partitioned = write_store(con, store, snapshot, changed_keys, full)
+        elif full or not all(has_table(con, rollup_table(level)) for level in ROLLUP_LEVELS):
+            build_rollups(con)
+            refresh_catalog(con)
+            build_sketches(con)
+        else:
+            build_rollups(con, changed_keys)
+            refresh_catalog(con, changed_keys)
+            build_sketches(con, changed_keys)
+        # Sensors whose file is gone have no rows left; retire their keys
+        con.execute("DELETE FROM sensor_catalog WHERE name IN (SELECT unnest(?::VARCHAR[]))",
+                    [[os.path.basename(p) for p in removed]])
+
+        # 7. Record what we ingested
+        if removed:
+            con.executemany("DELETE FROM ingest_manifest WHERE path = ?", [[p] for p in removed])
+        if to_ingest:
+            con.executemany(
+                "INSERT OR REPLACE INTO ingest_manifest VALUES (?, ?, ?, ?, ?, ?, current_timestamp)",
+                [[path, os.path.basename(path), size, mtime, digest, row_counts.get(os.path.basename(path), 0)]
+                 for path, size, mtime, digest in to_ingest],
+            )
+        con.execute("COMMIT")
+        if STORAGE_MODE == "parquet":
+            store.publish(con, version, partitioned, STORE_TABLES, previous=snapshot)
+        shutil.rmtree(STAGING_DIR, ignore_errors=True)
 
         duration = time.time() - start_time
-        count = con.execute("SELECT count(*) FROM sensors").fetchone()[0]
-        print(f"SUCCESS: Ingested {count} rows in {duration:.2f}s.")
+        count = con.execute("SELECT coalesce(sum(row_count), 0) FROM sensor_catalog").fetchone()[0]
+        print(f"SUCCESS: Ingested {sum(row_counts.values())} rows from {len(paths)} files in {duration:.2f}s ({count} rows total).")
+        if STORAGE_MODE == "duckdb":
+            # Segments are compressed when they are checkpointed; measure what is on disk
+            con.execute("CHECKPOINT")
+            print(f"Sample storage ({layout[0]}{' + blocks' if layout[1] else ''}, "
+                  f"{RAW_ROW_BYTES} bytes/row uncompressed):")
+            print(f"  before: {storage_summary(*stored_before)}")
+            print(f"  after:  {storage_summary(*sample_storage(con))}")
+            if layout[1]:
+                in_blocks = con.execute(f"SELECT count(DISTINCT {DB_SENSOR_COL}) FROM sensor_blocks").fetchone()[0]
+                print(f"  {in_blocks} of {con.execute('SELECT count(*) FROM sensor_catalog').fetchone()[0]} "
+                      f"sensors evenly sampled, stored as blocks")
         
     except Exception as e:
         print(f"\n!!! INGESTION FAILED !!!")
@@ -100,8 +908,19 @@ def ingest_data():
         con.close()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest sensor CSV files into DuckDB (incremental by default).")
+    parser.add_argument("--full", action="store_true", help="Drop everything and re-ingest all files")
+    parser.add_argument("--workers", type=int, default=None, help="Parser processes (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="CSV files per parser batch")
+    parser.add_argument("--encoding", choices=list(VALUE_ENCODINGS), default=VALUE_ENCODING,
+                        help="Stored value type (default: keep the current one, double for a new database)")
+    parser.add_argument("--blocks", action=argparse.BooleanOptionalAction, default=REGULAR_BLOCKS,
+                        help="Store evenly sampled sensors as (start, interval, values) blocks")
+    args = parser.parse_args()
+
     if not os.path.exists(DATA_DIR):
         os.makedirs(DATA_DIR)
         print(f"Created '{DATA_DIR}' directory. Please copy your CSVs here.")
     else:
-        ingest_data()
+        ingest_data(full=args.full, workers=args.workers, batch_size=args.batch_size, encoding=args.encoding,
+                    blocks=args.blocks)
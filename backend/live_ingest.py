@@ -0,0 +1,267 @@
+import asyncio
+import logging
+import threading
+import time
+
+import duckdb
+import pyarrow as pa
+
+from ingest_csv import (DB_SENSOR_COL, DB_TIME_COL, DB_VALUE_COL, ROLLUP_LEVELS, append_table, build_rollups,
+                        create_schema, has_table, refresh_catalog, register_sensor_keys, rollback, rollup_table)
+
+log = logging.getLogger("sensor_api.live")
+
+# Timestamp units accepted by the line protocol (?precision=), as multipliers to seconds
+PRECISIONS = {"s": 1.0, "ms": 1e-3, "us": 1e-6, "ns": 1e-9}
+
+# Flush attempts on shutdown when a batch keeps conflicting with another writer
+STOP_FLUSH_ATTEMPTS = 5
+
+
+class BufferFull(Exception):
+    """The write buffer is at capacity; the client should back off and retry."""
+
+
+def parse_lines(text, now, scale=1.0):
+    """Parses line-protocol samples, one per line: `<sensor> <value> [<timestamp>]`.
+
+    `value=1.5` is accepted for the value (InfluxDB style), the timestamp is multiplied
+    by `scale` and defaults to `now`. Blank lines and `#` comments are skipped.
+    Returns (rows, bad_lines) with rows as (ts, sensor, value) tuples.
+    """
+    rows = []
+    bad = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        parts = line.split()
+        try:
+            if len(parts) not in (2, 3):
+                raise ValueError(line)
+            value = float(parts[1].removeprefix("value="))
+            ts = float(parts[2]) * scale if len(parts) == 3 else now
+        except ValueError:
+            bad.append(line)
+            continue
+        rows.append((ts, parts[0], value))
+    return rows, bad
+
+
+class LiveWriter:
+    """In-memory write buffer for streamed samples, flushed to DuckDB in micro-batches.
+
+    Producers only append to Python lists under a lock. One background thread swaps the
+    lists out every `flush_interval` seconds (or as soon as `flush_rows` are pending)
+    and writes the batch in a single transaction: rows are appended (new sensors get
+    catalog keys just before, see register_sensor_keys) and only the rollup buckets the
+    batch touched are recomputed. A batch that conflicts with another writer (an upload
+    of the same sensor) goes back into the buffer and is retried with the next flush.
+    `on_flush(names, keys, since, latest)` runs after every commit.
+    """
+
+    def __init__(self, connect, flush_interval=0.5, flush_rows=50_000, max_rows=1_000_000, on_flush=None):
+        self.connect = connect
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+        self.max_rows = max_rows
+        self.on_flush = on_flush
+
+        self._ts = []
+        self._names = []
+        self._values = []
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._stopping = False
+        self._thread = None
+        self._con = None
+
+        # Metrics
+        self.appended = 0
+        self.written = 0
+        self.dropped = 0
+        self.conflicts = 0
+        self.flushes = 0
+        self.last_flush_ms = 0.0
+
+    @property
+    def pending(self):
+        return len(self._ts)
+
+    def append(self, rows):
+        """Buffers (ts, sensor, value) rows. Raises BufferFull instead of growing past max_rows."""
+        with self._lock:
+            if len(self._ts) + len(rows) > self.max_rows:
+                raise BufferFull(f"Live write buffer full ({len(self._ts)} rows pending)")
+            for ts, name, value in rows:
+                self._ts.append(ts)
+                self._names.append(name)
+                self._values.append(value)
+            self.appended += len(rows)
+            if len(self._ts) >= self.flush_rows:
+                self._wake.notify()
+
+    def start(self):
+        self._con = self.connect()
+        create_schema(self._con)
+        self._thread = threading.Thread(target=self._loop, name="live-writer", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is None:
+            return
+        with self._lock:
+            self._stopping = True
+            self._wake.notify()
+        self._thread.join()
+        self._thread = None
+        self._con.close()
+        self._con = None
+
+    def _loop(self):
+        while True:
+            with self._lock:
+                if not self._stopping and len(self._ts) < self.flush_rows:
+                    self._wake.wait(self.flush_interval)
+                stopping = self._stopping
+            self.flush()
+            if stopping:
+                for _ in range(STOP_FLUSH_ATTEMPTS - 1):
+                    if not self._ts:
+                        break
+                    self.flush()
+                return
+
+    def flush(self):
+        with self._lock:
+            ts, names, values = self._ts, self._names, self._values
+            self._ts, self._names, self._values = [], [], []
+        if not ts:
+            return
+
+        started = time.perf_counter()
+        con = self._con
+        since, latest = min(ts), max(ts)
+        con.register("live_batch", pa.table({
+            "ts": pa.array(ts, pa.float64()),
+            "sensor_name": pa.array(names, pa.string()),
+            "value": pa.array(values, pa.float64()),
+        }))
+        try:
+            # Keys first, committed on their own (see register_sensor_keys)
+            register_sensor_keys(con, "SELECT DISTINCT sensor_name AS name FROM live_batch")
+            con.execute("BEGIN TRANSACTION")
+            con.execute(f"""
+                INSERT INTO {append_table(con)}
+                SELECT b.ts AS {DB_TIME_COL}, c.sensor_key AS {DB_SENSOR_COL}, b.value AS {DB_VALUE_COL}
+                FROM live_batch b JOIN sensor_catalog c ON c.name = b.sensor_name
+                ORDER BY {DB_SENSOR_COL}, {DB_TIME_COL}
+            """)
+            touched = con.execute(
+                "SELECT DISTINCT c.sensor_key, c.name FROM live_batch b JOIN sensor_catalog c ON c.name = b.sensor_name"
+            ).fetchall()
+            keys = [k for k, _ in touched]
+
+            if all(has_table(con, rollup_table(level)) for level in ROLLUP_LEVELS):
+                build_rollups(con, keys, since=since, verbose=False)
+                refresh_catalog(con, keys)
+            else:
+                # First samples into an empty database
+                build_rollups(con, verbose=False)
+                refresh_catalog(con)
+            con.execute("COMMIT")
+        except duckdb.TransactionException as e:
+            # Another writer committed the same rows first; keep the batch for the next flush
+            rollback(con)
+            with self._lock:
+                self._ts, self._names, self._values = ts + self._ts, names + self._names, values + self._values
+            self.conflicts += 1
+            log.warning(f"Live flush conflicted, retrying {len(ts)} rows: {e}")
+            return
+        except Exception as e:
+            rollback(con)
+            self.dropped += len(ts)
+            log.error(f"Live flush failed, dropped {len(ts)} rows: {e}")
+            return
+        finally:
+            con.unregister("live_batch")
+
+        self.written += len(ts)
+        self.flushes += 1
+        self.last_flush_ms = (time.perf_counter() - started) * 1000
+        if self.on_flush is not None:
+            self.on_flush({n for _, n in touched}, keys, since, latest)
+
+    def stats(self):
+        return {
+            "running": self._thread is not None,
+            "pending": self.pending,
+            "max_rows": self.max_rows,
+            "appended": self.appended,
+            "written": self.written,
+            "dropped": self.dropped,
+            "conflicts": self.conflicts,
+            "flushes": self.flushes,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+        }
+
+
+class LiveSubscription:
+    """One /ws/live client: what it watches and the not-yet-pushed range of new data."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.event = asyncio.Event()
+        self.ids = set()
+        self.window = None
+        self.width = None
+        self.agg = "avg"
+        self.since = None
+        self.latest = None
+        self._lock = threading.Lock()
+
+    def notify(self, names, since, latest):
+        """Called from the writer thread after a flush; `names` None means "always"."""
+        if names is not None and self.ids and not (self.ids & names):
+            return
+        with self._lock:
+            self.since = since if self.since is None else min(self.since, since)
+            self.latest = latest if self.latest is None else max(self.latest, latest)
+        self.loop.call_soon_threadsafe(self.event.set)
+
+    def take(self):
+        """Returns and resets the pending (since, latest) range."""
+        with self._lock:
+            since, latest = self.since, self.latest
+            self.since = self.latest = None
+            self.event.clear()
+        return since, latest
+
+
+class LiveHub:
+    """Fans writer flushes out to the /ws/live subscriptions."""
+
+    def __init__(self):
+        self._subs = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, loop):
+        sub = LiveSubscription(loop)
+        with self._lock:
+            self._subs.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subs.discard(sub)
+
+    def publish(self, names, since, latest):
+        with self._lock:
+            subs = list(self._subs)
+        for sub in subs:
+            sub.notify(names, since, latest)
+
+    def stats(self):
+        with self._lock:
+            return {"subscribers": len(self._subs)}
@@ -0,0 +1,265 @@
+import logging
+import sys
+import threading
+import time
+
+import duckdb
+import pyarrow as pa
+
+from db_pool import DuckDBPool
+
+# Level names as stored and filtered on (Python's WARNING is shortened to WARN for the UI)
+LEVEL_NAMES = {"WARNING": "WARN"}
+LEVELS = ["DEBUG", "INFO", "WARN", "ERROR", "CRITICAL"]
+
+
+def like_pattern(text):
+    """ILIKE pattern matching `text` anywhere, with its wildcards escaped."""
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+class LogStore:
+    """Structured server logs in their own DuckDB file, written in micro-batches.
+
+    Works like LiveWriter: emit() only appends to a list under a lock, and a background
+    thread writes the pending records every `flush_interval` seconds. Every record gets
+    an increasing `id`, which is also the pagination cursor of query(). Readers borrow
+    cursors from a pool of `read_pool_size` on a connection of their own, so they never
+    touch the connection the writer thread is using.
+
+    Search uses DuckDB's full-text index (fts extension) when it can be loaded. The
+    index is a snapshot; rows written since (id > indexed_upto) are matched with ILIKE.
+    It is rebuilt in the background, at most every `fts_interval` seconds and only once
+    `fts_min_rows` new rows have arrived: searches scan everything with ILIKE while a
+    rebuild runs, so rebuilding for a short tail costs more than it saves. Without the
+    extension every search is an ILIKE scan.
+    """
+
+    def __init__(self, path, flush_interval=1.0, max_pending=100_000, fts_interval=60.0, fts_min_rows=1000,
+                 read_pool_size=4):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.fts_interval = fts_interval
+        self.fts_min_rows = fts_min_rows
+        self.read_pool_size = read_pool_size
+
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._stopping = False
+        self._thread = None
+        self._con = None
+        self._readers = None
+        self._next_id = 1
+        self._fts_built = 0.0
+
+        self.fts = False
+        self.indexed_upto = 0  # ids <= this are in the full-text index
+
+        # Metrics
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.fts_builds = 0
+
+    def append(self, ts, level, logger, message):
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1  # never block the caller on logging
+                return
+            self._pending.append((ts, LEVEL_NAMES.get(level, level), logger, message))
+
+    def start(self):
+        self._con = duckdb.connect(self.path)
+        self._con.execute("""
+            CREATE TABLE IF NOT EXISTS logs (
+                id BIGINT,
+                ts DOUBLE,
+                level VARCHAR,
+                logger VARCHAR,
+                message VARCHAR
+            )
+        """)
+        self._next_id = self._con.execute("SELECT coalesce(max(id), 0) + 1 FROM logs").fetchone()[0]
+        try:
+            self._con.execute("LOAD fts")
+            self.fts = True
+        except duckdb.Error:
+            try:
+                self._con.execute("INSTALL fts")
+                self._con.execute("LOAD fts")
+                self.fts = True
+            except duckdb.Error as e:
+                print(f"Log search falls back to ILIKE, fts extension unavailable: {e}")
+        if self.fts:
+            self._build_index()
+        # Same file and configuration, so DuckDB hands back the same database instance
+        self._readers = DuckDBPool(self.path, size=self.read_pool_size, read_only=False).open()
+        self._thread = threading.Thread(target=self._loop, name="log-writer", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is None:
+            return
+        with self._lock:
+            self._stopping = True
+            self._wake.notify()
+        self._thread.join()
+        self._thread = None
+        self._readers.close()
+        self._readers = None
+        self._con.close()
+        self._con = None
+
+    def _loop(self):
+        while True:
+            with self._lock:
+                if not self._stopping:
+                    self._wake.wait(self.flush_interval)
+                stopping = self._stopping
+            self.flush()
+            if self.fts and not stopping and self.unindexed() >= self.fts_min_rows \
+                    and time.monotonic() - self._fts_built >= self.fts_interval:
+                self._build_index()
+            if stopping:
+                return
+
+    def flush(self):
+        with self._lock:
+            records, self._pending = self._pending, []
+        if not records:
+            return
+        ts, level, logger, message = zip(*records)
+        first = self._next_id
+        batch = pa.table({
+            "id": pa.array(range(first, first + len(records)), pa.int64()),
+            "ts": pa.array(ts, pa.float64()),
+            "level": pa.array(level, pa.string()),
+            "logger": pa.array(logger, pa.string()),
+            "message": pa.array(message, pa.string()),
+        })
+        con = self._con
+        con.register("log_batch", batch)
+        try:
+            con.execute("INSERT INTO logs SELECT * FROM log_batch")
+        except duckdb.Error as e:
+            # print, not logging: this runs under the handler that feeds the store
+            self.dropped += len(records)
+            print(f"Log flush failed, dropped {len(records)} records: {e}")
+            return
+        finally:
+            con.unregister("log_batch")
+        self._next_id += len(records)
+        self.written += len(records)
+        self.flushes += 1
+
+    def unindexed(self):
+        """Rows written since the full-text index was last built."""
+        return self._next_id - 1 - self.indexed_upto
+
+    def _build_index(self):
+        # Only this thread writes, so max(id) now is exactly what the index will cover
+        upto = self._next_id - 1
+        try:
+            self._con.execute("PRAGMA create_fts_index('logs', 'id', 'message', overwrite = 1)")
+        except duckdb.Error as e:
+            print(f"Log search falls back to ILIKE, building the full-text index failed: {e}")
+            self.fts = False
+            return
+        self.indexed_upto = upto
+        self._fts_built = time.monotonic()
+        self.fts_builds += 1
+
+    # --- Reading (/api/logs) ---
+
+    def query(self, before=None, after=None, limit=200, levels=None, start=None, end=None, search=None):
+        """One page of log records, newest first.
+
+        Paging backwards: pass the previous page's last id as `before`. Polling for new
+        records: pass the newest id seen as `after` (returns up to `limit` records after
+        it, still newest first). Returns (records, search_mode).
+        """
+        where, params = ["TRUE"], []
+        if before is not None:
+            where.append("id < ?")
+            params.append(before)
+        if after is not None:
+            where.append("id > ?")
+            params.append(after)
+        if levels:
+            where.append(f"level IN ({', '.join(['?'] * len(levels))})")
+            params += levels
+        if start is not None:
+            where.append("ts >= ?")
+            params.append(start)
+        if end is not None:
+            where.append("ts <= ?")
+            params.append(end)
+
+        # Oldest first when polling, so a burst larger than `limit` is read in order
+        order = "ASC" if after is not None and before is None else "DESC"
+        select = "SELECT id, ts, level, logger, message FROM logs WHERE {} ORDER BY id " + order + " LIMIT ?"
+        with self._readers.cursor() as con:
+            if search and self.fts and self.indexed_upto:
+                indexed = where + [f"(id <= {self.indexed_upto} AND fts_main_logs.match_bm25(id, ?) IS NOT NULL "
+                                   f"OR id > {self.indexed_upto} AND message ILIKE ? ESCAPE '\\')"]
+                try:
+                    rows = con.execute(select.format(" AND ".join(indexed)),
+                                       params + [search, like_pattern(search), limit]).fetchall()
+                    return self._records(rows, order), "fts"
+                except duckdb.Error:
+                    pass  # index being rebuilt right now; scan instead
+            if search:
+                where.append("message ILIKE ? ESCAPE '\\'")
+                params.append(like_pattern(search))
+            rows = con.execute(select.format(" AND ".join(where)), params + [limit]).fetchall()
+            return self._records(rows, order), "ilike" if search else None
+
+    @staticmethod
+    def _records(rows, order):
+        if order == "ASC":
+            rows = rows[::-1]
+        return [{"id": r[0], "ts": r[1], "level": r[2], "logger": r[3], "message": r[4]} for r in rows]
+
+    def stats(self):
+        return {
+            "running": self._thread is not None,
+            "pending": len(self._pending),
+            "written": self.written,
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+            "fts": self.fts,
+            "fts_builds": self.fts_builds,
+            "indexed_upto": self.indexed_upto,
+            "unindexed": self.unindexed(),
+        }
+
+
+class LogStoreHandler(logging.Handler):
+    """logging handler feeding a LogStore (the formatted message, including tracebacks)."""
+
+    def __init__(self, store, level=logging.NOTSET):
+        super().__init__(level)
+        self.store = store
+
+    def emit(self, record):
+        try:
+            self.store.append(record.created, record.levelname, record.name, self.format(record))
+        except Exception:
+            self.handleError(record)
+
+
+class StdoutHandler(logging.StreamHandler):
+    """StreamHandler writing to whatever sys.stdout is when a record is emitted, so
+    redirects set up after startup (e.g. the benchmark's quieted()) still apply."""
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
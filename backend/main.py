@@ -1,9 +1,233 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+from contextlib import asynccontextmanager, contextmanager
+from fastapi import FastAPI, Header, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-import duckdb
+from fastapi.responses import Response, StreamingResponse
+import json
+import logging
+import numpy as np
 import os
+import subprocess
+import sys
+import threading
+import time
 
-app = FastAPI()
+from catalog_cache import CatalogCache, SensorCatalog
+from csv_upload import MultipartFile, UploadManager, sensor_name_for
+from db_pool import DuckDBPool, PoolTimeout
+from derived import Expression, ExpressionError, bucket_reduce
+from downsample import AGG_SLOTS, agg_fields, finish_buckets, grid_points
+from encoding import (FORMATS, GRID_DTYPES, GRID_MEDIA_TYPE, encode_arrow, encode_f64, encode_grid, encode_json,
+                      encode_ndjson_line, negotiate_format)
+from events import EVENT_KINDS
+from ingest_csv import (DATA_DIR, ROLLUP_LEVELS, SKETCH_SEGMENTS, STORAGE_MODE, STORE_DIR, has_table, ingest_file,
+                        rollup_table, samples_between)
+from live_ingest import PRECISIONS, BufferFull, LiveHub, LiveWriter, parse_lines
+from log_store import LEVELS, LogStore, LogStoreHandler, StdoutHandler
+from parquet_store import ParquetStore, partition_filter
+from metrics import (PROMETHEUS_MEDIA_TYPE, RequestTimer, explain_query, record_payload, record_rows, record_tiles,
+                     render_prometheus, stage)
+from query_executor import QueryCancelled, QueryExecutor, QueueFull
+from similarity import MIN_OVERLAP, SketchIndex, distances, shortlist, sketch_distances
+from tile_cache import TILE_BUCKETS, TileCache, grid_bucket_size
+
+DB_PATH = "sensor_data.duckdb"
+
+# DuckDB connection pool (override via environment)
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 8))
+DB_THREADS = int(os.environ.get("DB_THREADS", 0)) or None    # None = DuckDB default (all cores)
+DB_MEMORY_LIMIT = os.environ.get("DB_MEMORY_LIMIT") or None  # e.g. "4GB"
+
+# /api/data query executor: one worker per pooled cursor, bounded queue behind it
+DATA_MAX_QUEUE = int(os.environ.get("DATA_MAX_QUEUE", 32))
+DATA_MAX_PER_CLIENT = int(os.environ.get("DATA_MAX_PER_CLIENT", 4))
+
+# Tile cache for /api/data (bytes of cached bucket arrays, 0 disables tiling)
+TILE_CACHE_BYTES = int(os.environ.get("TILE_CACHE_BYTES", 256 * 1024 * 1024))
+
+# format=ndjson streaming: sensors per chunk query, rows per Arrow record batch fetched
+STREAM_CHUNK_SENSORS = int(os.environ.get("STREAM_CHUNK_SENSORS", 64))
+STREAM_BATCH_ROWS = int(os.environ.get("STREAM_BATCH_ROWS", 65536))
+
+# Most viewports one /api/data/batch call takes
+BATCH_MAX_VIEWPORTS = 16
+
+# /api/derived: max samples per series on the grid expressions are evaluated on
+DERIVED_MAX_SAMPLES = int(os.environ.get("DERIVED_MAX_SAMPLES", 1 << 18))
+DERIVED_MAX_EXPRESSIONS = 16
+
+# Most events one /api/anomalies call returns
+ANOMALY_MAX_LIMIT = 1000
+
+# /api/similar (see similarity.py): candidates kept from the sketch stage per result,
+# and the buckets they are compared on again from the database
+SIMILAR_MAX_K = 100
+SIMILAR_SHORTLIST = 5
+SIMILAR_MIN_SHORTLIST = 50
+SIMILAR_EXACT_POINTS = 1024
+
+# Live ingest (/api/ingest + /ws/live). Needs a read-write connection, so while it's on
+# ingest_csv.py can't run next to the server; LIVE_INGEST=0 opens the database read-only.
+# Not available with STORAGE_MODE=parquet, where only ingest_csv.py writes.
+LIVE_INGEST = os.environ.get("LIVE_INGEST", "1") != "0" and STORAGE_MODE == "duckdb"
+LIVE_FLUSH_INTERVAL = float(os.environ.get("LIVE_FLUSH_INTERVAL", 0.5))   # seconds between micro-batches
+LIVE_MAX_BUFFER_ROWS = int(os.environ.get("LIVE_MAX_BUFFER_ROWS", 1_000_000))
+LIVE_PUSH_INTERVAL = float(os.environ.get("LIVE_PUSH_INTERVAL", 0.5))     # min seconds between pushes per socket
+LIVE_MAX_WIDTH = 10_000  # most buckets per window a /ws/live subscription may ask for
+
+# CSV upload (/api/ingest-csv): files are spooled into DATA_DIR and ingested one at a time
+# in the background. duckdb mode writes through the read-write pool, so it needs
+# LIVE_INGEST; parquet mode runs ingest_csv.py as a subprocess and publishes a snapshot.
+UPLOADS_ENABLED = LIVE_INGEST or STORAGE_MODE == "parquet"
+INGEST_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ingest_csv.py")
+
+# Structured logs (/api/logs): every record of the sensor_api and uvicorn loggers is also
+# written to their own DuckDB file. LOG_DB_PATH="" keeps them on stdout only.
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "DEBUG")
+LOG_DB_PATH = os.environ.get("LOG_DB_PATH", "server_logs.duckdb")
+LOG_MAX_PAGE = 1000
+
+log = logging.getLogger("sensor_api")
+log.setLevel(LOG_LEVEL)
+if not log.handlers:
+    # Same lines as the former prints ("DEBUG: Source -> ..."), so server.log reads as before
+    stdout_handler = StdoutHandler()
+    stdout_handler.setFormatter(logging.Formatter("%(levelname)s: %(message)s"))
+    log.addHandler(stdout_handler)
+
+log_store = LogStore(LOG_DB_PATH) if LOG_DB_PATH else None
+if log_store is not None:
+    log_handler = LogStoreHandler(log_store)
+    for name in ("sensor_api", "uvicorn.access", "uvicorn.error"):
+        logging.getLogger(name).addHandler(log_handler)
+
+db_pool = None
+db_pool_lock = threading.Lock()
+
+# STORAGE_MODE=parquet: the pool runs on an in-memory database whose tables are views
+# over the store's current snapshot (refreshed per request, see get_db_connection)
+parquet_store = ParquetStore(STORE_DIR) if STORAGE_MODE == "parquet" else None
+
+tile_cache = TileCache(TILE_CACHE_BYTES)
+
+def load_sensor_catalog(con):
+    rows = con.execute("""
+        SELECT sensor_key, name, sensor_group, first_ts, last_ts, row_count, min_val, max_val
+        FROM sensor_catalog ORDER BY name
+    """).fetchall()
+    return SensorCatalog(rows, available_rollups(con), compact=has_table(con, "sensor_rows"))
+
+# sensor_catalog and the rollup levels, reloaded only after the database changed
+# (live flush, new Parquet snapshot); see catalog_cache.py
+catalog_cache = CatalogCache(load_sensor_catalog)
+
+def load_sketch_index(con):
+    if not con.execute("SELECT count(*) FROM duckdb_tables() WHERE table_name = 'sensor_sketch'").fetchone()[0]:
+        return SketchIndex([], [], [], {}, np.empty((0, SKETCH_SEGMENTS)))
+    table = con.execute("SELECT * FROM sensor_sketch ORDER BY sensor_key").to_arrow_table()
+    cols = {name: table[name].to_numpy() for name in table.column_names if name != "sketch"}
+    matrix = table["sketch"].combine_chunks().flatten().to_numpy(zero_copy_only=False).astype(np.float64)
+    return SketchIndex(cols.pop("sensor_key"), cols.pop("start_ts"), cols.pop("end_ts"), cols,
+                       matrix.reshape(len(table), SKETCH_SEGMENTS))
+
+# sensor_sketch as a SketchIndex, reloaded whenever the catalog is
+sketch_cache = CatalogCache(load_sketch_index)
+
+data_executor = QueryExecutor(workers=DB_POOL_SIZE, max_queue=DATA_MAX_QUEUE, max_per_client=DATA_MAX_PER_CLIENT)
+
+def open_db_pool():
+    """Opens the shared connection once; later calls reuse it."""
+    global db_pool
+    with db_pool_lock:
+        if db_pool is None:
+            catalog_cache.invalidate()
+            sketch_cache.invalidate()
+            if parquet_store is not None:
+                db_pool = DuckDBPool(":memory:", size=DB_POOL_SIZE, threads=DB_THREADS, memory_limit=DB_MEMORY_LIMIT,
+                                     read_only=False).open()
+            else:
+                db_pool = DuckDBPool(DB_PATH, size=DB_POOL_SIZE, threads=DB_THREADS, memory_limit=DB_MEMORY_LIMIT,
+                                     read_only=not LIVE_INGEST).open()
+        return db_pool
+
+def database_exists():
+    return parquet_store.exists() if parquet_store is not None else os.path.exists(DB_PATH)
+
+def close_db_pool():
+    global db_pool
+    with db_pool_lock:
+        if db_pool is not None:
+            db_pool.close()
+            db_pool = None
+
+def on_live_flush(names, sensor_keys, since, latest):
+    # Runs on the writer thread right after a micro-batch commits
+    tile_cache.invalidate(sensor_keys, since)
+    catalog_cache.invalidate()
+    live_hub.publish(names, since, latest)
+
+live_hub = LiveHub()
+live_writer = LiveWriter(lambda: open_db_pool().con.cursor(), flush_interval=LIVE_FLUSH_INTERVAL,
+                         max_rows=LIVE_MAX_BUFFER_ROWS, on_flush=on_live_flush)
+
+def ingest_upload(job, on_stage):
+    """UploadManager worker: ingests a received file, returns its row count."""
+    if parquet_store is not None:
+        # Same as running ingest_csv.py by hand: picks up every new/changed file in DATA_DIR.
+        # A file the upload replaces is put back if that fails.
+        on_stage("loading")
+        backup = f"{job.path}.bak"
+        replaced = os.path.exists(job.path)
+        if replaced:
+            os.replace(job.path, backup)
+        os.replace(job.part, job.path)
+        result = subprocess.run([sys.executable, INGEST_SCRIPT], capture_output=True, text=True)
+        if result.returncode != 0 or "INGESTION FAILED" in result.stdout:
+            os.replace(backup, job.path) if replaced else os.remove(job.path)
+            output = (result.stdout + result.stderr).strip().splitlines()
+            error = next((line.removeprefix("Error: ") for line in output if line.startswith("Error:")),
+                         output[-1] if output else result.returncode)
+            raise RuntimeError(f"ingest_csv.py failed: {error}")
+        if replaced:
+            os.remove(backup)
+        with get_db_connection() as con:
+            row = con.execute("SELECT row_count FROM sensor_catalog WHERE name = ?", [job.name]).fetchone()
+        return row[0] if row else 0
+
+    con = open_db_pool().con.cursor()
+    try:
+        key, rows = ingest_file(con, job.path, job.name, job.size, job.mtime, job.digest, job.part, on_stage)
+    finally:
+        con.close()
+    os.replace(job.part, job.path)
+    tile_cache.invalidate([key], float("-inf"))
+    catalog_cache.invalidate()
+    sketch_cache.invalidate()
+    log.info(f"Ingested upload {job.name}: {rows} rows")
+    return rows
+
+upload_manager = UploadManager(ingest_upload, DATA_DIR)
+
+@asynccontextmanager
+async def lifespan(app):
+    # Open the database once for the lifetime of the app so queries hit warm buffers.
+    # If it doesn't exist yet (ingest not run), the first request opens it instead.
+    # With live ingest on, the writer creates an empty database if there is none.
+    if log_store is not None:
+        log_store.start()
+    if LIVE_INGEST:
+        live_writer.start()
+    elif database_exists():
+        open_db_pool()
+    yield
+    upload_manager.shutdown()
+    live_writer.stop()
+    if log_store is not None:
+        log_store.stop()
+    data_executor.shutdown()
+    close_db_pool()
+
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS for frontend
 app.add_middleware(
@@ -12,14 +236,51 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
-DB_PATH = "sensor_data.duckdb"
-
+@contextmanager
 def get_db_connection():
-    if not os.path.exists(DB_PATH):
+    """Borrows a cursor from the shared pool for the duration of a request."""
+    if not database_exists():
         raise HTTPException(status_code=500, detail="Database not initialized. Run ingest_csv.py first.")
-    return duckdb.connect(DB_PATH, read_only=True)
+    pool = open_db_pool()
+    if parquet_store is not None and parquet_store.refresh(pool.con):
+        # A new ingest was published; cached tiles and the catalog may predate it
+        tile_cache.clear()
+        catalog_cache.invalidate()
+        sketch_cache.invalidate()
+    with pool.cursor() as con:
+        yield con
+
+def available_rollups(con):
+    """Rollup levels (seconds) that actually exist in the database, finest first."""
+    # information_schema includes views (the rollups are views in parquet mode)
+    tables = {r[0] for r in con.execute("SELECT table_name FROM information_schema.tables").fetchall()}
+    return [level for level in ROLLUP_LEVELS if rollup_table(level) in tables]
+
+def partition_terms(lo, hi, sensor_keys, alias=""):
+    """Partition predicates for rows in [lo, hi] in parquet mode (see parquet_store), else nothing."""
+    return partition_filter(lo, hi, sensor_keys, alias) if parquet_store is not None else ""
+
+def pick_rollup_level(levels, bucket_size, start):
+    """Coarsest rollup level whose buckets tile the output buckets exactly.
+
+    Rollup buckets start at multiples of their level, so a level only fits when both
+    `start` and `bucket_size` are multiples of it; otherwise its buckets straddle
+    output bucket edges and each one lands whole on one side. Returns None when no
+    level fits (zoomed in below the finest rollup, or an off-grid range), in which
+    case the query has to fall back to the raw rows.
+    """
+    best = None
+    for level in levels:
+        if level <= bucket_size and on_level_grid(bucket_size, level) and on_level_grid(start, level):
+            best = level
+    return best
+
+def on_level_grid(x, level):
+    """Whether x (seconds) is a multiple of `level`, up to the microseconds the SQL keeps."""
+    return abs(x - round(x / level) * level) < 1e-6
 
 @app.get("/")
 def read_root():
@@ -28,170 +289,1441 @@ def read_root():
 @app.get("/api/status")
 def get_status():
     try:
-        con = get_db_connection()
-        count = con.execute("SELECT count(*) FROM sensors").fetchone()[0]
-        # Get time range
-        # time_range = con.execute("SELECT min(time), max(time) FROM sensors").fetchone()
-        con.close()
-        return {"row_count": count, "db_engine": "DuckDB"}
+        with get_db_connection() as con:
+            # Served from the cached catalog: O(sensors), not O(rows)
+            catalog = catalog_cache.get(con)
+        return {"row_count": int(np.nansum(catalog.row_count)), "sensor_count": len(catalog),
+                "time_range": list(catalog.time_range() or (None, None)),
+                "db_engine": "DuckDB", "storage": STORAGE_MODE,
+                "store_version": parquet_store.version if parquet_store is not None else None, "pool": db_pool.stats(),
+                "executor": data_executor.stats(), "cache": tile_cache.stats(),
+                "catalog_cache": catalog_cache.stats(), "sketch_cache": sketch_cache.stats(),
+                "live": {**live_writer.stats(), **live_hub.stats()},
+                "uploads": upload_manager.stats(),
+                "logs": log_store.stats() if log_store is not None else None}
     except Exception as e:
         return {"error": str(e), "hint": "Have you put CSV files in 'backend/data' and ran ingest_csv.py?"}
 
 @app.get("/api/sensors")
 def get_sensors():
     try:
-        con = get_db_connection()
-        # Fetch distinct sensor IDs (assuming we have a sensor_id column or implicitly file-based)
-        # In our schema, we have 'sensor_id' column or we can assume filenames from ingest.
-        # Let's check schema first. The ingest script adds 'sensor_id'.
-        sensors = con.execute("SELECT DISTINCT sensor_id FROM sensors ORDER BY sensor_id").fetchall()
-        con.close()
-        
-        # Flatten list of tuples [('s1',), ('s2',)] -> ['s1', 's2']
-        sensor_list = [s[0] for s in sensors]
+        with get_db_connection() as con:
+            # One row per sensor in the catalog (written by ingest_csv.py), no fact table scan
+            catalog = catalog_cache.get(con)
         
-        # Group them for the UI (Mock grouping for now based on name)
-        # e.g. signal_0001 -> "Group A"
-        grouped = {
-            "Generated Signals": sensor_list
-        }
+        # Group them for the UI, e.g. signal_0001.csv -> "signal"
+        grouped = {}
+        for group, name in sorted(zip(catalog.groups, catalog.names)):
+            grouped.setdefault(group, []).append(name)
         
         return grouped
     except Exception as e:
-        print(f"Error fetching sensors: {e}")
+        log.error(f"Error fetching sensors: {e}")
         return {"error": str(e)}
 
-@app.get("/api/data")
-def get_sensor_data(start: float = None, end: float = None, width: int = 1000, ids: str = ""):
+@app.get("/api/extents")
+def get_extents(ids: str = ""):
+    """First/last timestamp, row count and value min/max per selected sensor (all for
+    empty `ids`), plus the combined time and value range, e.g. for axis scaling.
+    Served from the cached catalog without a query."""
+    with get_db_connection() as con:
+        catalog = catalog_cache.get(con)
+    sensor_filter = parse_ids(ids)
+    keys = [catalog.key_of[name] for name in sensor_filter if name in catalog.key_of]
+    if sensor_filter and not keys:
+        return {"time_range": None, "value_range": None, "sensors": {}}
+
+    extents = catalog.extents(keys)
+    values = [v for e in extents.values() for v in (e["min"], e["max"]) if v is not None]
+    return {"time_range": catalog.time_range(keys), "value_range": [min(values), max(values)] if values else None,
+            "sensors": extents}
+
+@app.get("/api/anomalies")
+def get_anomalies(start: float = None, end: float = None, ids: str = "", min_score: float = 0.0, limit: int = 100,
+                  kind: str = ""):
+    """Top `limit` events by score (spikes, steps, bursts; see events.py) overlapping
+    [start, end] across the selected sensors (all for empty `ids`), optionally only the
+    comma-separated `kind`s. Read from the sensor_events index built at ingest."""
+    kinds = parse_ids(kind)
+    unknown = [k for k in kinds if k not in EVENT_KINDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown kind(s) {', '.join(unknown)}. Use: {', '.join(EVENT_KINDS)}")
+    limit = max(1, min(limit, ANOMALY_MAX_LIMIT))
+
+    with get_db_connection() as con:
+        catalog = catalog_cache.get(con)
+        sensor_filter = parse_ids(ids)
+        keys = [catalog.key_of[name] for name in sensor_filter if name in catalog.key_of]
+        if sensor_filter and not keys:
+            return {"events": [], "total": 0}
+        if not con.execute("SELECT count(*) FROM duckdb_tables() WHERE table_name = 'sensor_events'").fetchone()[0]:
+            raise HTTPException(status_code=404, detail="No event index yet - re-run ingest_csv.py")
+
+        where, params = ["score >= ?"], [min_score]
+        if start is not None:
+            where.append("end_ts >= ?")
+            params.append(start)
+        if end is not None:
+            where.append("start_ts <= ?")
+            params.append(end)
+        if keys:
+            where.append("sensor_key IN (SELECT unnest(?::INTEGER[]))")
+            params.append(keys)
+        if kinds:
+            where.append("kind IN (SELECT unnest(?::VARCHAR[]))")
+            params.append(kinds)
+        rows = con.execute(f"""
+            SELECT sensor_key, kind, start_ts, end_ts, peak_ts, magnitude, score, count(*) OVER () AS total
+            FROM sensor_events WHERE {" AND ".join(where)}
+            ORDER BY score DESC LIMIT ?
+        """, params + [limit]).fetchall()
+
+    return {"events": [{"sensor": catalog.name_of.get(r[0]), "kind": r[1], "start": r[2], "end": r[3], "peak": r[4],
+                        "magnitude": r[5], "score": r[6]} for r in rows],
+            "total": rows[0][7] if rows else 0}
+
+@app.get("/api/logs")
+def get_logs(before: int = None, after: int = None, limit: int = 200, level: str = "", start: float = None,
+             end: float = None, q: str = ""):
+    """Server log records, newest first, `limit` per page.
+
+    Page back with `before=<last id of the previous page>`; poll for new records with
+    `after=<newest id seen>`. `level` is a comma-separated list of DEBUG, INFO, WARN,
+    ERROR, CRITICAL; `start`/`end` bound the epoch timestamp; `q` searches the message
+    (full-text index plus ILIKE for the newest rows, see log_store.py).
+    """
+    if log_store is None:
+        raise HTTPException(status_code=404, detail="Log store disabled (LOG_DB_PATH is empty)")
+    levels = [l.upper() for l in parse_ids(level)]
+    unknown = [l for l in levels if l not in LEVELS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown level(s) {', '.join(unknown)}. Use: {', '.join(LEVELS)}")
+    limit = max(1, min(limit, LOG_MAX_PAGE))
+
     try:
-        con = get_db_connection()
+        entries, search = log_store.query(before, after, limit, levels, start, end, q.strip() or None)
+    except PoolTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    # A full page means there may be more in that direction
+    return {"entries": entries, "next_cursor": entries[-1]["id"] if len(entries) == limit and after is None else None,
+            "search": search}
+
+def parse_ids(ids):
+    if ids and ids.strip():
+        return [s.strip() for s in ids.split(',') if s.strip()]
+    return []
+
+# Result of a query that matched nothing: (times, sensor_ids, matrix)
+EMPTY_RESULT = (np.empty(0), [], np.empty((0, 0)))
+
+def load_catalog(con):
+    """{sensor name: integer sensor_key} for every sensor in sensor_catalog."""
+    return catalog_cache.get(con).key_of
+
+def keys_to_names(keys, matrix, catalog):
+    """Replaces sensor keys with their names and reorders the matrix rows by name."""
+    name_of = {k: n for n, k in catalog.items()}
+    names = [name_of[k] for k in keys]
+    order = sorted(range(len(names)), key=names.__getitem__)
+    return [names[i] for i in order], matrix[order]
+
+def run_aggregation(con, query, params, source):
+    """Executes an aggregation query and fetches it as NumPy columns.
+
+    Times execution and fetch separately on the request's RequestTimer and counts the
+    rows fed into the aggregation via its `n_in` column (popped from the result).
+    """
+    with stage("sql"):
+        result = con.execute(query, params)
+    with stage("fetch"):
+        cols = result.fetchnumpy()
+    n_in = cols.pop("n_in")
+    record_rows(n_in.sum(), len(n_in), source)
+    explain_query(con, query, params)
+    return cols
+
+def bucket_exprs(level):
+    """(time column, avg expression, extrema expressions) of the raw samples (level None)
+    or of a rollup level, for the bucket aggregations."""
+    if level is None:
+        # min_val, max_val, min_t, max_t, first_val, last_val (see downsample.EXTREMA_FIELDS)
+        return "ts", "avg(value)", """min(value) AS min_val, max(value) AS max_val,
+            arg_min(ts, value) AS min_t, arg_max(ts, value) AS max_t,
+            arg_min(value, ts) AS first_val, arg_max(value, ts) AS last_val"""
+    return "bucket", "sum(sum_val) / sum(cnt)", """min(min_val) AS min_val, max(max_val) AS max_val,
+            arg_min(min_t, min_val) AS min_t, arg_max(max_t, max_val) AS max_t,
+            arg_min(first_val, t_min) AS first_val, arg_max(last_val, t_max) AS last_val"""
+
+def bucket_query(sensor_catalog, start, end, bucket_size, sensor_filter, agg, clamp_start=True):
+    """SQL for the bucket aggregation over [start, end], one row per (bucket_idx, sensor_key).
+
+    `sensor_catalog` gives the rollup levels and sample layout to read from.
+    `sensor_filter` holds integer sensor keys (None or empty means every sensor).
+    With clamp_start, a rollup bucket straddling `start` is counted in bucket 0;
+    without it, rollup buckets are placed strictly by their own start time.
+    Returns (query, params, source table).
+    """
+    # Optimized Aggregation Query
+    # We group by integer bucket index AND sensor_key.
+    # Read from the coarsest rollup whose buckets line up with the output buckets,
+    # and only touch raw rows when none does (zoomed in, or an off-grid range).
+    
+    f_start = f"{start:.6f}"
+    f_end = f"{end:.6f}"
+    f_bucket = f"{bucket_size:.6f}"
+    
+    level = pick_rollup_level(sensor_catalog.levels, bucket_size, start)
+    time_expr, avg_expr, extrema_expr = bucket_exprs(level)
+    if level is None:
+        source = "sensors"
+        table = samples_between(sensor_catalog.compact, start, end)
+        # Filter the plain epoch column directly so row-group zone maps prune
+        where_clause = f"{time_expr} >= {f_start} AND {time_expr} <= {f_end}"
+        row_range = (start, end)
+    else:
+        source = table = rollup_table(level)
+        if clamp_start:
+            # Include the rollup bucket straddling 'start'; it lands in output bucket 0.
+            where_clause = f"bucket > {f_start} - {level} AND bucket <= {f_end}"
+            row_range = (start - level, end)
+        else:
+            where_clause = f"bucket >= {f_start} AND bucket <= {f_end}"
+            row_range = (start, end)
+    where_clause += partition_terms(*row_range, sensor_filter)
+    params = []
+    
+    if sensor_filter:
+        # Add sensor filter
+        placeholders = ', '.join(['?'] * len(sensor_filter))
+        where_clause += f" AND sensor_key IN ({placeholders})"
+        params = sensor_filter
+
+    query = f"""
+        SELECT 
+            CAST(GREATEST(FLOOR(({time_expr} - {f_start}) / {f_bucket}), 0) AS INTEGER) as bucket_idx,
+            sensor_key,
+            {f"{avg_expr} AS avg_val" if agg == "avg" else extrema_expr},
+            count(*) AS n_in
+        FROM {table} 
+        WHERE {where_clause}
+        GROUP BY bucket_idx, sensor_key
+    """
+    log.debug(f"Source -> {source} (bucket {bucket_size:.3f}s)")
+    return query, params, source
+
+def query_buckets(con, sensor_catalog, start, end, bucket_size, num_buckets, sensor_filter, agg, clamp_start=True):
+    """Runs the bucket aggregation for [start, end] and pivots it.
+
+    Returns (sensor_keys, grids): the sorted keys of sensors that have data in range and,
+    per field in agg_fields(agg), an (n_sensors, num_buckets + 1) matrix with NaN gaps.
+    See bucket_query for the arguments.
+    """
+    query, params, source = bucket_query(sensor_catalog, start, end, bucket_size, sensor_filter, agg, clamp_start)
+
+    # Columnar fetch: one NumPy array per column, no per-row Python tuples
+    cols = run_aggregation(con, query, params, source)
+    
+    with stage("pivot"):
+        # Pivot: sorted sensor keys plus, for every result row, the index of its sensor
+        sorted_sensors, sensor_idx = np.unique(cols["sensor_key"], return_inverse=True)
+        bucket_idx = cols["bucket_idx"]
         
-        # Parse IDs
-        sensor_filter = []
-        if ids and ids.strip():
-            sensor_filter = [s.strip() for s in ids.split(',') if s.strip()]
+        def scatter(name):
+            # (n_sensors, num_buckets + 1) matrix, NaN where a sensor has no data in a bucket
+            grid = np.full((len(sorted_sensors), num_buckets + 1), np.nan)
+            grid[sensor_idx, bucket_idx] = np.ma.filled(np.ma.asarray(cols[name], dtype=np.float64), np.nan)
+            return grid
         
-        print(f"DEBUG: Request Params -> Width: {width}, Sensors: {len(sensor_filter)}")
+        return sorted_sensors.tolist(), {f: scatter(f) for f in agg_fields(agg)}
+
+def resolve_range(con, start, end, sensor_filter):
+    """Range stage of /api/data: the SensorCatalog, its name -> key dict, the keys of
+    the requested sensor names (empty = all) and the time range, defaulting to the
+    selected sensors' extent. Returns None when nothing matches.
+    """
+    with stage("range"):
+        sensor_catalog = catalog_cache.get(con)
+
+        # Names -> integer keys; everything below filters and groups on the keys
+        catalog = sensor_catalog.key_of
+        if sensor_filter:
+            sensor_keys = sorted({catalog[name] for name in sensor_filter if name in catalog})
+            if not sensor_keys:
+                return None # None of the requested sensors exist
+        else:
+            sensor_keys = []
 
         # 1. Determine time range if not provided
         if start is None or end is None:
-            # Optimize: Get range only for selected sensors if specified
-            if sensor_filter:
-                # Use parameterized query for safety
-                placeholders = ', '.join(['?'] * len(sensor_filter))
-                range_query = f"SELECT min(epoch(time)), max(epoch(time)) FROM sensors WHERE sensor_id IN ({placeholders})"
-                range_row = con.execute(range_query, sensor_filter).fetchone()
-            else:
-                range_row = con.execute("SELECT min(epoch(time)), max(epoch(time)) FROM sensors").fetchone()
-                
-            if not range_row or range_row[0] is None:
-                return [[], []] # Empty DB or no match
+            # Range of the selected sensors only, from the cached catalog's exact
+            # first/last sample times: no query at all
+            range_row = sensor_catalog.time_range(sensor_keys)
+            if range_row is None:
+                return None # Empty DB or no match
             db_min, db_max = range_row
-            
-            # Helper to ensure we work with floats (Unix Epoch)
-            def to_epoch(val):
-                if hasattr(val, 'timestamp'): return val.timestamp()
-                if type(val) is int or type(val) is float: return val
-                return float(val)
 
             start = start if start is not None else db_min
             end = end if end is not None else db_max
+    return sensor_catalog, catalog, sensor_keys, start, end
 
-        # 2. Calculate dynamic bucket size
-        duration = end - start
-        if width <= 0: width = 1000
-        bucket_size = duration / width
-        
-        if duration <= 0: return {"time": [], "series": []}
-        
-        # 3. Optimized Aggregation Query
-        # We group by integer bucket index AND sensor_id.
-        
-        f_start = f"{start:.6f}"
-        f_end = f"{end:.6f}"
-        f_bucket = f"{bucket_size:.6f}"
-        
-        where_clause = f"epoch(time) >= {f_start} AND epoch(time) <= {f_end}"
-        params = []
-        
-        if sensor_filter:
-            # Add sensor filter
-            placeholders = ', '.join(['?'] * len(sensor_filter))
-            where_clause += f" AND sensor_id IN ({placeholders})"
-            params = sensor_filter
-
-        query = f"""
-            SELECT 
-                CAST(FLOOR((epoch(time) - {f_start}) / {f_bucket}) AS INTEGER) as bucket_idx,
-                sensor_id,
-                avg(value) as avg_val
-            FROM sensors 
-            WHERE {where_clause}
-            GROUP BY bucket_idx, sensor_id
-            ORDER BY bucket_idx ASC
-        """
-        
-        rows = con.execute(query, params).fetchall()
-        # print(f"DEBUG: Aggregated {len(rows)} points.")
-        con.close()
-        
-        # 4. Pivot Data for Frontend (Unified Time Axis)
-        # We need a dense array of times, and sparse arrays for each sensor (filling gaps with None or NaN)
-        # However, uPlot expects aligned data. We will fill gaps with None (null in JSON).
-        
-        # Calculate expected number of buckets
-        num_buckets = int(width)
-        
-        # Create master time array
-        times = []
-        start_float = float(start)
-        bucket_float = float(bucket_size)
-        for i in range(num_buckets + 1): # +1 to include end
-             times.append(start_float + i * bucket_float)
-             
-        # Organize data by sensor
-        # sensor_data = { "sensor_id": { bucket_idx: value } }
-        sensor_map = {}
-        distinct_sensors = set()
-        
-        for r in rows:
-            b_idx = r[0]
-            s_id = r[1]
-            val = r[2]
-            
-            if s_id not in sensor_map:
-                sensor_map[s_id] = {}
-                distinct_sensors.add(s_id)
-            
-            sensor_map[s_id][b_idx] = val
-            
-        # Build final response structure
-        # Sort sensors for consistent order
-        sorted_sensors = sorted(list(distinct_sensors))
+def aggregate_sensor_data(con, start, end, width, sensor_filter, agg):
+    """Downsamples the selected sensors into `width` buckets between start and end.
+
+    `sensor_filter` holds sensor names. Returns (times, sensor_ids, matrix): the shared
+    time axis, the sensor names in sorted order and a (n_sensors, len(times)) float
+    matrix with NaN for empty buckets.
+    """
+    resolved = resolve_range(con, start, end, sensor_filter)
+    if resolved is None:
+        return EMPTY_RESULT
+    sensor_catalog, catalog, sensor_keys, start, end = resolved
+
+    # 2. Calculate dynamic bucket size
+    duration = end - start
+    if width <= 0: width = 1000
+    bucket_size = duration / width
+    
+    if duration <= 0: return EMPTY_RESULT
+
+    # 3. Snap to the global tile grid and serve what we can from the cache
+    if tile_cache.max_bytes > 0:
+        times, sensor_keys, matrix = aggregate_tiled(con, sensor_catalog, start, end, width, sensor_keys,
+                                                     sorted(catalog.values()), agg)
+        with stage("pivot"):
+            return (times, *keys_to_names(sensor_keys, matrix, catalog))
+    
+    # 4. Pivot Data for Frontend (Unified Time Axis)
+    # We need a dense array of times, and dense arrays for each sensor with NaN gaps.
+    # uPlot expects aligned data; orjson writes NaN as null in JSON.
+    num_buckets = int(width)
+    sensor_keys, grids = query_buckets(con, sensor_catalog, start, end, bucket_size, num_buckets, sensor_keys, agg)
+    
+    with stage("pivot"):
+        # Create master time array (+1 bucket to include end)
+        # Modes emitting several points per bucket (m4/minmax) spread them evenly inside the bucket.
+        slots = AGG_SLOTS[agg]
+        times = float(start) + np.arange((num_buckets + 1) * slots) / slots * float(bucket_size)
         
-        series_list = []
-        for s_id in sorted_sensors:
-            data_points = []
-            s_data = sensor_map[s_id]
-            
-            for i in range(num_buckets + 1):
-                # If we have a value for this bucket, use it. Otherwise None/Null
-                val = s_data.get(i, None)
-                data_points.append(val)
-            
-            series_list.append({
-                "id": s_id,
-                "data": data_points
+        # Rows of a C-contiguous matrix serialize straight from NumPy memory
+        times, matrix = finish_buckets(agg, grids, times)
+        sensor_ids, matrix = keys_to_names(sensor_keys, matrix, catalog)
+        return times, sensor_ids, np.ascontiguousarray(matrix)
+
+def aggregate_tiled(con, sensor_catalog, start, end, width, sensor_filter, all_keys, agg):
+    """Cached variant of aggregate_sensor_data on a global, power-of-two bucket grid.
+
+    Output buckets are grid buckets, grouped into tiles of TILE_BUCKETS that are cached
+    per (sensor, field set, resolution, tile index). Only tiles missing from the cache
+    are queried, one query per contiguous run of missing tiles, so a pan only pays for
+    the newly exposed part of the range. Works on sensor keys; `all_keys` is used
+    when `sensor_filter` is empty.
+    """
+    exponent, bucket_size = grid_bucket_size(end - start, width)
+    tile_span = bucket_size * TILE_BUCKETS
+    first_bucket = int(np.floor(start / bucket_size))
+    last_bucket = int(np.floor(end / bucket_size))
+    first_tile = first_bucket // TILE_BUCKETS
+    last_tile = last_bucket // TILE_BUCKETS
+    tile_range = range(first_tile, last_tile + 1)
+
+    fields = agg_fields(agg)
+    kind = "avg" if agg == "avg" else "extrema"  # m4/minmax/lttb share the same extrema tiles
+    generation = tile_cache.generation  # before querying, see TileCache
+    sensors = sorted(set(sensor_filter)) if sensor_filter else all_keys
+
+    with stage("cache"):
+        # Look up every (sensor, tile); remember which tiles have at least one sensor missing
+        tiles = {}
+        missing = {}
+        for s_id in sensors:
+            for t in tile_range:
+                tile = tile_cache.get((s_id, kind, exponent, t))
+                if tile is None:
+                    missing.setdefault(t, set()).add(s_id)
+                else:
+                    tiles[(s_id, t)] = tile
+        record_tiles(len(tiles), sum(map(len, missing.values())))
+
+    # Fill the gaps, one query per contiguous run of missing tiles
+    for run_first, run_last in tile_runs(missing):
+        run_sensors = sorted(set().union(*(missing[t] for t in range(run_first, run_last + 1))))
+        # Every sensor missing: skip the (potentially huge) IN list
+        query_sensors = None if len(run_sensors) == len(sensors) and not sensor_filter else run_sensors
+        n_buckets = (run_last - run_first + 1) * TILE_BUCKETS
+        run_start = run_first * tile_span
+        found, grids = query_buckets(con, sensor_catalog, run_start, run_start + n_buckets * bucket_size, bucket_size,
+                                     n_buckets, query_sensors, agg, clamp_start=False)
+        store_tiles(tiles, found, grids, run_sensors, run_first, run_last, fields, kind, exponent, generation)
+
+    with stage("pivot"):
+        return assemble_tiles(tiles, sensors, first_bucket, last_bucket, bucket_size, agg)
+
+def store_tiles(tiles, found, grids, sensors, run_first, run_last, fields, kind, exponent, generation):
+    """Cuts the grids of a query over tiles [run_first, run_last] (rows in `found` order)
+    into tiles for `sensors`, caches them and adds them to `tiles`. Sensors the query
+    found nothing for get all-NaN tiles."""
+    row_of = {s_id: i for i, s_id in enumerate(found)}
+    for s_id in sensors:
+        i = row_of.get(s_id)
+        for t in range(run_first, run_last + 1):
+            lo = (t - run_first) * TILE_BUCKETS
+            if i is None:
+                tile = np.full((len(fields), TILE_BUCKETS), np.nan)
+            else:
+                # Copy, so the cached tile doesn't pin the whole query grid in memory
+                tile = np.stack([grids[f][i, lo:lo + TILE_BUCKETS] for f in fields])
+            if tile_cache.max_bytes > 0:
+                tile_cache.put((s_id, kind, exponent, t), tile, generation)
+            tiles[(s_id, t)] = tile
+
+def tile_runs(tile_indexes):
+    """Contiguous runs of tile indexes as [first, last] pairs, in order."""
+    runs = []
+    for t in sorted(tile_indexes):
+        if runs and runs[-1][1] == t - 1:
+            runs[-1][1] = t
+        else:
+            runs.append([t, t])
+    return runs
+
+def assemble_tiles(tiles, sensors, first_bucket, last_bucket, bucket_size, agg):
+    """Cuts grid buckets [first_bucket, last_bucket] of `sensors` out of `tiles`
+    ({(sensor_key, tile index): tile}) and drops sensors without data in that range.
+    Returns (times, sensor_keys, matrix) like aggregate_tiled."""
+    first_tile = first_bucket // TILE_BUCKETS
+    tile_range = range(first_tile, last_bucket // TILE_BUCKETS + 1)
+    fields = agg_fields(agg)
+    lo = first_bucket - first_tile * TILE_BUCKETS
+    hi = last_bucket - first_tile * TILE_BUCKETS + 1
+    stacked = np.stack([np.concatenate([tiles[(s_id, t)] for t in tile_range], axis=1)[:, lo:hi] for s_id in sensors]) \
+        if sensors else np.empty((0, len(fields), hi - lo))
+    has_data = ~np.all(np.isnan(stacked[:, 0, :]), axis=1)
+    stacked = stacked[has_data]
+    sensor_keys = [s_id for s_id, keep in zip(sensors, has_data) if keep]
+    grids = {f: stacked[:, i, :] for i, f in enumerate(fields)}
+
+    slots = AGG_SLOTS[agg]
+    times = (first_bucket + np.arange((hi - lo) * slots) / slots) * bucket_size
+    times, matrix = finish_buckets(agg, grids, times)
+    return times, sensor_keys, matrix
+
+def aggregate_live(con, start, end, bucket_size, sensor_filter, agg):
+    """Buckets [start, end] on the global grid of `bucket_size`, bypassing the tile cache.
+
+    Used for the increments pushed over /ws/live: with the grid from grid_bucket_size(),
+    they line up with the buckets /api/data returned for the same window and width.
+    Returns (times, sensor_ids, matrix) like aggregate_sensor_data.
+    """
+    sensor_catalog = catalog_cache.get(con)
+    catalog = sensor_catalog.key_of
+    sensor_keys = sorted({catalog[name] for name in sensor_filter if name in catalog})
+    if sensor_filter and not sensor_keys:
+        return EMPTY_RESULT
+
+    first_bucket = int(np.floor(start / bucket_size))
+    num_buckets = int(np.floor(end / bucket_size)) - first_bucket + 1
+    grid_start = first_bucket * bucket_size
+    found, grids = query_buckets(con, sensor_catalog, grid_start, grid_start + num_buckets * bucket_size, bucket_size,
+                                 num_buckets, sensor_keys, agg, clamp_start=False)
+    grids = {f: g[:, :num_buckets] for f, g in grids.items()}
+
+    slots = AGG_SLOTS[agg]
+    times = (first_bucket + np.arange(num_buckets * slots) / slots) * bucket_size
+    times, matrix = finish_buckets(agg, grids, times)
+    sensor_ids, matrix = keys_to_names(found, matrix, catalog)
+    return times, sensor_ids, np.ascontiguousarray(matrix)
+
+def scan_grids(con, sensor_catalog, requests):
+    """Bucket aggregations for several grids, with one query per source and period.
+
+    Each request is (grid_start, bucket_size, num_buckets, sensor_keys, fields) on the
+    global grid. Requests that read the same table (raw samples or one rollup level) and
+    whose ranges overlap share a query: it scans the table once over the hull of their
+    ranges and joins every row to the requests it falls into. Returns (sensor_keys,
+    grids) per request like query_buckets, without the extra bucket at the end.
+    """
+    spans_by_level = {}
+    for i, (grid_start, bucket_size, num_buckets, _, _) in enumerate(requests):
+        level = pick_rollup_level(sensor_catalog.levels, bucket_size, grid_start)
+        spans_by_level.setdefault(level, []).append((grid_start, grid_start + num_buckets * bucket_size, i))
+
+    results = [None] * len(requests)
+    for level, spans in spans_by_level.items():
+        clusters = []
+        for lo, hi, i in sorted(spans):
+            if clusters and lo <= clusters[-1][1]:
+                clusters[-1][1] = max(clusters[-1][1], hi)
+                clusters[-1][2].append(i)
+            else:
+                clusters.append([lo, hi, [i]])
+
+        time_expr, avg_expr, extrema_expr = bucket_exprs(level)
+        for lo, hi, members in clusters:
+            if level is None:
+                source, table = "sensors", samples_between(sensor_catalog.compact, lo, hi)
+            else:
+                source = table = rollup_table(level)
+            fields = set().union(*(requests[i][4] for i in members))
+            exprs = ([f"{avg_expr} AS avg_val"] if "avg_val" in fields else []) + \
+                    ([extrema_expr] if "min_val" in fields else [])
+            keys = sorted(set().union(*(requests[i][3] for i in members)))
+            # Every sensor: skip the (potentially huge) IN list
+            key_filter = keys if len(keys) < len(sensor_catalog.keys) else None
+
+            where_clause = f"s.{time_expr} >= {lo!r} AND s.{time_expr} < {hi!r}"
+            where_clause += partition_terms(lo, hi, key_filter, alias="s.")
+            params = [members, [requests[i][0] for i in members],
+                      [requests[i][0] + requests[i][1] * requests[i][2] for i in members],
+                      [requests[i][1] for i in members],
+                      [i for i in members for _ in requests[i][3]], [k for i in members for k in requests[i][3]]]
+            if key_filter:
+                where_clause += f" AND s.sensor_key IN ({', '.join(['?'] * len(key_filter))})"
+                params += key_filter
+
+            query = f"""
+                WITH r AS (
+                    SELECT unnest(?::INTEGER[]) AS req, unnest(?::DOUBLE[]) AS lo, unnest(?::DOUBLE[]) AS hi,
+                           unnest(?::DOUBLE[]) AS bucket_size
+                ), rk AS (
+                    SELECT unnest(?::INTEGER[]) AS req, unnest(?::INTEGER[]) AS sensor_key
+                )
+                SELECT
+                    rk.req,
+                    CAST(FLOOR((s.{time_expr} - r.lo) / r.bucket_size) AS INTEGER) AS bucket_idx,
+                    s.sensor_key,
+                    {", ".join(exprs)},
+                    count(*) AS n_in
+                FROM {table} s
+                JOIN rk ON rk.sensor_key = s.sensor_key
+                JOIN r ON r.req = rk.req AND s.{time_expr} >= r.lo AND s.{time_expr} < r.hi
+                WHERE {where_clause}
+                GROUP BY rk.req, bucket_idx, s.sensor_key
+            """
+            log.debug(f"Source -> {source} ({len(members)} grids)")
+            cols = run_aggregation(con, query, params, source)
+
+            with stage("pivot"):
+                for i in members:
+                    num_buckets = requests[i][2]
+                    rows = (cols["req"] == i) & (cols["bucket_idx"] < num_buckets)
+                    found, sensor_idx = np.unique(cols["sensor_key"][rows], return_inverse=True)
+                    grids = {}
+                    for f in requests[i][4]:
+                        grid = np.full((len(found), num_buckets), np.nan)
+                        grid[sensor_idx, cols["bucket_idx"][rows]] = \
+                            np.ma.filled(np.ma.asarray(cols[f][rows], dtype=np.float64), np.nan)
+                        grids[f] = grid
+                    results[i] = (found.tolist(), grids)
+    return results
+
+def batch_sensor_data(con, viewports, neighbors):
+    """Aggregates several viewports (dicts of ids, start, end, width, agg; ids as names)
+    in one pass.
+
+    Each viewport is resolved like /api/data and put on the global tile grid. With
+    `neighbors`, its left and right neighbors (the windows one full width earlier and
+    later, at the same resolution) are added. Tiles already in tile_cache are reused. The
+    missing tiles of all viewports go to scan_grids together, so viewports over the same
+    period share one scan, and are cached for later /api/data requests.
+    Returns per viewport {"view": result, "left": ..., "right": ...}, each result a
+    (times, sensor_ids, matrix, bucket_size) tuple.
+    """
+    windows_of = ("view", "left", "right") if neighbors else ("view",)
+    with stage("range"):
+        sensor_catalog = catalog_cache.get(con)
+        catalog = sensor_catalog.key_of
+        plans = []
+        for vp in viewports:
+            start, end = vp["start"], vp["end"]
+            keys = sorted({catalog[name] for name in vp["ids"] if name in catalog})
+            if vp["ids"] and not keys:
+                plans.append(None)  # None of the requested sensors exist
+                continue
+            if start is None or end is None:
+                time_range = sensor_catalog.time_range(keys)
+                if time_range is None:
+                    plans.append(None)
+                    continue
+                start = start if start is not None else time_range[0]
+                end = end if end is not None else time_range[1]
+            if end <= start:
+                plans.append(None)
+                continue
+
+            exponent, bucket_size = grid_bucket_size(end - start, vp["width"] if vp["width"] > 0 else 1000)
+            first_bucket = int(np.floor(start / bucket_size))
+            last_bucket = int(np.floor(end / bucket_size))
+            n = last_bucket - first_bucket + 1
+            windows = {"view": (first_bucket, last_bucket), "left": (first_bucket - n, first_bucket - 1),
+                       "right": (last_bucket + 1, last_bucket + n)}
+            kind = "avg" if vp["agg"] == "avg" else "extrema"  # as in aggregate_tiled
+            plans.append((keys or sorted(catalog.values()), exponent, bucket_size, kind, vp["agg"],
+                          {w: windows[w] for w in windows_of}))
+
+    generation = tile_cache.generation  # before querying, see TileCache
+    with stage("cache"):
+        # Tiles per grid (resolution, kind), and per grid the sensors missing from each tile
+        tiles = {}
+        missing = {}
+        fields_of = {}
+        for plan in filter(None, plans):
+            sensors, exponent, bucket_size, kind, agg, windows = plan
+            fields_of[kind] = agg_fields(agg)
+            grid_tiles = tiles.setdefault((exponent, kind), {})
+            grid_missing = missing.setdefault((exponent, kind), {})
+            for first_bucket, last_bucket in windows.values():
+                for t in range(first_bucket // TILE_BUCKETS, last_bucket // TILE_BUCKETS + 1):
+                    for s_id in sensors:
+                        if (s_id, t) in grid_tiles or s_id in grid_missing.get(t, ()):
+                            continue
+                        tile = tile_cache.get((s_id, kind, exponent, t)) if tile_cache.max_bytes > 0 else None
+                        if tile is None:
+                            grid_missing.setdefault(t, set()).add(s_id)
+                        else:
+                            grid_tiles[(s_id, t)] = tile
+        record_tiles(sum(map(len, tiles.values())),
+                     sum(len(s_ids) for grid_missing in missing.values() for s_ids in grid_missing.values()))
+
+    # One request per contiguous run of missing tiles of each grid, all scanned together
+    runs = []
+    requests = []
+    for (exponent, kind), grid_missing in missing.items():
+        bucket_size = 2.0 ** exponent
+        fields = fields_of[kind]
+        for run_first, run_last in tile_runs(grid_missing):
+            run_sensors = sorted(set().union(*(grid_missing.get(t, ()) for t in range(run_first, run_last + 1))))
+            runs.append((exponent, kind, run_first, run_last, run_sensors))
+            requests.append((run_first * TILE_BUCKETS * bucket_size, bucket_size,
+                             (run_last - run_first + 1) * TILE_BUCKETS, run_sensors, fields))
+    for (exponent, kind, run_first, run_last, run_sensors), (found, grids) in zip(
+            runs, scan_grids(con, sensor_catalog, requests)):
+        store_tiles(tiles[(exponent, kind)], found, grids, run_sensors, run_first, run_last, fields_of[kind], kind,
+                    exponent, generation)
+
+    results = []
+    with stage("pivot"):
+        for plan in plans:
+            if plan is None:
+                results.append({w: (*EMPTY_RESULT, None) for w in windows_of})
+                continue
+            sensors, exponent, bucket_size, kind, agg, windows = plan
+            result = {}
+            for w, (first_bucket, last_bucket) in windows.items():
+                times, sensor_keys, matrix = assemble_tiles(tiles[(exponent, kind)], sensors, first_bucket,
+                                                            last_bucket, bucket_size, agg)
+                sensor_ids, matrix = keys_to_names(sensor_keys, matrix, catalog)
+                result[w] = (times, sensor_ids, np.ascontiguousarray(matrix), bucket_size)
+            results.append(result)
+    return results
+
+def plan_stream(con, start, end, width, sensor_filter):
+    """First step of format=ndjson: resolves the range and fixes the output grid.
+
+    Uses the global grid of grid_bucket_size(), so the buckets match what the tiled
+    path returns for the same window. Returns (sensor_catalog, name_of, chunks, first_bucket,
+    num_buckets, bucket_size), with `chunks` the selected keys in name order split into
+    STREAM_CHUNK_SENSORS-sized lists, or None when nothing matches.
+    """
+    resolved = resolve_range(con, start, end, sensor_filter)
+    if resolved is None or resolved[4] <= resolved[3]:
+        return None
+    sensor_catalog, catalog, sensor_keys, start, end = resolved
+
+    _, bucket_size = grid_bucket_size(end - start, width if width > 0 else 1000)
+    first_bucket = int(np.floor(start / bucket_size))
+    num_buckets = int(np.floor(end / bucket_size)) - first_bucket + 1
+    name_of = {k: n for n, k in catalog.items()}
+    keys = sorted(sensor_keys or catalog.values(), key=name_of.__getitem__)
+    chunks = [keys[i:i + STREAM_CHUNK_SENSORS] for i in range(0, len(keys), STREAM_CHUNK_SENSORS)]
+    return sensor_catalog, name_of, chunks, first_bucket, num_buckets, bucket_size
+
+def stream_chunk(con, sensor_catalog, keys, first_bucket, num_buckets, bucket_size, agg, name_of):
+    """Aggregates one chunk of sensors and returns one encoded NDJSON line per sensor with data.
+
+    The result is ordered by sensor and read in Arrow record batches, so only the rows of
+    the sensor being assembled are held at once; a sensor's line is built as soon as its
+    last row has been read.
+    """
+    grid_start = first_bucket * bucket_size
+    query, params, source = bucket_query(sensor_catalog, grid_start, grid_start + num_buckets * bucket_size, bucket_size,
+                                         keys, agg, clamp_start=False)
+    fields = agg_fields(agg)
+    with stage("sql"):
+        reader = con.execute(f"{query} ORDER BY sensor_key, bucket_idx", params).to_arrow_reader(STREAM_BATCH_ROWS)
+
+    lines = []
+    parts = []  # column slices of the sensor currently being read
+
+    def finish_sensor():
+        cols = {name: np.concatenate([p[name] for p in parts]) for name in parts[0]}
+        grids = {}
+        for f in fields:
+            grid = np.full((1, num_buckets + 1), np.nan)  # + the bucket starting exactly at the end
+            grid[0, cols["bucket_idx"]] = cols[f]
+            grid = grid[:, :num_buckets]
+            grids[f] = grid
+        line = encode_ndjson_line({"type": "series", "id": name_of[int(cols["sensor_key"][0])],
+                                   "data": grid_points(agg, grids)[0]})
+        record_payload(len(line))
+        lines.append(line)
+
+    batches = iter(reader)
+    while True:
+        with stage("fetch"):
+            batch = next(batches, None)
+        if batch is None:
+            break
+        with stage("pivot"):
+            # Nulls (no extremum) come out as NaN
+            cols = {name: batch.column(name).to_numpy(zero_copy_only=False) for name in batch.schema.names}
+            n_in = cols.pop("n_in")
+            record_rows(n_in.sum(), len(n_in), source)
+            sensor_col = cols["sensor_key"]
+            bounds = [0, *(np.flatnonzero(np.diff(sensor_col)) + 1), len(sensor_col)]
+            for lo, hi in zip(bounds, bounds[1:]):
+                if parts and parts[-1]["sensor_key"][0] != sensor_col[lo]:
+                    finish_sensor()
+                    parts.clear()
+                parts.append({name: col[lo:hi] for name, col in cols.items()})
+    if parts:
+        with stage("pivot"):
+            finish_sensor()
+    return lines
+
+def derived_series(con, expressions, start, end, width, agg):
+    """Evaluates derived-signal expressions (derived.py) and downsamples the results.
+
+    The sensors the expressions read are first resampled in SQL (bucket_query, so
+    coarse grids read rollups) onto a uniform analysis grid: a power-of-two fraction of
+    the output bucket, no finer than the sensors' own sampling interval and at most
+    DERIVED_MAX_SAMPLES long, including the lookback the rolling windows need before
+    `start` (HTTP 400 when that lookback alone doesn't fit at one sample per bucket).
+    The expressions run vectorized over that grid, and the result is reduced to the
+    global bucket grid /api/data uses. Returns (times, expression texts, matrix).
+    """
+    with stage("range"):
+        catalog = catalog_cache.get(con)
+        names = sorted(set().union(*(e.sensors for e in expressions)))
+        missing = [name for name in names if name not in catalog.key_of]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Unknown sensor(s): {', '.join(missing)}")
+        keys = [catalog.key_of[name] for name in names]
+
+        if start is None or end is None:
+            time_range = catalog.time_range(keys)
+            if time_range is None:
+                return EMPTY_RESULT
+            start = start if start is not None else time_range[0]
+            end = end if end is not None else time_range[1]
+        if end <= start:
+            return EMPTY_RESULT
+
+        _, bucket_size = grid_bucket_size(end - start, width if width > 0 else 1000)
+        first_bucket = int(np.floor(start / bucket_size))
+        num_buckets = int(np.floor(end / bucket_size)) - first_bucket + 1
+
+        rows = catalog.rows_of(keys)
+        with np.errstate(all="ignore"):
+            intervals = (catalog.last_ts[rows] - catalog.first_ts[rows]) / (catalog.row_count[rows] - 1)
+        intervals = intervals[np.isfinite(intervals) & (intervals > 0)]
+        native_step = intervals.min() if len(intervals) else bucket_size
+        lookback = max(e.lookback for e in expressions)
+        lookback_steps = max(e.lookback_steps for e in expressions)
+        grid_len = lambda per: num_buckets * per + int(np.ceil(lookback * per / bucket_size)) + lookback_steps
+        if grid_len(1) > DERIVED_MAX_SAMPLES:
+            # Even one sample per bucket doesn't fit: the windows reach too far back for this zoom
+            raise HTTPException(status_code=400, detail=(
+                f"Expression lookback needs {grid_len(1) - num_buckets} buckets of {bucket_size:g} s before start, "
+                f"at most {DERIVED_MAX_SAMPLES - num_buckets} fit; use shorter windows or zoom out"))
+        per_bucket = 1
+        while bucket_size / (per_bucket * 2) >= native_step and grid_len(per_bucket * 2) <= DERIVED_MAX_SAMPLES:
+            per_bucket *= 2
+        step = bucket_size / per_bucket
+        pad = int(np.ceil(lookback / step)) + lookback_steps
+        n_samples = pad + num_buckets * per_bucket
+        grid_start = first_bucket * bucket_size - pad * step
+
+    series = {}
+    if keys:
+        query, params, source = bucket_query(catalog, grid_start, grid_start + n_samples * step, step, keys,
+                                             "avg", clamp_start=False)
+        cols = run_aggregation(con, query, params, source)
+        with stage("pivot"):
+            grid = np.full((len(keys), n_samples + 1), np.nan)
+            row_of = {k: i for i, k in enumerate(keys)}
+            grid[[row_of[k] for k in cols["sensor_key"].tolist()], cols["bucket_idx"]] = \
+                np.ma.filled(np.ma.asarray(cols["avg_val"], dtype=np.float64), np.nan)
+            series = {name: grid[i, :n_samples] for i, name in enumerate(names)}
+
+    with stage("compute"):
+        values = np.stack([e.evaluate(series, step, pad)[pad:] if series else
+                           np.broadcast_to(e.evaluate({}, step), (n_samples,))[pad:] for e in expressions])
+        sample_times = first_bucket * bucket_size + np.arange(num_buckets * per_bucket) * step
+        slots = AGG_SLOTS[agg]
+        times = (first_bucket + np.arange(num_buckets * slots) / slots) * bucket_size
+        times, matrix = finish_buckets(agg, bucket_reduce(sample_times, values, per_bucket, agg), times)
+    return times, [e.text for e in expressions], np.ascontiguousarray(matrix)
+
+def similar_sensors(con, name, start, end, k):
+    """The `k` sensors whose shape over [start, end] is closest to sensor `name`'s
+    (z-normalized distance, see similarity.py).
+
+    Sketch stage: the query's sketch against every sensor's, resampled onto the window
+    in NumPy. The closest max(SIMILAR_SHORTLIST * k, SIMILAR_MIN_SHORTLIST) go on to the
+    exact stage, which compares bucket averages read with bucket_query (up to
+    SIMILAR_EXACT_POINTS buckets, no finer than the query sensor's sampling; rollups
+    when coarse enough). A window spanning only a few of the query's sketch segments is
+    below what the sketches resolve, so then every sensor goes to the exact stage.
+    """
+    with stage("range"):
+        catalog = catalog_cache.get(con)
+        index = sketch_cache.get(con)
+        if name not in catalog.key_of:
+            raise HTTPException(status_code=404, detail=f"Unknown sensor: {name}")
+        key = catalog.key_of[name]
+        row = index.row_of(key)
+        if row is None:
+            raise HTTPException(status_code=404, detail=f"No sketch for {name} yet - re-run ingest_csv.py")
+        start = float(index.starts[row]) if start is None else start
+        end = float(index.ends[row]) if end is None else end
+        if end <= start:
+            raise HTTPException(status_code=400, detail="end must be after start")
+
+    with stage("compute"):
+        sketch_dist = sketch_distances(index, row, start, end)
+        sketch_dist[row] = np.inf
+        if index.segments_in(row, start, end) < MIN_OVERLAP:
+            candidates = np.delete(np.arange(len(index)), row)
+        else:
+            candidates = shortlist(sketch_dist, max(SIMILAR_SHORTLIST * k, SIMILAR_MIN_SHORTLIST))
+    result = {"sensor": name, "start": start, "end": end, "candidates": len(candidates), "results": []}
+    if not len(candidates):
+        return result
+
+    keys = [key] + index.keys[candidates].tolist()
+    q_row = catalog.rows_of([key])
+    interval = (catalog.last_ts[q_row] - catalog.first_ts[q_row]) / np.maximum(catalog.row_count[q_row] - 1, 1)
+    step = max((end - start) / SIMILAR_EXACT_POINTS, float(interval[0]) if np.isfinite(interval[0]) else 0.0)
+    query, params, source = bucket_query(catalog, start, end, step, keys, "avg", clamp_start=False)
+    cols = run_aggregation(con, query, params, source)
+    with stage("pivot"):
+        grid = np.full((len(keys), int(np.floor((end - start) / step)) + 2), np.nan)
+        row_of = {k: i for i, k in enumerate(keys)}
+        grid[[row_of[k] for k in cols["sensor_key"].tolist()], cols["bucket_idx"]] = \
+            np.ma.filled(np.ma.asarray(cols["avg_val"], dtype=np.float64), np.nan)
+
+    with stage("compute"):
+        exact = distances(grid[0], grid[1:])
+        for i in shortlist(exact, k):
+            r = candidates[i]
+            result["results"].append({
+                "sensor": catalog.name_of.get(int(index.keys[r])), "distance": exact[i],
+                "sketch_distance": sketch_dist[r],  # inf (null) if the sketches don't overlap enough
+                **{stat: col[r] for stat, col in index.stats.items()},
             })
-            
-        return {
-            "time": times,
-            "series": series_list
-        }
-        
+    return result
+
+# Cell aggregates for /api/heatmap: (raw rows, rollup rows). `norm(x)` maps a value to the
+# sensor's [0, 1] range from sensor_catalog; identity when not normalizing per sensor.
+HEATMAP_AGGS = {
+    "avg": ("avg({norm_value})", "sum({norm_sum}) / sum(cnt)"),
+    "min": ("min({norm_value})", "min({norm_min})"),
+    "max": ("max({norm_value})", "max({norm_max})"),
+}
+HEATMAP_NORMALIZE = ("sensor", "global", "none")
+
+def query_heatmap(con, start, end, width, height, sensor_filter, agg, normalize):
+    """Bins the selected sensors into a (rows, width) grid in one aggregation query.
+
+    Sensors are ordered by name; with more sensors than `height`, consecutive sensors
+    share a row. normalize="sensor" scales every value to its sensor's lifetime
+    min/max (from the catalog) before binning, so colors are comparable across
+    sensors and stable while panning; "global" scales the finished grid to its own
+    min/max; "none" keeps raw values.
+    Returns (grid, names, row_start, start, end): `row_start[r]` is the index in `names`
+    of row r's first sensor.
+    """
+    with stage("range"):
+        catalog = catalog_cache.get(con)
+        keys = [catalog.key_of[name] for name in sensor_filter if name in catalog.key_of]
+        selected = catalog.rows_of(keys)
+        if (sensor_filter and not keys) or not len(selected):
+            return np.empty((0, 0)), [], [], start, end
+
+        if start is None or end is None:
+            time_range = catalog.time_range(keys)
+            if time_range is None:
+                return np.empty((0, 0)), [], [], start, end
+            start = start if start is not None else time_range[0]
+            end = end if end is not None else time_range[1]
+    if end <= start:
+        return np.empty((0, 0)), [], [], start, end
+
+    names = [catalog.names[i] for i in selected]
+    n_sensors = len(names)
+    n_rows = min(height, n_sensors) if height > 0 else n_sensors
+    width = width if width > 0 else 1000
+    rows = np.arange(n_sensors) * n_rows // n_sensors
+    bucket_size = (end - start) / width
+
+    # Per-sensor row index and normalization, joined in as a small inline table
+    keys = catalog.keys[selected].tolist()
+    min_val, max_val = catalog.min_val[selected], catalog.max_val[selected]
+    if normalize == "sensor":
+        lo = np.nan_to_num(min_val, nan=0.0).tolist()
+        span = np.where(np.isnan(min_val) | (max_val == min_val), 1.0, max_val - min_val).tolist()
+    else:
+        lo, span = [0.0] * n_sensors, [1.0] * n_sensors
+
+    level = pick_rollup_level(catalog.levels, bucket_size, start)
+    raw_expr, rollup_expr = HEATMAP_AGGS[agg]
+    if level is None:
+        source, time_expr = "sensors", "ts"
+        table = samples_between(catalog.compact, start, end)
+        cell_expr = raw_expr.format(norm_value="(s.value - m.lo) / m.span")
+    else:
+        source = table = rollup_table(level)
+        time_expr = "bucket"
+        cell_expr = rollup_expr.format(norm_sum="(s.sum_val - s.cnt * m.lo) / m.span",
+                                       norm_min="(s.min_val - m.lo) / m.span", norm_max="(s.max_val - m.lo) / m.span")
+    where_clause = f"s.{time_expr} >= {start:.6f} AND s.{time_expr} <= {end:.6f}"
+    where_clause += partition_terms(start, end, keys if sensor_filter else None, alias="s.")
+    params = [keys, rows.tolist(), lo, span]
+    if sensor_filter:
+        # Literal key list so the scan can prune row groups by sensor_key
+        where_clause += f" AND s.sensor_key IN ({', '.join(['?'] * len(keys))})"
+        params += keys
+
+    query = f"""
+        WITH m AS (
+            SELECT unnest(?::INTEGER[]) AS sensor_key, unnest(?::INTEGER[]) AS row_idx,
+                   unnest(?::DOUBLE[]) AS lo, unnest(?::DOUBLE[]) AS span
+        )
+        SELECT
+            m.row_idx,
+            CAST(LEAST(GREATEST(FLOOR((s.{time_expr} - {start:.6f}) / {bucket_size:.6f}), 0), {width - 1}) AS INTEGER) AS col_idx,
+            {cell_expr} AS v,
+            count(*) AS n_in
+        FROM {table} s JOIN m USING (sensor_key)
+        WHERE {where_clause}
+        GROUP BY 1, 2
+    """
+    log.debug(f"Heatmap Source -> {source} ({n_rows}x{width}, bucket {bucket_size:.3f}s)")
+    cols = run_aggregation(con, query, params, source)
+
+    with stage("pivot"):
+        grid = np.full((n_rows, width), np.nan)
+        grid[cols["row_idx"], cols["col_idx"]] = np.ma.filled(np.ma.asarray(cols["v"], dtype=np.float64), np.nan)
+        if normalize == "global" and not np.all(np.isnan(grid)):
+            g_min, g_max = np.nanmin(grid), np.nanmax(grid)
+            grid = (grid - g_min) / ((g_max - g_min) or 1.0)
+
+        row_start = np.searchsorted(rows, np.arange(n_rows)).tolist()
+        return grid, names, row_start, start, end
+
+def render_sensor_data(times, sensor_ids, matrix, agg, fmt):
+    with stage("serialize"):
+        # Binary formats skip JSON entirely (see encoding.py for the layouts)
+        if fmt == "f64":
+            content = encode_f64(times, sensor_ids, matrix, {"agg": agg})
+        elif fmt == "arrow":
+            content = encode_arrow(times, sensor_ids, matrix, {"agg": agg})
+        else:
+            series_list = [{"id": s_id, "data": matrix[i]} for i, s_id in enumerate(sensor_ids)]
+            content = encode_json({
+                "time": times,
+                "series": series_list,
+                "agg": agg
+            })
+    record_payload(len(content))
+    return Response(content=content, media_type=FORMATS[fmt])
+
+async def execute_timed(request, timer, run_query, client, gen):
+    """Runs run_query(ticket) on the data executor under `timer` and returns its result.
+
+    Maps executor/pool errors to HTTP statuses. A failed run is recorded in the metrics
+    right away; after a successful one the caller calls timer.finish().
+    """
+    def timed(ticket):
+        with timer.activate():
+            return run_query(ticket)
+
+    status = 500
+    try:
+        client_key = client or (request.client.host if request.client else "anonymous")
+        result = await data_executor.run(timed, client_key, gen, request.is_disconnected)
+        status = 200
+        return result
+    except QueryCancelled as e:
+         status = 409
+         raise HTTPException(status_code=409, detail=f"Query cancelled: {e}")
+    except QueueFull as e:
+         status = 429 if e.per_client else 503
+         raise HTTPException(status_code=status, detail=str(e))
+    except PoolTimeout as e:
+         status = 503
+         raise HTTPException(status_code=503, detail=str(e))
+    except HTTPException as e:
+         status = e.status_code
+         raise
     except Exception as e:
-         print(f"Error: {e}")
+         log.exception(f"Error: {e}")
          raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if status != 200:
+            timer.finish(status)
+
+async def run_timed_query(request, timer, run_query, client, gen):
+    """Runs run_query(ticket) via execute_timed, records the request in the metrics and
+    adds a Server-Timing header. With timer.explain, the response is the timer's JSON
+    report (stage timings, row counts and DuckDB's EXPLAIN ANALYZE profiles) instead.
+    """
+    response = await execute_timed(request, timer, run_query, client, gen)
+    timer.finish(200)
+
+    if timer.explain:
+        response = Response(content=encode_json(timer.report()), media_type=FORMATS["json"])
+    response.headers["Server-Timing"] = timer.server_timing()
+    return response
+
+@app.get("/api/data")
+async def get_sensor_data(request: Request, start: float = None, end: float = None, width: int = 1000, ids: str = "",
+                          agg: str = "avg", fmt: str = Query(None, alias="format"), accept: str = Header(None),
+                          client: str = None, gen: int = None, explain: bool = False):
+    """Aggregated series for the selected sensors.
+
+    Runs on the bounded data_executor. `client` + `gen` identify a dashboard and its
+    request generation: a newer generation interrupts older in-flight queries from the
+    same client, and queries whose HTTP client disconnected are interrupted too.
+    `explain=1` returns the stage timings and DuckDB profiles instead of the data.
+    `format=ndjson` streams the result one sensor per line (see stream_sensor_data).
+    """
+    if agg not in AGG_SLOTS:
+        raise HTTPException(status_code=400, detail=f"Unknown agg '{agg}'. Use one of: {', '.join(AGG_SLOTS)}")
+    fmt = negotiate_format(fmt, accept)
+    if fmt not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format '{fmt}'. Use one of: {', '.join(FORMATS)}")
+
+    sensor_filter = parse_ids(ids)
+    log.debug(f"Request Params -> Width: {width}, Sensors: {len(sensor_filter)}, Agg: {agg}")
+    if fmt == "ndjson":
+        if not explain:
+            return await stream_sensor_data(request, start, end, width, sensor_filter, agg, client, gen)
+        fmt = "json"  # explain answers with the report, not the data
+
+    def run_query(ticket):
+        with get_db_connection() as con, ticket.attached(con):
+            times, sensor_ids, matrix = aggregate_sensor_data(con, start, end, width, sensor_filter, agg)
+        return render_sensor_data(times, sensor_ids, matrix, agg, fmt)
+
+    return await run_timed_query(request, RequestTimer("data", explain), run_query, client, gen)
+
+async def stream_sensor_data(request, start, end, width, sensor_filter, agg, client, gen):
+    """format=ndjson: /api/data as a stream of NDJSON records.
+
+        {"type": "meta", "agg": ..., "time": [...], "bucket": ..., "sensors": n}
+        {"type": "series", "id": "...", "data": [...]}      one per sensor with data, name order
+        {"type": "end", "sensors": n, "timings_ms": {...}, "rows_scanned": ..., "payload_bytes": ...}
+
+    (or {"type": "error", "status": ..., "detail": ...} if a chunk fails). The range is
+    resolved up front, then every chunk of STREAM_CHUNK_SENSORS sensors is its own job on
+    data_executor, so the first series arrive after one small query, peak memory stays at
+    one chunk, and a newer generation from the same client still stops the stream.
+    Server-Timing only covers the planning step; the full timings are in the end record.
+    """
+    timer = RequestTimer("data")
+
+    def run_plan(ticket):
+        with get_db_connection() as con, ticket.attached(con):
+            return plan_stream(con, start, end, width, sensor_filter)
+
+    plan = await execute_timed(request, timer, run_plan, client, gen)
+    server_timing = timer.server_timing()
+
+    async def body():
+        if plan is None:
+            yield encode_ndjson_line({"type": "meta", "agg": agg, "time": [], "sensors": 0})
+            yield encode_ndjson_line({"type": "end", "sensors": 0})
+            timer.finish(200)
+            return
+        sensor_catalog, name_of, chunks, first_bucket, num_buckets, bucket_size = plan
+        slots = AGG_SLOTS[agg]
+        times = (first_bucket + np.arange(num_buckets * slots) / slots) * bucket_size
+        yield encode_ndjson_line({"type": "meta", "agg": agg, "time": times, "bucket": bucket_size,
+                                  "sensors": sum(len(keys) for keys in chunks)})
+
+        sent = 0
+        for keys in chunks:
+            def run_chunk(ticket, keys=keys):
+                with get_db_connection() as con, ticket.attached(con):
+                    return stream_chunk(con, sensor_catalog, keys, first_bucket, num_buckets, bucket_size, agg, name_of)
+            try:
+                lines = await execute_timed(request, timer, run_chunk, client, gen)
+            except HTTPException as e:
+                # Headers are out already; the failure goes into the stream instead
+                yield encode_ndjson_line({"type": "error", "status": e.status_code, "detail": e.detail})
+                return
+            sent += len(lines)
+            if lines:
+                yield b"".join(lines)
+
+        report = timer.report()
+        yield encode_ndjson_line({"type": "end", "sensors": sent, "timings_ms": report["timings_ms"],
+                                  "total_ms": report["total_ms"], "rows_scanned": report["rows_scanned"],
+                                  "payload_bytes": report["payload_bytes"]})
+        timer.finish(200)
+
+    return StreamingResponse(body(), media_type=FORMATS["ndjson"], headers={"Server-Timing": server_timing})
+
+def parse_viewport(i, vp):
+    """Validates viewport `i` of a /api/data/batch body; ids may be a list or a
+    comma-separated string as in /api/data."""
+    if not isinstance(vp, dict):
+        raise HTTPException(status_code=400, detail=f"viewports[{i}] must be an object")
+    ids = vp.get("ids") or []
+    ids = parse_ids(ids) if isinstance(ids, str) else ids
+    start, end, width, agg = vp.get("start"), vp.get("end"), vp.get("width", 1000), vp.get("agg", "avg")
+    if not isinstance(ids, list) or not all(isinstance(name, str) for name in ids):
+        raise HTTPException(status_code=400, detail=f"viewports[{i}].ids must be sensor names")
+    if any(v is not None and (not isinstance(v, (int, float)) or isinstance(v, bool)) for v in (start, end)):
+        raise HTTPException(status_code=400, detail=f"viewports[{i}].start/end must be numbers")
+    if not isinstance(width, int) or isinstance(width, bool):
+        raise HTTPException(status_code=400, detail=f"viewports[{i}].width must be an integer")
+    if agg not in AGG_SLOTS:
+        raise HTTPException(status_code=400, detail=f"Unknown agg '{agg}'. Use one of: {', '.join(AGG_SLOTS)}")
+    return {"ids": [name.strip() for name in ids if name.strip()], "start": start, "end": end, "width": width,
+            "agg": agg}
+
+@app.post("/api/data/batch")
+async def get_sensor_data_batch(request: Request, client: str = None, gen: int = None, explain: bool = False):
+    """Several /api/data viewports in one call, e.g. every panel of a dashboard:
+
+        {"viewports": [{"ids": [...], "start": ..., "end": ..., "width": 1000, "agg": "avg"}, ...],
+         "neighbors": false}
+
+    Answers {"viewports": [{"agg", "bucket", "time", "series"}, ...]} in request order,
+    on the same global grid as the tiled /api/data. With `neighbors`, each viewport also
+    carries "left" and "right" ({"time", "series"}): the windows one full width to either
+    side, so the first pan needs no round trip. Viewports over the same period share one
+    scan (see batch_sensor_data). Runs on the data_executor like /api/data, JSON only.
+    """
+    try:
+        body = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body must be JSON: {\"viewports\": [...]}")
+    viewports = body.get("viewports") if isinstance(body, dict) else None
+    if not isinstance(viewports, list) or not viewports:
+        raise HTTPException(status_code=400, detail="Pass at least one viewport in \"viewports\"")
+    if len(viewports) > BATCH_MAX_VIEWPORTS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_VIEWPORTS} viewports per request")
+    viewports = [parse_viewport(i, vp) for i, vp in enumerate(viewports)]
+    neighbors = bool(body.get("neighbors"))
+    log.debug(f"Request Params -> Viewports: {len(viewports)}, Neighbors: {neighbors}")
+
+    def run_query(ticket):
+        with get_db_connection() as con, ticket.attached(con):
+            results = batch_sensor_data(con, viewports, neighbors)
+        with stage("serialize"):
+            payload = []
+            for vp, windows in zip(viewports, results):
+                entry = {"agg": vp["agg"], "bucket": windows["view"][3]}
+                for w, (times, sensor_ids, matrix, _) in windows.items():
+                    series = {"time": times,
+                              "series": [{"id": s_id, "data": matrix[i]} for i, s_id in enumerate(sensor_ids)]}
+                    if w == "view":
+                        entry.update(series)
+                    else:
+                        entry[w] = series
+                payload.append(entry)
+            content = encode_json({"viewports": payload})
+        record_payload(len(content))
+        return Response(content=content, media_type=FORMATS["json"])
+
+    return await run_timed_query(request, RequestTimer("batch", explain), run_query, client, gen)
+
+@app.get("/api/derived")
+async def get_derived(request: Request, expr: list[str] = Query([]), start: float = None, end: float = None,
+                      width: int = 1000, agg: str = "avg", fmt: str = Query(None, alias="format"),
+                      accept: str = Header(None), client: str = None, gen: int = None, explain: bool = False):
+    """Derived signals computed next to the data, in the same shape as /api/data.
+
+    Every `expr` (repeatable) is an expression over sensors, e.g.
+    `s("signal_0001.csv") - s("signal_0002.csv")` or `rolling_std(s("signal_0003.csv"), 60)`
+    (see derived.py for the functions); its text is the series id. Runs on the
+    data_executor like /api/data, with the same agg/format/client/gen/explain options
+    (format=ndjson answers with json).
+    """
+    if agg not in AGG_SLOTS:
+        raise HTTPException(status_code=400, detail=f"Unknown agg '{agg}'. Use one of: {', '.join(AGG_SLOTS)}")
+    fmt = negotiate_format(fmt, accept)
+    if fmt not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format '{fmt}'. Use one of: {', '.join(FORMATS)}")
+    fmt = "json" if fmt == "ndjson" else fmt
+    if not expr:
+        raise HTTPException(status_code=400, detail="Pass at least one expr=")
+    if len(expr) > DERIVED_MAX_EXPRESSIONS:
+        raise HTTPException(status_code=400, detail=f"At most {DERIVED_MAX_EXPRESSIONS} expressions per request")
+    try:
+        expressions = [Expression(text) for text in expr]
+    except ExpressionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    def run_query(ticket):
+        with get_db_connection() as con, ticket.attached(con):
+            times, series_ids, matrix = derived_series(con, expressions, start, end, width, agg)
+        return render_sensor_data(times, series_ids, matrix, agg, fmt)
+
+    return await run_timed_query(request, RequestTimer("derived", explain), run_query, client, gen)
+
+@app.get("/api/similar")
+async def get_similar(request: Request, id: str = "", start: float = None, end: float = None, k: int = 10,
+                      client: str = None, gen: int = None, explain: bool = False):
+    """Sensors that move like sensor `id` over [start, end] (its whole range by default),
+    the closest `k` first: {sensor, start, end, candidates, results: [{sensor, distance,
+    sketch_distance, mean, std, min_val, max_val, slope}]}. Distances are z-normalized
+    (0 = same shape, ~1.41 = unrelated, 2 = mirror image); the stats are the sensor's
+    over its whole range. Runs on the data_executor like /api/data.
+    """
+    if not id.strip():
+        raise HTTPException(status_code=400, detail="Pass the sensor to compare with as id=")
+    k = max(1, min(k, SIMILAR_MAX_K))
+
+    def run_query(ticket):
+        with get_db_connection() as con, ticket.attached(con):
+            result = similar_sensors(con, id.strip(), start, end, k)
+        with stage("serialize"):
+            content = encode_json(result)
+        record_payload(len(content))
+        return Response(content=content, media_type=FORMATS["json"])
+
+    return await run_timed_query(request, RequestTimer("similar", explain), run_query, client, gen)
+
+@app.get("/api/heatmap")
+async def get_heatmap(request: Request, start: float = None, end: float = None, width: int = 1000, height: int = 0,
+                      ids: str = "", agg: str = "avg", normalize: str = "sensor", dtype: str = "uint8",
+                      client: str = None, gen: int = None, explain: bool = False):
+    """Sensors-by-time overview grid as one packed buffer (see encoding.encode_grid).
+
+    Rows are sensors (grouped when there are more than `height`, 0 = one row each),
+    columns are `width` time buckets between start and end. uint8 cells need a
+    normalized grid, so normalize=none is served as global with dtype=uint8.
+    """
+    if agg not in HEATMAP_AGGS:
+        raise HTTPException(status_code=400, detail=f"Unknown agg '{agg}'. Use one of: {', '.join(HEATMAP_AGGS)}")
+    if normalize not in HEATMAP_NORMALIZE:
+        raise HTTPException(status_code=400, detail=f"Unknown normalize '{normalize}'. Use one of: {', '.join(HEATMAP_NORMALIZE)}")
+    if dtype not in GRID_DTYPES:
+        raise HTTPException(status_code=400, detail=f"Unknown dtype '{dtype}'. Use one of: {', '.join(GRID_DTYPES)}")
+    if dtype == "uint8" and normalize == "none":
+        normalize = "global"
+
+    sensor_filter = parse_ids(ids)
+
+    def run_query(ticket):
+        with get_db_connection() as con, ticket.attached(con):
+            grid, names, row_start, t_start, t_end = query_heatmap(
+                con, start, end, width, height, sensor_filter, agg, normalize)
+        meta = {"agg": agg, "normalize": normalize, "start": t_start, "end": t_end,
+                "ids": names, "row_start": row_start}
+        with stage("serialize"):
+            content = encode_grid(grid, dtype, meta)
+        record_payload(len(content))
+        return Response(content=content, media_type=GRID_MEDIA_TYPE)
+
+    return await run_timed_query(request, RequestTimer("heatmap", explain), run_query, client, gen)
+
+@app.get("/api/metrics")
+def get_metrics():
+    """Prometheus text format: per-stage latency, rows and payload histograms for
+    /api/data and /api/heatmap, plus the pool/executor/cache/live stats as gauges."""
+    gauges = {"executor": data_executor.stats(), "cache": tile_cache.stats(), "catalog_cache": catalog_cache.stats(),
+              "live": live_writer.stats()}
+    if db_pool is not None:
+        gauges["pool"] = db_pool.stats()
+    return Response(content=render_prometheus(gauges), media_type=PROMETHEUS_MEDIA_TYPE)
+
+@app.post("/api/ingest")
+async def ingest_stream(request: Request, precision: str = "s"):
+    """Streams samples into the live write buffer.
+
+    The body (chunked is fine) is line protocol, one sample per line:
+    `<sensor> <value> [<timestamp>]`, timestamp in `precision` units (s/ms/us/ns) since
+    the epoch, defaulting to the arrival time. Rows become queryable after the next
+    micro-batch flush (LIVE_FLUSH_INTERVAL).
+    """
+    if not LIVE_INGEST:
+        raise HTTPException(status_code=403, detail="Live ingest is disabled (LIVE_INGEST=0 or STORAGE_MODE=parquet)")
+    if precision not in PRECISIONS:
+        raise HTTPException(status_code=400, detail=f"Unknown precision '{precision}'. Use one of: {', '.join(PRECISIONS)}")
+    scale = PRECISIONS[precision]
+
+    accepted = 0
+    bad_lines = []
+    rest = b""
+    
+    def take(text):
+        nonlocal accepted
+        rows, bad = parse_lines(text, time.time(), scale)
+        try:
+            live_writer.append(rows)
+        except BufferFull as e:
+            raise HTTPException(status_code=503, detail=f"{e}. Accepted {accepted} rows before that.")
+        accepted += len(rows)
+        bad_lines.extend(bad)
+
+    # Only complete lines are parsed; a line split across chunks waits for the next one
+    async for chunk in request.stream():
+        rest += chunk
+        cut = rest.rfind(b"\n")
+        if cut >= 0:
+            take(rest[:cut].decode("utf-8", errors="replace"))
+            rest = rest[cut + 1:]
+    if rest:
+        take(rest.decode("utf-8", errors="replace"))
+
+    return {"accepted": accepted, "rejected": len(bad_lines), "errors": bad_lines[:10], "pending": live_writer.pending}
+
+@app.post("/api/ingest-csv", status_code=202)
+async def ingest_csv_upload(request: Request, name: str = None):
+    """Uploads one CSV file into the database as sensor `name` (default: the file name).
+
+    The body is either the raw file (chunked is fine; `name` required) or
+    multipart/form-data with a `file` field. Either way it is spooled to DATA_DIR as it
+    arrives (the multipart body is parsed as a stream, see csv_upload.MultipartFile), then
+    ingested in the background with the column mapping of ingest_csv.py. Returns the job;
+    poll GET /api/ingest-csv/{id} for its progress.
+    """
+    if not UPLOADS_ENABLED:
+        raise HTTPException(status_code=403, detail="Uploads need a writable database (LIVE_INGEST=1 or STORAGE_MODE=parquet)")
+
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        try:
+            chunks = MultipartFile(request.stream(), content_type)
+            name = name or await chunks.start()
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        total = None  # the part's size isn't known before its end
+    else:
+        length = request.headers.get("content-length")
+        total = int(length) if length and length.isdigit() else None
+        chunks = request.stream()
+    try:
+        sensor = sensor_name_for(name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    job = upload_manager.create(sensor, total)
+    try:
+        await upload_manager.receive(job, chunks, lambda f, chunk: asyncio.to_thread(f.write, chunk))
+    except ValueError as e:
+        # A malformed multipart body; receive() has marked the job failed
+        raise HTTPException(status_code=400, detail=str(e))
+    upload_manager.submit(job)
+    return job.to_dict()
+
+@app.get("/api/ingest-csv")
+def list_csv_uploads():
+    """Recent uploads, newest first."""
+    return {"jobs": [job.to_dict() for job in upload_manager.jobs()]}
+
+@app.get("/api/ingest-csv/{job_id}")
+def get_csv_upload(job_id: int):
+    """Progress of one upload: `stage` goes receiving -> queued -> loading -> rollups ->
+    events -> done (or failed, with `error`)."""
+    job = upload_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown upload {job_id}")
+    return job.to_dict()
+
+@app.websocket("/ws/live")
+async def live_socket(websocket: WebSocket):
+    """Pushes incremental buckets for subscribed sensors as live data arrives.
+
+    The client sends (and may resend) `{"ids": [...], "window": seconds, "width": px,
+    "agg": "avg"}`. After each flush touching those sensors (empty ids = all), it gets
+    an f64 frame (see encoding.py) with every bucket from the first one the new data
+    landed in (its start time in the header as `from`), on the same grid as /api/data
+    for that window and width. Pushes are at
+    most LIVE_PUSH_INTERVAL apart; flushes in between are merged into the next push.
+    """
+    await websocket.accept()
+    sub = live_hub.subscribe(asyncio.get_running_loop())
+    client_key = f"ws:{id(sub)}"
+
+    async def receive():
+        while True:
+            msg = await websocket.receive_text()
+            try:
+                sub.ids, sub.window, sub.width, sub.agg = parse_live_subscription(json.loads(msg))
+            except ValueError as e:
+                await websocket.send_json({"error": f"Invalid subscription: {e}"})
+
+    async def push():
+        while True:
+            await sub.event.wait()
+            since, latest = sub.take()
+            if since is None or sub.window is None:
+                continue
+            ids, agg = sorted(sub.ids), sub.agg
+            _, bucket_size = grid_bucket_size(sub.window, sub.width)
+            # The client only shows the trailing window; older changes aren't on screen
+            since = max(since, latest - sub.window)
+
+            def run_query(ticket):
+                with get_db_connection() as con, ticket.attached(con):
+                    return aggregate_live(con, since, latest, bucket_size, ids, agg)
+
+            try:
+                times, sensor_ids, matrix = await data_executor.run(run_query, client_key)
+            except (QueryCancelled, QueueFull, PoolTimeout) as e:
+                # Busy: keep the range and retry on the next tick
+                log.debug(f"Live push deferred -> {e}")
+                sub.notify(None, since, latest)
+            except Exception as e:
+                # This update is lost, but the subscription keeps going with the next flush
+                log.exception(f"Live push failed: {e}")
+                await websocket.send_json({"error": f"Live update failed: {e}"})
+            else:
+                if sensor_ids:
+                    first = float(np.floor(since / bucket_size) * bucket_size)
+                    await websocket.send_bytes(encode_f64(times, sensor_ids, matrix,
+                                                          {"agg": agg, "bucket": bucket_size, "from": first, "live": True}))
+            await asyncio.sleep(LIVE_PUSH_INTERVAL)
+
+    tasks = [asyncio.create_task(receive()), asyncio.create_task(push())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            exc = task.exception()
+            if exc is not None and not isinstance(exc, WebSocketDisconnect):
+                log.error(f"Live socket error: {exc!r}", exc_info=exc)
+                try:
+                    await websocket.send_json({"error": f"Live socket error: {exc}"})
+                    await websocket.close(code=1011)
+                except Exception:
+                    pass  # the socket itself is what failed
+    finally:
+        for task in tasks:
+            task.cancel()
+        live_hub.unsubscribe(sub)
+
+def parse_live_subscription(msg):
+    """(ids, window, width, agg) from a /ws/live subscribe message; ValueError if invalid."""
+    if not isinstance(msg, dict):
+        raise ValueError("Expected a JSON object with ids, window, width and agg")
+    ids = msg.get("ids") or []
+    if not isinstance(ids, list) or not all(isinstance(i, str) for i in ids):
+        raise ValueError("ids must be a list of sensor names")
+    agg = msg.get("agg", "avg")
+    if not isinstance(agg, str) or agg not in AGG_SLOTS:
+        raise ValueError(f"Unknown agg '{agg}'. Use one of: {', '.join(AGG_SLOTS)}")
+    window, width = msg.get("window", 300), msg.get("width", 1000)
+    if isinstance(window, bool) or not isinstance(window, (int, float)) or not 0 < window < np.inf:
+        raise ValueError("window must be a positive number of seconds")
+    if isinstance(width, bool) or not isinstance(width, (int, float)) or not 1 <= width <= LIVE_MAX_WIDTH:
+        raise ValueError(f"width must be between 1 and {LIVE_MAX_WIDTH}")
+    return set(ids), float(window), int(width), agg
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,221 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Histogram bucket bounds (Prometheus `le` labels)
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+BYTES_BUCKETS = (1_024, 10_240, 102_400, 1_048_576, 10_485_760, 104_857_600)
+
+# Request stages in Server-Timing order. Stages a request never entered are left out.
+STAGES = ("queue", "range", "cache", "sql", "fetch", "pivot", "compute", "serialize")
+
+PROMETHEUS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set, rendered in Prometheus text format."""
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        self._series = {}  # label tuple -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            i = bisect.bisect_left(self.buckets, value)  # first bound >= value
+            if i < len(self.buckets):
+                series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted(self._series.items())
+            items = [(key, list(series)) for key, series in items]
+        for key, series in items:
+            labels = ",".join(f'{k}="{v}"' for k, v in key)
+            sep = "," if labels else ""
+            cumulative = 0
+            for bound, n in zip(self.buckets, series):
+                cumulative += n
+                lines.append(f'{self.name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{labels}{sep}le="+Inf"}} {series[-1]}')
+            lines.append(f"{self.name}_sum{{{labels}}} {series[-2]}")
+            lines.append(f"{self.name}_count{{{labels}}} {series[-1]}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            labels = ",".join(f'{k}="{v}"' for k, v in key)
+            lines.append(f"{self.name}{{{labels}}} {value}")
+        return lines
+
+
+REQUESTS = Counter("sensor_api_requests_total", "Requests by endpoint and HTTP status.")
+STAGE_SECONDS = Histogram("sensor_api_stage_seconds", "Time spent per request stage (stage=total for the whole request).",
+                          SECONDS_BUCKETS)
+ROWS_SCANNED = Histogram("sensor_api_rows_scanned", "Rows (raw or rollup) fed into the aggregation per request.",
+                         COUNT_BUCKETS)
+ROWS_RETURNED = Histogram("sensor_api_rows_returned", "Aggregated rows returned by DuckDB per request.", COUNT_BUCKETS)
+PAYLOAD_BYTES = Histogram("sensor_api_payload_bytes", "Response body size per request.", BYTES_BUCKETS)
+
+
+def render_prometheus(gauges=None):
+    """All metrics in Prometheus text format. `gauges` maps a name prefix to a flat stats
+    dict (e.g. the pool's stats()); its numeric values are exported as gauges."""
+    lines = []
+    for metric in (REQUESTS, STAGE_SECONDS, ROWS_SCANNED, ROWS_RETURNED, PAYLOAD_BYTES):
+        lines += metric.render()
+    for prefix, stats in (gauges or {}).items():
+        for key, value in stats.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = f"sensor_api_{prefix}_{key}"
+            lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+    return "\n".join(lines) + "\n"
+
+
+_current = contextvars.ContextVar("request_timer", default=None)
+
+
+class RequestTimer:
+    """Per-request stage timings and row/byte counts.
+
+    The endpoint creates one and activates it in the worker thread; code further down
+    (query_buckets, render_sensor_data, ...) reports into it via the module-level
+    stage()/record_rows()/explain_query() helpers without passing it around.
+    """
+
+    def __init__(self, endpoint, explain=False):
+        self.endpoint = endpoint
+        self.explain = explain
+        self.created = time.perf_counter()
+        self.durations = {}
+        self.rows_scanned = 0
+        self.rows_returned = 0
+        self.payload_bytes = 0
+        self.sources = []
+        self.profiles = []
+        self.tile_hits = 0
+        self.tile_misses = 0
+
+    @contextmanager
+    def activate(self):
+        """Makes this the current timer. The first activation records the time since
+        creation as the queue stage; later ones (streamed chunks) just resume it."""
+        if "queue" not in self.durations:
+            self.add("queue", time.perf_counter() - self.created)
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+    def add(self, stage_name, seconds):
+        self.durations[stage_name] = self.durations.get(stage_name, 0.0) + seconds
+
+    def total(self):
+        return time.perf_counter() - self.created
+
+    def server_timing(self):
+        """Value for the Server-Timing response header (milliseconds)."""
+        parts = [f"{name};dur={self.durations[name] * 1000:.2f}" for name in STAGES if name in self.durations]
+        parts.append(f"total;dur={self.total() * 1000:.2f}")
+        if self.sources:
+            parts.append(f'source;desc="{",".join(sorted(set(self.sources)))}"')
+        return ", ".join(parts)
+
+    def report(self):
+        return {
+            "endpoint": self.endpoint,
+            "timings_ms": {name: round(self.durations[name] * 1000, 3) for name in STAGES if name in self.durations},
+            "total_ms": round(self.total() * 1000, 3),
+            "rows_scanned": self.rows_scanned,
+            "rows_returned": self.rows_returned,
+            "payload_bytes": self.payload_bytes,
+            "sources": self.sources,
+            # Tiles served from the cache run no query, so they have no profile below
+            "tile_cache": {"hits": self.tile_hits, "misses": self.tile_misses},
+            "queries": self.profiles,
+        }
+
+    def finish(self, status=200):
+        """Records this request into the Prometheus metrics."""
+        REQUESTS.inc(endpoint=self.endpoint, status=status)
+        if status != 200:
+            return
+        for name, seconds in self.durations.items():
+            STAGE_SECONDS.observe(seconds, endpoint=self.endpoint, stage=name)
+        STAGE_SECONDS.observe(self.total(), endpoint=self.endpoint, stage="total")
+        ROWS_SCANNED.observe(self.rows_scanned, endpoint=self.endpoint)
+        ROWS_RETURNED.observe(self.rows_returned, endpoint=self.endpoint)
+        PAYLOAD_BYTES.observe(self.payload_bytes, endpoint=self.endpoint)
+
+
+@contextmanager
+def stage(name):
+    """Adds the block's wall time to `name` on the active RequestTimer (no-op without one)."""
+    timer = _current.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timer is not None:
+            timer.add(name, time.perf_counter() - started)
+
+
+def record_rows(scanned, returned, source=None):
+    timer = _current.get()
+    if timer is not None:
+        timer.rows_scanned += int(scanned)
+        timer.rows_returned += int(returned)
+        if source is not None:
+            timer.sources.append(source)
+
+
+def record_tiles(hits, misses):
+    timer = _current.get()
+    if timer is not None:
+        timer.tile_hits += hits
+        timer.tile_misses += misses
+
+
+def record_payload(n_bytes):
+    timer = _current.get()
+    if timer is not None:
+        timer.payload_bytes += n_bytes
+
+
+def explain_query(con, query, params):
+    """With ?explain=1, re-runs `query` under EXPLAIN ANALYZE and keeps DuckDB's profile."""
+    timer = _current.get()
+    if timer is None or not timer.explain:
+        return
+    rows = con.execute(f"EXPLAIN ANALYZE {query}", params).fetchall()
+    timer.profiles.append({"sql": " ".join(query.split()), "profile": "\n".join(r[-1] for r in rows)})
@@ -0,0 +1,181 @@
+import datetime
+import glob
+import json
+import math
+import os
+import shutil
+import threading
+
+# Partition layout of the Parquet storage mode (STORAGE_MODE=parquet):
+#
+#   sensor_store/
+#     snapshot.json                                  current version: which files make up each table
+#     v7/sensors/date=2026-10-17/sensor_bucket=3/part_0.parquet
+#     v7/sensors_rollup_8s/date=2026-10-17/sensor_bucket=3/part_0.parquet
+#     v7/sensor_catalog.parquet                      small tables, one file per version
+#
+# Every ingest writes the sensor buckets it touched into a new v<N> directory and then
+# swaps snapshot.json (atomic rename), so readers always see a complete version and
+# new partitions show up while the API keeps serving.
+SNAPSHOT_FILE = "snapshot.json"
+SENSOR_BUCKET_SIZE = 64  # sensor keys per sensor_bucket= partition
+SECONDS_PER_DAY = 86400
+
+
+def day_of(ts):
+    """date= partition value (UTC day) of an epoch timestamp."""
+    return datetime.date(1970, 1, 1) + datetime.timedelta(days=math.floor(ts / SECONDS_PER_DAY))
+
+
+def sensor_bucket(sensor_key):
+    return sensor_key // SENSOR_BUCKET_SIZE
+
+
+def partition_filter(lo, hi, sensor_keys=None, alias=""):
+    """Extra WHERE terms on the hive partition columns for rows in [lo, hi] (epoch seconds).
+
+    DuckDB evaluates them against the file paths, so files outside the requested days
+    and sensor buckets are never opened. Returned with a leading " AND ".
+    """
+    terms = f" AND {alias}date BETWEEN DATE '{day_of(lo)}' AND DATE '{day_of(hi)}'"
+    if sensor_keys:
+        buckets = sorted({sensor_bucket(k) for k in sensor_keys})
+        terms += f" AND {alias}sensor_bucket IN ({', '.join(map(str, buckets))})"
+    return terms
+
+
+def sql_list(paths):
+    return "[" + ", ".join("'" + p.replace("'", "''") + "'" for p in paths) + "]"
+
+
+class ParquetStore:
+    """A versioned set of Parquet files standing in for the tables of sensor_data.duckdb.
+
+    Snapshot layout (snapshot.json):
+        {"version": 7,
+         "partitioned": {"sensors": {"<sensor_bucket>": [file, ...]}, "sensors_rollup_1s": {...}},
+         "tables": {"sensor_catalog": file, "ingest_manifest": file, "ingest_meta": file}}
+    with paths relative to the store directory. Partitioned tables are written per sensor
+    bucket, so an ingest only rewrites the buckets of the sensors it changed and carries
+    the other buckets' files over from the previous version.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+        self._mtime = None
+        self.version = None
+
+    def path(self, rel):
+        return os.path.join(self.root, rel)
+
+    def exists(self):
+        return os.path.exists(self.path(SNAPSHOT_FILE))
+
+    def read_snapshot(self):
+        if not self.exists():
+            return None
+        with open(self.path(SNAPSHOT_FILE)) as f:
+            return json.load(f)
+
+    # --- Reading (API) ---
+
+    def refresh(self, con):
+        """Points the views in `con` at the current snapshot if it changed since the last
+        call. Cheap enough to run per request (one stat). Returns True if it changed."""
+        try:
+            mtime = os.stat(self.path(SNAPSHOT_FILE)).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if mtime == self._mtime:
+            return False
+        with self._lock:
+            if mtime == self._mtime:
+                return False
+            snapshot = self.read_snapshot()
+            self.attach(con, snapshot)
+            self._mtime = mtime
+            changed = snapshot["version"] != self.version
+            self.version = snapshot["version"]
+            return changed
+
+    def attach(self, con, snapshot):
+        """Partitioned tables become views over their files (hive_partitioning adds the
+        `date` and `sensor_bucket` columns); the small tables are loaded into memory."""
+        # Files are immutable once written, so their footers can be cached across queries
+        con.execute("SET parquet_metadata_cache = true")
+        for table, buckets in snapshot["partitioned"].items():
+            files = [self.path(f) for bucket in sorted(buckets, key=int) for f in buckets[bucket]]
+            if files:
+                con.execute(f"CREATE OR REPLACE VIEW {table} AS "
+                            f"SELECT * FROM read_parquet({sql_list(files)}, hive_partitioning = true)")
+            else:
+                con.execute(f"DROP VIEW IF EXISTS {table}")
+        for table, rel in snapshot["tables"].items():
+            con.execute(f"CREATE OR REPLACE TABLE {table} AS SELECT * FROM read_parquet({sql_list([self.path(rel)])})")
+
+    # --- Writing (ingest_csv.py) ---
+
+    def new_version(self, snapshot):
+        """Next version number, with its directory cleared of leftovers from a failed run."""
+        version = snapshot["version"] + 1 if snapshot else 1
+        shutil.rmtree(self.path(f"v{version}"), ignore_errors=True)
+        return version
+
+    def load_tables(self, con, snapshot):
+        """Copies the small tables of `snapshot` into existing (empty) tables in `con`."""
+        for table, rel in snapshot["tables"].items():
+            con.execute(f"INSERT INTO {table} SELECT * FROM read_parquet({sql_list([self.path(rel)])})")
+
+    def write_partitions(self, con, table, time_col, version, bucket):
+        """Writes `table` (rows of one sensor bucket) as date= partitions of version
+        `version`. Returns the written files relative to the store."""
+        out = self.path(f"v{version}/{table}")
+        os.makedirs(out, exist_ok=True)
+        con.execute(f"""
+            COPY (
+                SELECT *, DATE '1970-01-01' + CAST(floor({time_col} / {SECONDS_PER_DAY}) AS INTEGER) AS date,
+                       {bucket} AS sensor_bucket
+                FROM {table}
+            ) TO '{out}' (FORMAT PARQUET, PARTITION_BY (date, sensor_bucket), OVERWRITE_OR_IGNORE,
+                          FILENAME_PATTERN 'part_{{i}}')
+        """)
+        files = glob.glob(os.path.join(out, "date=*", f"sensor_bucket={bucket}", "*.parquet"))
+        return sorted(os.path.relpath(f, self.root) for f in files)
+
+    def publish(self, con, version, partitioned, tables, previous=None):
+        """Writes the small `tables` from `con`, then makes `version` current.
+
+        Files only referenced by versions before `previous` are deleted afterwards;
+        `previous`'s own files are kept for queries that planned against it.
+        """
+        written = {}
+        for table in tables:
+            rel = f"v{version}/{table}.parquet"
+            os.makedirs(self.path(f"v{version}"), exist_ok=True)
+            con.execute(f"COPY {table} TO '{self.path(rel)}' (FORMAT PARQUET)")
+            written[table] = rel
+        snapshot = {"version": version, "partitioned": partitioned, "tables": written}
+
+        tmp = self.path(SNAPSHOT_FILE + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp, self.path(SNAPSHOT_FILE))
+        self.collect_garbage([snapshot] + ([previous] if previous else []))
+        return snapshot
+
+    def collect_garbage(self, keep):
+        """Deletes version files not referenced by any snapshot in `keep`."""
+        referenced = set()
+        for snapshot in keep:
+            referenced.update(snapshot["tables"].values())
+            for buckets in snapshot["partitioned"].values():
+                for files in buckets.values():
+                    referenced.update(files)
+        for path in glob.glob(self.path("v*/**/*.parquet"), recursive=True):
+            if os.path.relpath(path, self.root) not in referenced:
+                os.remove(path)
+        # Empty partition and version directories, deepest first
+        for dirpath, _, _ in sorted(os.walk(self.root), key=lambda w: -len(w[0])):
+            if dirpath != self.root and not os.listdir(dirpath):
+                os.rmdir(dirpath)
@@ -0,0 +1,186 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import duckdb
+
+
+class QueryCancelled(Exception):
+    """The query was interrupted because its client went away or sent a newer request."""
+
+
+class QueueFull(Exception):
+    """Admission refused. `per_client` tells a busy client apart from a busy server."""
+
+    def __init__(self, message, per_client=False):
+        super().__init__(message)
+        self.per_client = per_client
+
+
+class Ticket:
+    """One admitted query. Holds the cursor while it runs so it can be interrupted."""
+
+    def __init__(self, client, gen):
+        self.client = client
+        self.gen = gen
+        self.cancelled = False
+        self.reason = None
+        self.cursor = None
+        self._lock = threading.Lock()
+
+    def cancel(self, reason):
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            self.reason = reason
+            if self.cursor is not None:
+                self.cursor.interrupt()
+
+    @contextmanager
+    def attached(self, cursor):
+        """Makes `cursor` interruptible via cancel() for the duration of the block."""
+        with self._lock:
+            if self.cancelled:
+                raise QueryCancelled(self.reason)
+            self.cursor = cursor
+        try:
+            yield cursor
+        except duckdb.InterruptException as e:
+            raise QueryCancelled(self.reason or "interrupted") from e
+        finally:
+            with self._lock:
+                self.cursor = None
+
+
+class QueryExecutor:
+    """Bounded thread pool for DuckDB queries with admission control and cancellation.
+
+    - At most `workers` queries run at once and at most `max_queue` more wait for a
+      worker; anything beyond that is rejected instead of piling up threads.
+    - A client may have at most `max_per_client` queries admitted, so one user panning
+      rapidly cannot occupy every worker.
+    - A request carrying a generation number supersedes (interrupts) every older
+      generation from the same client.
+    - The awaiting coroutine polls for client disconnects and interrupts the query.
+    """
+
+    def __init__(self, workers=8, max_queue=32, max_per_client=4, poll_interval=0.05):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_per_client = max_per_client
+        self.poll_interval = poll_interval
+
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="duckdb-query")
+        self._lock = threading.Lock()
+        self._tickets = {}  # client -> set of admitted tickets
+
+        # Metrics
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.cancelled = 0
+        self.superseded = 0
+
+    def _admit(self, client, gen):
+        with self._lock:
+            mine = self._tickets.setdefault(client, set())
+
+            if gen is not None:
+                if any(t.gen is not None and t.gen > gen for t in mine):
+                    self.superseded += 1
+                    raise QueryCancelled(f"superseded by a newer request from {client}")
+                for t in list(mine):
+                    if t.gen is not None and t.gen < gen and not t.cancelled:
+                        t.cancel(f"superseded by generation {gen}")
+                        self.superseded += 1
+
+            active = [t for t in mine if not t.cancelled]
+            if len(active) >= self.max_per_client:
+                self.rejected += 1
+                raise QueueFull(f"Too many concurrent queries for client {client}", per_client=True)
+            if self.queued + self.running >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise QueueFull("Query queue is full")
+
+            ticket = Ticket(client, gen)
+            mine.add(ticket)
+            self.queued += 1
+            return ticket
+
+    def _release(self, ticket):
+        with self._lock:
+            mine = self._tickets.get(ticket.client)
+            if mine is not None:
+                mine.discard(ticket)
+                if not mine:
+                    del self._tickets[ticket.client]
+
+    def _run(self, ticket, fn):
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+        try:
+            if ticket.cancelled:
+                raise QueryCancelled(ticket.reason)
+            result = fn(ticket)
+            with self._lock:
+                self.completed += 1
+            return result
+        except QueryCancelled:
+            with self._lock:
+                self.cancelled += 1
+            raise
+        finally:
+            with self._lock:
+                self.running -= 1
+            self._release(ticket)
+
+    async def run(self, fn, client, gen=None, is_disconnected=None):
+        """Runs fn(ticket) on the pool and returns its result.
+
+        fn must wrap its DuckDB work in `ticket.attached(cursor)` to be interruptible.
+        If the awaiting task is cancelled (e.g. the server drops the request), the query
+        is interrupted too.
+        """
+        ticket = self._admit(client, gen)
+        future = asyncio.get_running_loop().run_in_executor(self._pool, self._run, ticket, fn)
+
+        try:
+            while True:
+                done, _ = await asyncio.wait({future}, timeout=self.poll_interval)
+                if done:
+                    return future.result()
+                if is_disconnected is not None and await is_disconnected():
+                    ticket.cancel("client disconnected")
+                    # Don't leave an unobserved exception behind once the worker notices
+                    future.add_done_callback(lambda f: f.exception())
+                    raise QueryCancelled(ticket.reason)
+        except asyncio.CancelledError:
+            ticket.cancel("request cancelled")
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            raise
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "max_per_client": self.max_per_client,
+                "queued": self.queued,
+                "running": self.running,
+                "clients": len(self._tickets),
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "cancelled": self.cancelled,
+                "superseded": self.superseded,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            for tickets in self._tickets.values():
+                for t in tickets:
+                    t.cancel("server shutting down")
+        self._pool.shutdown(wait=True)
@@ -0,0 +1,96 @@
+import numpy as np
+
+# Similarity search (/api/similar): which sensors move like this one over [start, end]?
+# Shapes are compared z-normalized, so offset and scale don't matter:
+#
+#   distance = RMS of the difference of the two z-normalized series = sqrt(2 * (1 - r))
+#
+# with r the Pearson correlation over the points both series have (0 = same shape,
+# sqrt(2) = unrelated, 2 = mirror image). Ranking is two-stage: every sensor's
+# sensor_sketch row (ingest_csv.build_sketches) is resampled onto SKETCH_POINTS points
+# of the window in one vectorized pass, and only the closest candidates are compared
+# again on finer buckets from the database (main.similar_sensors).
+SKETCH_POINTS = 128     # window points in the sketch stage
+MIN_OVERLAP = 8         # fewer common points than this is no match (distance inf)
+BLOCK_ROWS = 4096       # sensors resampled at once, bounds the temporaries
+
+
+class SketchIndex:
+    """In-memory copy of sensor_sketch: per-sensor stats plus the (sensors, segments)
+    matrix of segment means, NaN for empty segments."""
+
+    def __init__(self, keys, starts, ends, stats, matrix):
+        self.keys = np.asarray(keys, dtype=np.int64)
+        self.starts = np.asarray(starts, dtype=np.float64)
+        self.ends = np.asarray(ends, dtype=np.float64)
+        self.stats = stats  # {"mean", "std", "min_val", "max_val", "slope"} columns aligned with keys
+        self.matrix = matrix
+        self._index = {k: i for i, k in enumerate(self.keys.tolist())}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def row_of(self, sensor_key):
+        return self._index.get(sensor_key)
+
+    def segments_in(self, row, start, end):
+        """How many of sensor `row`'s segments [start, end] covers."""
+        width = (self.ends[row] - self.starts[row]) / self.matrix.shape[1]
+        lo, hi = max(start, self.starts[row]), min(end, self.ends[row])
+        return (hi - lo) / width if width > 0 else float(hi >= lo)
+
+    def resample(self, times, rows=slice(None)):
+        """The sketches of `rows` linearly interpolated at `times` (between segment
+        centers), NaN outside each sensor's time range. Returns (len(rows), len(times))."""
+        matrix, starts, ends = self.matrix[rows], self.starts[rows], self.ends[rows]
+        n_segments = matrix.shape[1]
+        width = np.maximum(ends - starts, 1e-9) / n_segments
+        pos = np.clip((times[None, :] - starts[:, None]) / width[:, None] - 0.5, 0, n_segments - 1)
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.minimum(lo + 1, n_segments - 1)
+        frac = pos - lo
+        r = np.arange(len(matrix))[:, None]
+        out = matrix[r, lo] * (1 - frac) + matrix[r, hi] * frac
+        out[(times[None, :] < starts[:, None]) | (times[None, :] > ends[:, None])] = np.nan
+        return out
+
+
+def distances(query, candidates, min_overlap=MIN_OVERLAP):
+    """z-normalized RMS distance from `query` (points,) to every row of `candidates`
+    (rows, points). Each pair is normalized over the points where both are present;
+    a constant series z-normalizes to zeros."""
+    valid = ~np.isnan(candidates) & ~np.isnan(query)[None, :]
+    n = valid.sum(axis=1)
+    safe_n = np.maximum(n, 1)
+
+    def centered(x):
+        x = np.where(valid, x, 0.0)
+        scale = np.abs(x).max(axis=1, initial=0.0)
+        x = np.where(valid, x - (x.sum(axis=1) / safe_n)[:, None], 0.0)
+        std = np.sqrt((x * x).sum(axis=1) / safe_n)
+        # Round-off leaves a constant series a tiny nonzero spread; treat it as flat
+        return x, std, std <= 1e-12 * scale + 1e-300
+
+    q, q_std, q_flat = centered(np.broadcast_to(query, candidates.shape))
+    c, c_std, c_flat = centered(candidates)
+    with np.errstate(all="ignore"):
+        r = np.where(q_flat | c_flat, 0.0, (q * c).sum(axis=1) / (safe_n * q_std * c_std))
+    # mean(z_q^2) + mean(z_c^2) - 2 mean(z_q z_c), with a flat side contributing zeros
+    d2 = (~q_flat).astype(np.float64) + (~c_flat).astype(np.float64) - 2 * r
+    return np.where(n >= min_overlap, np.sqrt(np.maximum(d2, 0.0)), np.inf)
+
+
+def sketch_distances(index, row, start, end, points=SKETCH_POINTS):
+    """Sketch-stage distance from sensor `row` to every sensor in `index` over [start, end]."""
+    times = start + (np.arange(points) + 0.5) * (end - start) / points
+    query = index.resample(times, slice(row, row + 1))[0]
+    return np.concatenate([distances(query, index.resample(times, slice(lo, lo + BLOCK_ROWS)))
+                           for lo in range(0, len(index), BLOCK_ROWS)]) if len(index) else np.empty(0)
+
+
+def shortlist(dist, size):
+    """Indexes of the `size` smallest finite distances, closest first."""
+    finite = np.flatnonzero(np.isfinite(dist))
+    if len(finite) > size:
+        finite = finite[np.argpartition(dist[finite], size)[:size]]
+    return finite[np.argsort(dist[finite], kind="stable")]
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The backend modules import each other as top-level modules (see main.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Importing main must not open a log database in the working directory
+os.environ.setdefault("LOG_DB_PATH", "")
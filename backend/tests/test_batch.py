@@ -0,0 +1,104 @@
+import duckdb
+import numpy as np
+import pyarrow as pa
+import pytest
+
+import main
+from catalog_cache import CatalogCache
+from ingest_csv import build_rollups, create_schema, refresh_catalog, register_sensors
+from tile_cache import TileCache
+
+ANCHOR = 1_700_000_000.0
+N = 20_000
+NAMES = ["a.csv", "b.csv", "c.csv"]
+
+
+@pytest.fixture(scope="module")
+def db():
+    """Three irregularly sampled sensors over ~3 h, with every rollup level built."""
+    rng = np.random.default_rng(11)
+    con = duckdb.connect()
+    create_schema(con)
+    register_sensors(con, f"SELECT unnest({NAMES}) AS name")
+    parts = []
+    for key in (1, 2, 3):
+        ts = ANCHOR + np.cumsum(rng.uniform(0.05, 1.0, N))
+        parts.append(pa.table({"ts": ts, "sensor_key": pa.array(np.full(N, key), pa.int32()),
+                               "value": np.cumsum(rng.normal(size=N))}))
+    rows = pa.concat_tables(parts)
+    con.execute("INSERT INTO sensors SELECT * FROM rows")
+    build_rollups(con, verbose=False)
+    refresh_catalog(con)
+    yield con
+    con.close()
+
+
+@pytest.fixture
+def con(db, monkeypatch):
+    monkeypatch.setattr(main, "catalog_cache", CatalogCache(main.load_sensor_catalog))
+    monkeypatch.setattr(main, "tile_cache", TileCache(64 << 20))
+    return db
+
+
+def viewport(ids, start, end, width=500, agg="avg"):
+    return {"ids": ids, "start": start, "end": end, "width": width, "agg": agg}
+
+
+VIEWPORTS = [
+    viewport(["a.csv"], ANCHOR + 100.0, ANCHOR + 3700.0),
+    viewport(["a.csv", "b.csv"], ANCHOR + 2000.0, ANCHOR + 5600.0, agg="m4"),   # overlaps the first
+    viewport([], ANCHOR + 50.5, ANCHOR + 9000.0, width=1200, agg="minmax"),      # every sensor
+    viewport(["c.csv", "b.csv"], None, None, width=300, agg="lttb"),             # whole range
+    viewport(["c.csv"], ANCHOR + 7000.0, ANCHOR + 7010.0, width=800),            # finer than the rollups
+]
+
+
+def assert_same(result, expected):
+    times, ids, matrix = result[:3]
+    exp_times, exp_ids, exp_matrix = expected
+    np.testing.assert_array_equal(times, exp_times)
+    assert ids == exp_ids
+    np.testing.assert_allclose(matrix, exp_matrix, rtol=1e-9)
+
+
+def single(con, vp):
+    return main.aggregate_sensor_data(con, vp["start"], vp["end"], vp["width"], vp["ids"], vp["agg"])
+
+
+@pytest.mark.parametrize("cache", ["cold", "warm"])
+def test_batch_matches_single_requests(con, monkeypatch, cache):
+    if cache == "warm":
+        # Tiles cached by /api/data are reused by the batch, and the other way round
+        expected = [single(con, vp) for vp in VIEWPORTS]
+        results = main.batch_sensor_data(con, VIEWPORTS, neighbors=False)
+    else:
+        results = main.batch_sensor_data(con, VIEWPORTS, neighbors=False)
+        monkeypatch.setattr(main, "tile_cache", TileCache(64 << 20))
+        expected = [single(con, vp) for vp in VIEWPORTS]
+    for result, exp in zip(results, expected):
+        assert set(result) == {"view"}
+        assert_same(result["view"], exp)
+
+
+def test_neighbors_are_the_windows_one_width_to_either_side(con):
+    vp = VIEWPORTS[1]
+    (result,) = main.batch_sensor_data(con, [vp], neighbors=True)
+    times, bucket_size = result["view"][0], result["view"][3]
+    # Shifting the window by its length in whole buckets keeps the grid, so the neighbor
+    # is what the shifted viewport returns
+    n_buckets = len(times) // main.AGG_SLOTS[vp["agg"]]
+    shift = n_buckets * bucket_size
+    for side, sign in (("left", -1), ("right", 1)):
+        shifted = dict(vp, start=vp["start"] + sign * shift, end=vp["end"] + sign * shift)
+        assert_same(result[side], single(con, shifted))
+    assert result["left"][0][-1] < times[0] and times[-1] < result["right"][0][0]
+
+
+def test_unknown_sensors_and_empty_ranges_are_empty(con):
+    results = main.batch_sensor_data(con, [viewport(["nope.csv"], None, None),
+                                           viewport(["a.csv"], ANCHOR + 10.0, ANCHOR + 10.0),
+                                           VIEWPORTS[0]], neighbors=True)
+    for result in results[:2]:
+        assert {w: (len(r[0]), r[1], r[3]) for w, r in result.items()} == \
+            {w: (0, [], None) for w in ("view", "left", "right")}
+    assert_same(results[2]["view"], single(con, VIEWPORTS[0]))
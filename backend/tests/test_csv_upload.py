@@ -0,0 +1,143 @@
+import asyncio
+import hashlib
+import os
+
+import pytest
+
+from csv_upload import MultipartFile, UploadManager, sensor_name_for
+
+BOUNDARY = "----sensorform"
+CONTENT_TYPE = f"multipart/form-data; boundary={BOUNDARY}"
+CSV = b"Time,Value\n" + b"".join(b"%d,%d.5\n" % (i, i) for i in range(2000))
+
+
+def multipart_body(*parts):
+    """(name, filename or None, data) parts as one multipart/form-data body."""
+    body = b""
+    for name, filename, data in parts:
+        disposition = f'form-data; name="{name}"' + (f'; filename="{filename}"' if filename else "")
+        body += f"--{BOUNDARY}\r\nContent-Disposition: {disposition}\r\n\r\n".encode() + data + b"\r\n"
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+
+async def stream(body, size):
+    for i in range(0, len(body), size):
+        yield body[i:i + size]
+
+
+def read_file(body, size):
+    async def scenario():
+        upload = MultipartFile(stream(body, size), CONTENT_TYPE)
+        filename = await upload.start()
+        return filename, [chunk async for chunk in upload]
+    return asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("size", [1, 7, 1000, 1 << 20])
+def test_multipart_file_streams_the_file_part(size):
+    body = multipart_body(("note", None, b"skip me"), ("file", "sensor_01.csv", CSV), ("other", None, b"x"))
+    filename, chunks = read_file(body, size)
+    assert filename == "sensor_01.csv"
+    assert b"".join(chunks) == CSV
+    # One piece per body chunk, never the whole file buffered at once
+    assert max(map(len, chunks)) <= size
+
+
+def test_multipart_without_a_file_part_is_rejected():
+    with pytest.raises(ValueError, match="'file'"):
+        read_file(multipart_body(("file", None, b"not a file"), ("note", None, b"x")), 64)
+    with pytest.raises(ValueError, match="boundary"):
+        MultipartFile(stream(b"", 1), "multipart/form-data")
+
+
+def test_multipart_body_cut_inside_the_file_is_rejected():
+    body = multipart_body(("file", "sensor_01.csv", CSV))
+    with pytest.raises(ValueError, match="ended inside"):
+        read_file(body[:len(body) // 2], 1000)
+
+
+def write_now(f, chunk):
+    async def write():
+        f.write(chunk)
+    return write()
+
+
+def upload(manager, name, body, size=1000):
+    job = manager.create(name, len(body))
+    asyncio.run(manager.receive(job, stream(body, size), write_now))
+    return job
+
+
+@pytest.mark.parametrize("filename, name", [
+    ("sensor_01.csv", "sensor_01.csv"),
+    ("C:\\fakepath/my sensor", "my_sensor.csv"),
+    ("../../etc/passwd", "passwd.csv"),
+    (".hidden.CSV", "hidden.CSV"),
+])
+def test_sensor_name_for(filename, name):
+    assert sensor_name_for(filename) == name
+
+
+@pytest.mark.parametrize("filename", [None, "", "  ", ".csv", "..csv", "dir/"])
+def test_sensor_name_for_rejects_empty_names(filename):
+    with pytest.raises(ValueError):
+        sensor_name_for(filename)
+
+
+def test_upload_goes_through_its_stages(tmp_path):
+    stages = []
+    def ingest(job, on_stage):
+        stages.append(job.stage)
+        assert open(job.part, "rb").read() == CSV and job.size == len(CSV)
+        on_stage("loading")
+        stages.append(job.stage)
+        os.replace(job.part, job.path)
+        return 2000
+
+    manager = UploadManager(ingest, str(tmp_path))
+    job = upload(manager, "sensor_01.csv", CSV)
+    assert job.stage == "receiving" and job.bytes_received == len(CSV)
+    assert job.digest == hashlib.blake2b(CSV, digest_size=16).hexdigest()
+    manager.submit(job)
+    manager.shutdown()
+
+    assert stages == ["queued", "loading"]
+    assert job.to_dict()["stage"] == "done" and job.rows == 2000 and job.finished is not None
+    assert os.listdir(tmp_path) == ["sensor_01.csv"]
+    assert manager.stats() == {"active": 0, "completed": 1, "failed": 0, "bytes_received": len(CSV)}
+
+
+def test_failed_ingest_leaves_nothing_behind(tmp_path):
+    def ingest(job, on_stage):
+        on_stage("loading")
+        raise RuntimeError("no 'time' column")
+
+    manager = UploadManager(ingest, str(tmp_path))
+    job = upload(manager, "sensor_01.csv", CSV)
+    manager.submit(job)
+    manager.shutdown()
+    assert (job.stage, job.error) == ("failed", "no 'time' column")
+    assert os.listdir(tmp_path) == []
+    assert manager.stats()["failed"] == 1
+
+
+def test_interrupted_upload_is_failed_and_removed(tmp_path):
+    async def cut_off():
+        yield CSV[:100]
+        raise ConnectionResetError("client went away")
+
+    manager = UploadManager(lambda job, on_stage: 0, str(tmp_path))
+    job = manager.create("sensor_01.csv")
+    with pytest.raises(ConnectionResetError):
+        asyncio.run(manager.receive(job, cut_off(), write_now))
+    assert job.stage == "failed" and job.error == "Upload interrupted: client went away"
+    assert job.bytes_received == 100
+    assert os.listdir(tmp_path) == []
+
+
+def test_only_the_last_jobs_are_kept(tmp_path):
+    manager = UploadManager(lambda job, on_stage: 0, str(tmp_path), max_jobs=3)
+    jobs = [manager.create(f"s{i}.csv") for i in range(5)]
+    assert manager.jobs() == jobs[:1:-1]
+    assert manager.get(jobs[0].id) is None and manager.get(jobs[4].id) is jobs[4]
+    assert manager.stats()["active"] == 3
@@ -0,0 +1,150 @@
+import duckdb
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+import main
+from catalog_cache import CatalogCache
+from derived import MAX_EXPR_LENGTH, MAX_SENSORS, Expression, ExpressionError, bucket_reduce, rolling_mean, rolling_std
+from ingest_csv import build_rollups, create_schema, refresh_catalog, register_sensors
+
+nan = np.nan
+
+
+@pytest.mark.parametrize("text", [
+    '__import__("os").system("true")',
+    'open("/etc/passwd")',
+    's("a").real',
+    's("a")[0]',
+    'lambda: 1',
+    '[s("a")]',
+    '(x := 1)',
+    's("a") if 1 else 2',
+    's("a") > 1',
+    's("a") // 2',
+    's("a") % 2',
+    'not s("a")',
+    's("a"); 1',
+    'eval("1")',
+    'x',
+    '"signal_0001.csv"',
+    'True + 1',
+    'abs(x=s("a"))',
+    'abs(s("a"), 2)',
+    's("a", "b")',
+    's(name)',
+    's(1)',
+    'rolling_mean(s("a"), s("b"))',
+    'rolling_mean(s("a"), 0)',
+    'rolling_mean(s("a"), -5)',
+    'rolling_mean(s("a"), 1e999)',
+    'band_power(s("a"), s("b"), 1, 60)',
+    '',
+    '1 +',
+])
+def test_rejects_everything_outside_the_whitelist(text):
+    with pytest.raises(ExpressionError):
+        Expression(text)
+
+
+def test_rejects_oversized_expressions():
+    with pytest.raises(ExpressionError):
+        Expression("1+" * MAX_EXPR_LENGTH + "1")
+    with pytest.raises(ExpressionError):
+        Expression(" + ".join(f's("sensor_{i}")' for i in range(MAX_SENSORS + 1)))
+
+
+def test_accepts_whitelisted_expressions():
+    e = Expression('rolling_std(derivative(s("a")), 30) + -abs(s("b")) ** 2 / max(s("a"), 1.5)')
+    assert e.sensors == {"a", "b"}
+
+
+@pytest.mark.parametrize("text, lookback, steps", [
+    ('s("a") * 2', 0.0, 0),
+    ('rolling_mean(s("a"), 30)', 30.0, 0),
+    ('rolling_mean(rolling_std(s("a"), 10), 30)', 40.0, 0),
+    ('derivative(s("a"))', 0.0, 1),
+    ('rolling_std(derivative(s("a")), 30)', 30.0, 1),
+    ('derivative(derivative(s("a"))) + rolling_mean(s("b"), 60)', 60.0, 2),
+    ('band_power(s("a"), 0.01, 0.05, 300)', 300.0, 0),
+])
+def test_lookback(text, lookback, steps):
+    e = Expression(text)
+    assert (e.lookback, e.lookback_steps) == (lookback, steps)
+
+
+def test_evaluate_arithmetic_and_functions():
+    a = np.array([1.0, 4.0, 9.0, nan])
+    b = np.array([2.0, 2.0, 2.0, 2.0])
+    out = Expression('sqrt(s("a")) * s("b") - 1').evaluate({"a": a, "b": b}, step=1.0)
+    np.testing.assert_array_equal(out, [1.0, 3.0, 5.0, nan])
+
+
+def test_evaluate_derivative_per_second():
+    x = np.array([0.0, 1.0, 3.0, 6.0])
+    out = Expression('derivative(s("a"))').evaluate({"a": x}, step=0.5)
+    # The first sample has no predecessor; that is what lookback_steps pads for
+    np.testing.assert_array_equal(out, [nan, 2.0, 4.0, 6.0])
+
+
+def test_evaluate_constant_broadcasts_and_non_finite_become_nan():
+    a = np.array([0.0, 1.0, -1.0])
+    np.testing.assert_array_equal(Expression("2 + 3").evaluate({"a": a}, 1.0), [5.0, 5.0, 5.0])
+    np.testing.assert_array_equal(Expression('1 / s("a")').evaluate({"a": a}, 1.0), [nan, 1.0, -1.0])
+    np.testing.assert_array_equal(Expression('log(s("a"))').evaluate({"a": a}, 1.0), [nan, 0.0, nan])
+
+
+def test_rolling_windows_skip_gaps():
+    x = np.array([1.0, 2.0, nan, 4.0, 5.0])
+    np.testing.assert_allclose(rolling_mean(x, 2), [1.0, 1.5, 2.0, 4.0, 4.5])
+    np.testing.assert_allclose(rolling_std(x, 3), [nan, 0.5, 0.5, 1.0, 0.5])
+
+
+def test_bucket_reduce_extrema_carry_sample_times():
+    times = np.arange(8.0)
+    values = np.array([[3.0, 1.0, 4.0, 1.5, nan, nan, nan, nan]])
+    cols = bucket_reduce(times, values, per_bucket=4, agg="m4")
+    assert cols["min_val"][0, 0] == 1.0 and cols["min_t"][0, 0] == 1.0
+    assert cols["max_val"][0, 0] == 4.0 and cols["max_t"][0, 0] == 2.0
+    assert cols["first_val"][0, 0] == 3.0 and cols["last_val"][0, 0] == 1.5
+    assert all(np.isnan(cols[f][0, 1]) for f in cols)
+    avg = bucket_reduce(times, values, per_bucket=4, agg="avg")["avg_val"]
+    np.testing.assert_array_equal(avg, [[2.375, nan]])
+
+
+def test_integral_starts_at_the_requested_start():
+    x = np.array([100.0, 100.0, 1.0, nan, 2.0])
+    out = Expression('integral(s("a"))').evaluate({"a": x}, step=0.5, origin=2)
+    # The lookback samples before the origin don't count towards the integral
+    np.testing.assert_array_equal(out, [nan, nan, 0.5, 0.5, 1.5])
+    whole = Expression('integral(s("a"))').evaluate({"a": x}, step=0.5)
+    np.testing.assert_array_equal(whole, [50.0, 100.0, 100.5, 100.5, 101.5])
+
+
+
+
+@pytest.fixture
+def one_sensor_db(monkeypatch):
+    """signal_0001.csv sampled every second for an hour, with rollups, as main's catalog."""
+    con = duckdb.connect()
+    create_schema(con)
+    register_sensors(con, "SELECT 'signal_0001.csv' AS name")
+    con.execute("INSERT INTO sensors SELECT i::DOUBLE, 1, sin(i / 60.0) FROM range(3600) t(i)")
+    build_rollups(con, verbose=False)
+    refresh_catalog(con)
+    monkeypatch.setattr(main, "catalog_cache", CatalogCache(main.load_sensor_catalog))
+    yield con
+    con.close()
+
+
+def test_derived_series_rejects_lookback_beyond_the_sample_cap(one_sensor_db, monkeypatch):
+    monkeypatch.setattr(main, "DERIVED_MAX_SAMPLES", 4096)
+    fits = Expression('rolling_mean(s("signal_0001.csv"), 3600)')
+    times, ids, matrix = main.derived_series(one_sensor_db, [fits], 0.0, 3600.0, 100, "avg")
+    assert ids == [fits.text] and matrix.shape == (1, len(times))
+
+    # 1e9 s of window would be ~3e7 samples even at one per 32 s output bucket
+    too_long = Expression('rolling_mean(s("signal_0001.csv"), 1e9)')
+    with pytest.raises(HTTPException) as error:
+        main.derived_series(one_sensor_db, [too_long], 0.0, 3600.0, 100, "avg")
+    assert error.value.status_code == 400
@@ -0,0 +1,157 @@
+import math
+
+import numpy as np
+import pytest
+
+from downsample import (AGG_SLOTS, LTTB_EXACT_MAX_SENSORS, align_points, expand_extrema, finish_buckets,
+                        grid_points, lttb_select)
+
+nan = np.nan
+
+
+def extrema(min_t, min_val, max_t, max_val, first_val=None, last_val=None):
+    """EXTREMA_FIELDS grids from per-bucket lists (one sensor, or a list of them)."""
+    cols = {"min_t": min_t, "min_val": min_val, "max_t": max_t, "max_val": max_val,
+            "first_val": first_val if first_val is not None else min_val,
+            "last_val": last_val if last_val is not None else max_val}
+    return {f: np.atleast_2d(np.asarray(v, dtype=np.float64)) for f, v in cols.items()}
+
+
+def reference_lttb(min_t, min_v, max_t, max_v):
+    """Per-point loop over one sensor's candidates, the way lttb_select describes it."""
+    n = len(min_v)
+    out_t, out_v = [nan] * n, [nan] * n
+    prev_t, prev_v = min_t[0], min_v[0]
+    out_t[0], out_v[0] = prev_t, prev_v
+    for i in range(1, n):
+        if math.isnan(min_v[i]):
+            continue
+        j = i + 1 if i + 1 < n and not math.isnan(min_v[i + 1]) else i
+        nt, nv = (min_t[j] + max_t[j]) / 2, (min_v[j] + max_v[j]) / 2
+        area = lambda t, v: abs((prev_t - nt) * (v - prev_v) - (prev_t - t) * (nv - prev_v))
+        if area(max_t[i], max_v[i]) > area(min_t[i], min_v[i]):
+            prev_t, prev_v = max_t[i], max_v[i]
+        else:
+            prev_t, prev_v = min_t[i], min_v[i]
+        out_t[i], out_v[i] = prev_t, prev_v
+    return out_t, out_v
+
+
+def random_candidates(rng, n_sensors, n_buckets, gap_rate=0.1):
+    """Extrema candidates inside unit buckets, with some empty buckets after the first."""
+    a = np.arange(n_buckets) + rng.random((n_sensors, n_buckets))
+    b = np.arange(n_buckets) + rng.random((n_sensors, n_buckets))
+    va = rng.normal(size=(n_sensors, n_buckets))
+    vb = rng.normal(size=(n_sensors, n_buckets))
+    lo, hi = np.minimum(va, vb), np.maximum(va, vb)
+    min_t, max_t = np.where(va <= vb, a, b), np.where(va <= vb, b, a)
+    gaps = rng.random((n_sensors, n_buckets)) < gap_rate
+    gaps[:, 0] = False
+    for grid in (min_t, lo, max_t, hi):
+        grid[gaps] = nan
+    return min_t, lo, max_t, hi
+
+
+def test_m4_emits_first_min_max_last_in_time_order():
+    # Bucket 0: min before max; bucket 1: max before min
+    cols = extrema(min_t=[0.2, 1.7], min_val=[-1, -2], max_t=[0.6, 1.1], max_val=[3, 4],
+                   first_val=[0.5, 1.5], last_val=[0.7, 1.9])
+    out = expand_extrema("m4", cols)
+    assert out.shape == (1, 2 * AGG_SLOTS["m4"])
+    np.testing.assert_array_equal(out[0], [0.5, -1, 3, 0.7, 1.5, 4, -2, 1.9])
+
+
+def test_minmax_orders_extrema_by_time():
+    cols = extrema(min_t=[0.2, 1.7], min_val=[-1, -2], max_t=[0.6, 1.1], max_val=[3, 4])
+    np.testing.assert_array_equal(expand_extrema("minmax", cols)[0], [-1, 3, 4, -2])
+
+
+def test_empty_buckets_stay_nan():
+    cols = extrema(min_t=[0.2, nan], min_val=[-1, nan], max_t=[0.6, nan], max_val=[3, nan])
+    out = expand_extrema("m4", cols)[0]
+    assert not np.isnan(out[:4]).any()
+    assert np.isnan(out[4:]).all()
+
+
+def test_avg_passes_bucket_means_through():
+    times = np.arange(3.0)
+    means = np.array([[1.0, nan, 3.0]])
+    out_times, out = finish_buckets("avg", {"avg_val": means}, times)
+    assert out_times is times
+    np.testing.assert_array_equal(out, means)
+
+
+def test_lttb_matches_reference():
+    rng = np.random.default_rng(7)
+    min_t, min_v, max_t, max_v = random_candidates(rng, n_sensors=5, n_buckets=200)
+    sel_t, sel_v = lttb_select(min_t, min_v, max_t, max_v)
+    for s in range(5):
+        ref_t, ref_v = reference_lttb(min_t[s], min_v[s], max_t[s], max_v[s])
+        np.testing.assert_array_equal(sel_t[s], ref_t)
+        np.testing.assert_array_equal(sel_v[s], ref_v)
+
+
+def test_lttb_picks_an_existing_candidate_with_its_own_time():
+    rng = np.random.default_rng(3)
+    min_t, min_v, max_t, max_v = random_candidates(rng, n_sensors=3, n_buckets=100)
+    sel_t, sel_v = lttb_select(min_t, min_v, max_t, max_v)
+    present = ~np.isnan(min_v)
+    is_min = (sel_t == min_t) & (sel_v == min_v)
+    is_max = (sel_t == max_t) & (sel_v == max_v)
+    assert np.all((is_min | is_max)[present])
+    assert np.isnan(sel_v[~present]).all() and np.isnan(sel_t[~present]).all()
+
+
+def test_lttb_keeps_an_isolated_spike():
+    n = 50
+    min_t = np.arange(n) + 0.25
+    max_t = np.arange(n) + 0.75
+    min_v = np.zeros(n)
+    max_v = np.full(n, 0.1)
+    max_v[20] = 10.0
+    sel_t, sel_v = lttb_select(*(np.atleast_2d(x) for x in (min_t, min_v, max_t, max_v)))
+    assert sel_v[0, 20] == 10.0
+    assert sel_t[0, 20] == 20.75
+
+
+def test_lttb_points_sit_at_their_own_times():
+    cols = extrema(min_t=[[0.1, 1.2, 2.3], [0.4, 1.5, 2.6]], min_val=[[0, -5, 0], [1, -1, 1]],
+                   max_t=[[0.6, 1.7, 2.8], [0.9, 1.6, 2.7]], max_val=[[1, 6, 1], [2, 9, 2]])
+    sel_t, sel_v = lttb_select(cols["min_t"], cols["min_val"], cols["max_t"], cols["max_val"])
+    times, matrix = finish_buckets("lttb", cols, np.arange(3.0))
+
+    # One shared, sorted axis holding every selected time; each sensor has a value
+    # exactly at its own points and nowhere else
+    np.testing.assert_array_equal(times, np.unique(sel_t))
+    for s in range(2):
+        np.testing.assert_array_equal(times[~np.isnan(matrix[s])], sel_t[s])
+        np.testing.assert_array_equal(matrix[s][~np.isnan(matrix[s])], sel_v[s])
+
+
+def test_lttb_stays_on_the_grid_for_many_sensors():
+    rng = np.random.default_rng(1)
+    n_sensors = LTTB_EXACT_MAX_SENSORS + 1
+    min_t, min_v, max_t, max_v = random_candidates(rng, n_sensors, n_buckets=20)
+    cols = {"min_t": min_t, "min_val": min_v, "max_t": max_t, "max_val": max_v}
+    grid = np.arange(20.0)
+    times, matrix = finish_buckets("lttb", cols, grid)
+    assert times is grid
+    np.testing.assert_array_equal(matrix, grid_points("lttb", cols))
+    np.testing.assert_array_equal(matrix, lttb_select(min_t, min_v, max_t, max_v)[1])
+
+
+def test_align_points_merges_shared_times():
+    point_t = np.array([[1.0, 2.0, nan], [2.0, 3.0, 4.0]])
+    values = np.array([[10.0, 20.0, nan], [-2.0, -3.0, -4.0]])
+    times, matrix = align_points(point_t, values)
+    np.testing.assert_array_equal(times, [1.0, 2.0, 3.0, 4.0])
+    np.testing.assert_array_equal(matrix, [[10.0, 20.0, nan, nan], [nan, -2.0, -3.0, -4.0]])
+
+
+@pytest.mark.parametrize("agg", ["minmax", "m4", "lttb"])
+def test_no_buckets(agg):
+    empty = np.empty((1, 0))
+    cols = {"min_t": empty, "min_val": empty, "max_t": empty, "max_val": empty, "first_val": empty,
+            "last_val": empty}
+    times, matrix = finish_buckets(agg, cols, np.empty(0))
+    assert len(times) == 0 and matrix.shape == (1, 0)
@@ -0,0 +1,103 @@
+import json
+import struct
+
+import numpy as np
+import orjson
+import pyarrow as pa
+import pytest
+
+from encoding import (F64_MAGIC, GRID_MAGIC, GRID_NO_DATA, encode_arrow, encode_f64, encode_grid, encode_json,
+                      encode_ndjson_line, negotiate_format)
+
+nan = np.nan
+
+
+def decode_frame(content, magic):
+    """(header, body) of an encode_f64/encode_grid frame, like frontend/src/utils/binaryFrame.ts."""
+    assert content[:4] == magic
+    (header_len,) = struct.unpack("<I", content[4:8])
+    assert (8 + header_len) % 8 == 0  # arrays start 8-byte aligned
+    return json.loads(content[8:8 + header_len]), content[8 + header_len:]
+
+
+def sample_series():
+    times = np.array([0.0, 0.5, 1.0, 1.5])
+    matrix = np.array([[1.0, nan, 3.0, -4.5], [nan, nan, 2.0, 1e300]])
+    return times, ["signal_0001.csv", "signal_0002.csv"], matrix
+
+
+@pytest.mark.parametrize("ids", [["a"], ["a", "b"], ["sensor with a longer name.csv"]])
+def test_f64_round_trip(ids):
+    rng = np.random.default_rng(len(ids))
+    times = np.sort(rng.random(7))
+    matrix = rng.normal(size=(len(ids), 7))
+    matrix[0, 3] = nan
+    header, body = decode_frame(encode_f64(times, ids, matrix, {"agg": "m4", "bucket": 0.25}), F64_MAGIC)
+    assert header["ids"] == ids and header["points"] == 7
+    assert header["agg"] == "m4" and header["bucket"] == 0.25
+    arrays = np.frombuffer(body, dtype="<f8").reshape(len(ids) + 1, 7)
+    np.testing.assert_array_equal(arrays[0], times)
+    np.testing.assert_array_equal(arrays[1:], matrix)
+
+
+def test_f64_accepts_non_contiguous_rows():
+    times, ids, matrix = sample_series()
+    transposed = np.asfortranarray(matrix)
+    _, body = decode_frame(encode_f64(times, ids, transposed, {}), F64_MAGIC)
+    np.testing.assert_array_equal(np.frombuffer(body, dtype="<f8")[len(times):].reshape(matrix.shape), matrix)
+
+
+def test_arrow_round_trip():
+    times, ids, matrix = sample_series()
+    content = encode_arrow(times, ids, matrix, {"agg": "avg", "bucket": 0.5})
+    table = pa.ipc.open_stream(content).read_all()
+    assert table.column_names == ["time", *ids]
+    assert table.schema.metadata == {b"agg": b"avg", b"bucket": b"0.5"}
+    np.testing.assert_array_equal(table["time"].to_numpy(), times)
+    for i, s_id in enumerate(ids):
+        column = table[s_id]
+        # NaN (no data) travels as an Arrow null
+        assert column.null_count == np.isnan(matrix[i]).sum()
+        np.testing.assert_array_equal(column.to_numpy(zero_copy_only=False), matrix[i])
+
+
+def test_json_writes_nan_as_null():
+    times, ids, matrix = sample_series()
+    payload = {"time": times, "series": [{"id": s_id, "data": matrix[i]} for i, s_id in enumerate(ids)]}
+    decoded = orjson.loads(encode_json(payload))
+    assert decoded["time"] == times.tolist()
+    assert decoded["series"][0]["data"] == [1.0, None, 3.0, -4.5]
+    assert decoded["series"][1]["data"] == [None, None, 2.0, 1e300]
+
+
+def test_ndjson_line_is_one_record():
+    line = encode_ndjson_line({"type": "series", "id": "a", "data": np.array([1.0, nan])})
+    assert line.endswith(b"\n") and line.count(b"\n") == 1
+    assert orjson.loads(line) == {"type": "series", "id": "a", "data": [1.0, None]}
+
+
+def test_grid_uint8_scales_and_marks_empty_cells():
+    grid = np.array([[0.0, 0.5, 1.0], [nan, 1.7, -0.2]])
+    header, body = decode_frame(encode_grid(grid, "uint8", {"start": 10.0}), GRID_MAGIC)
+    assert header == {"rows": 2, "cols": 3, "dtype": "uint8", "start": 10.0}
+    cells = np.frombuffer(body, dtype="u1").reshape(2, 3)
+    np.testing.assert_array_equal(cells, [[0, 127, 254], [GRID_NO_DATA, 254, 0]])
+
+
+def test_grid_float32_round_trip():
+    grid = np.array([[0.25, nan], [-3.5, 1e6]])
+    header, body = decode_frame(encode_grid(grid, "float32", {}), GRID_MAGIC)
+    assert header["dtype"] == "float32"
+    np.testing.assert_array_equal(np.frombuffer(body, dtype="<f4").reshape(2, 2), grid.astype(np.float32))
+
+
+@pytest.mark.parametrize("fmt, accept, expected", [
+    ("f64", "application/vnd.apache.arrow.stream", "f64"),
+    (None, "text/html, application/vnd.apache.arrow.stream", "arrow"),
+    (None, "application/vnd.sensor.f64", "f64"),
+    (None, "application/x-ndjson", "ndjson"),
+    (None, "*/*", "json"),
+    (None, None, "json"),
+])
+def test_negotiate_format(fmt, accept, expected):
+    assert negotiate_format(fmt, accept) == expected
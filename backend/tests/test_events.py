@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+from events import (EVENT_SCHEMA, MIN_SAMPLES, detect_bursts, detect_events, detect_spikes, detect_steps, events_table,
+                    split_series)
+
+N = 4000
+STEP = 0.5  # seconds between samples
+
+
+@pytest.fixture(params=range(3))
+def rng(request):
+    return np.random.default_rng(request.param)
+
+
+def noise(rng):
+    return np.arange(N) * STEP, rng.normal(0.0, 0.1, N)
+
+
+def test_spike_found_at_its_sample(rng):
+    t, v = noise(rng)
+    v[700] += 3.0
+    events = detect_spikes(t, v)
+    assert len(events) == 1
+    kind, start_ts, end_ts, peak_ts, magnitude, score = events[0]
+    assert kind == "spike" and peak_ts == t[700] and start_ts <= peak_ts <= end_ts
+    assert magnitude == pytest.approx(3.0, abs=0.5)
+    assert score >= 8.0
+
+
+def test_step_found_between_its_samples(rng):
+    t, v = noise(rng)
+    v[1200:] += 2.0
+    events = detect_steps(t, v)
+    assert len(events) == 1
+    kind, start_ts, end_ts, peak_ts, magnitude, _ = events[0]
+    assert kind == "step" and (start_ts, end_ts, peak_ts) == (t[1199], t[1200], t[1200])
+    assert magnitude == pytest.approx(2.0, abs=0.2)
+
+
+def test_negative_step_keeps_its_sign(rng):
+    t, v = noise(rng)
+    v[1200:] -= 2.0
+    (event,) = detect_steps(t, v)
+    assert event[4] == pytest.approx(-2.0, abs=0.2)
+
+
+def test_burst_covers_the_raised_activity(rng):
+    t, v = noise(rng)
+    v[2000:2100] += rng.normal(0.0, 1.0, 100)
+    events = detect_bursts(t, v)
+    assert len(events) == 1
+    _, start_ts, end_ts, peak_ts, _, _ = events[0]
+    # The rolling activity window smears the edges by up to half its length
+    assert t[1980] <= start_ts <= t[2020] and t[2080] <= end_ts <= t[2120]
+    assert start_ts <= peak_ts <= end_ts
+
+
+def test_pure_noise_has_no_events(rng):
+    assert detect_events(*noise(rng)) == []
+
+
+def test_trend_and_oscillation_are_not_events(rng):
+    t, v = noise(rng)
+    v += np.linspace(0.0, 5.0, N) + np.sin(t / 100.0)
+    assert detect_events(t, v) == []
+
+
+def test_all_kinds_on_a_trending_signal(rng):
+    t, v = noise(rng)
+    v += np.linspace(0.0, 5.0, N) + np.sin(t / 100.0)
+    v[700] += 3.0
+    v[1200:] += 2.0
+    v[2000:2100] += rng.normal(0.0, 1.0, 100)
+    events = detect_events(t, v)
+    in_burst = lambda e: t[1980] <= e[3] <= t[2120]
+
+    assert [e[3] for e in events if e[0] == "spike" and not in_burst(e)] == [t[700]]
+    assert [e[3] for e in events if e[0] == "step"] == [t[1200]]
+    # The step is taken out before looking for bursts, so only the real one is reported
+    bursts = [e for e in events if e[0] == "burst"]
+    assert bursts and all(in_burst(e) for e in bursts)
+
+
+def test_gaps_are_dropped_and_short_series_skipped(rng):
+    t, v = noise(rng)
+    v[1200:] += 2.0
+    v[100:200] = np.nan
+    assert [(e[0], e[3]) for e in detect_events(t, v)] == [("step", t[1200])]
+    assert detect_events(t[:MIN_SAMPLES - 1], v[:MIN_SAMPLES - 1]) == []
+
+
+def test_events_table_rows_per_sensor(rng):
+    t, v = noise(rng)
+    stepped = v.copy()
+    stepped[1200:] += 2.0
+    names = np.array(["a"] * N + ["b"] * N + ["c"] * 10, dtype=object)
+    times = np.concatenate([t, t, t[:10]])
+    values = np.concatenate([stepped, v, v[:10]])
+    series = list(split_series(names, times, values))
+    assert [name for name, _, _ in series] == ["a", "b", "c"]
+
+    table = events_table(series)
+    assert table.schema == EVENT_SCHEMA
+    assert table.column("sensor_name").to_pylist() == ["a"]
+    assert table.column("kind").to_pylist() == ["step"]
+    assert table.column("peak_ts").to_pylist() == [t[1200]]
+    assert events_table([]).num_rows == 0
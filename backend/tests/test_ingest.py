@@ -0,0 +1,88 @@
+import os
+
+import duckdb
+import pytest
+
+import ingest_csv
+from ingest_csv import create_schema, file_hash, ingest_data, plan_ingest
+
+
+def write_csv(path, n, offset=0.0):
+    with open(path, "w") as f:
+        f.write("time,value\n")
+        f.writelines(f"{i * 0.5},{i + offset}\n" for i in range(n))
+
+
+def manifest_row(con, path):
+    st = os.stat(path)
+    con.execute("INSERT INTO ingest_manifest VALUES (?, ?, ?, ?, ?, 0, current_timestamp)",
+                [path, os.path.basename(path), st.st_size, st.st_mtime, file_hash(path)])
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """Empty data/ under a scratch working directory, where ingest_data looks."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(ingest_csv, "STORAGE_MODE", "duckdb")
+    os.makedirs("data")
+    return "data"
+
+
+def test_plan_ingest_picks_new_and_changed_files(data_dir):
+    paths = [os.path.join(data_dir, f"signal_{i}.csv") for i in range(4)]
+    for path in paths:
+        write_csv(path, 10)
+    con = duckdb.connect()
+    create_schema(con)
+    for path in paths[:3]:
+        manifest_row(con, path)
+    con.execute("INSERT INTO ingest_manifest VALUES ('data/gone.csv', 'gone.csv', 1, 1.0, 'x', 0, current_timestamp)")
+
+    # signal_0 unchanged, signal_1 touched only, signal_2 rewritten, signal_3 new
+    st = os.stat(paths[1])
+    os.utime(paths[1], (st.st_atime, st.st_mtime + 10))
+    write_csv(paths[2], 10, offset=1.0)
+    os.utime(paths[2], (st.st_atime, st.st_mtime + 20))
+
+    to_ingest, removed = plan_ingest(con, paths)
+    assert [entry[0] for entry in to_ingest] == paths[2:]
+    assert to_ingest[0][3] == file_hash(paths[2])
+    assert removed == ["data/gone.csv"]
+    # The touched file isn't re-read next time: its new mtime is remembered
+    mtime = con.execute("SELECT mtime FROM ingest_manifest WHERE path = ?", [paths[1]]).fetchone()[0]
+    assert mtime == os.stat(paths[1]).st_mtime
+
+
+def test_incremental_ingest_replaces_only_changed_sensors(data_dir, capsys):
+    write_csv("data/a.csv", 100)
+    write_csv("data/b.csv", 200)
+    ingest_data(workers=1)
+    with duckdb.connect(ingest_csv.DB_PATH) as con:
+        anchor = con.execute("SELECT value FROM ingest_meta WHERE key = 'time_anchor'").fetchone()[0]
+        keys = dict(con.execute("SELECT name, sensor_key FROM sensor_catalog").fetchall())
+    assert set(keys) == {"a.csv", "b.csv"}
+
+    ingest_data(workers=1)
+    assert "Nothing to do." in capsys.readouterr().out
+
+    # b grows and changes value, a is removed, c is new
+    write_csv("data/b.csv", 300, offset=5.0)
+    os.remove("data/a.csv")
+    write_csv("data/c.csv", 50)
+    ingest_data(workers=1)
+    assert "2 new/changed files, 1 removed" in capsys.readouterr().out
+
+    with duckdb.connect(ingest_csv.DB_PATH) as con:
+        # Same time anchor, and b keeps its key
+        assert con.execute("SELECT value FROM ingest_meta WHERE key = 'time_anchor'").fetchone()[0] == anchor
+        catalog = {r[0]: r[1:] for r in con.execute(
+            "SELECT name, sensor_key, row_count, min_val FROM sensor_catalog").fetchall()}
+        assert set(catalog) == {"b.csv", "c.csv"}
+        assert catalog["b.csv"] == (keys["b.csv"], 300, 5.0)
+        assert catalog["c.csv"][1] == 50
+        per_sensor = dict(con.execute("SELECT sensor_key, count(*) FROM sensors GROUP BY 1").fetchall())
+        assert per_sensor == {catalog["b.csv"][0]: 300, catalog["c.csv"][0]: 50}
+        rollup = con.execute(f"SELECT sum(cnt) FROM {ingest_csv.rollup_table(1)}").fetchone()[0]
+        assert rollup == 350
+        manifest = dict(con.execute("SELECT path, row_count FROM ingest_manifest").fetchall())
+        assert manifest == {"data/b.csv": 300, "data/c.csv": 50}
@@ -0,0 +1,28 @@
+import pytest
+
+from main import LIVE_MAX_WIDTH, parse_live_subscription
+
+
+def test_subscription_defaults():
+    assert parse_live_subscription({"ids": ["a.csv"]}) == ({"a.csv"}, 300.0, 1000, "avg")
+    assert parse_live_subscription({"window": 60, "width": 800.0, "agg": "m4"}) == (set(), 60.0, 800, "m4")
+
+
+@pytest.mark.parametrize("msg", [
+    [],
+    {"ids": "a.csv"},
+    {"ids": [1]},
+    {"agg": "median"},
+    {"agg": ["avg"]},
+    {"window": 0},
+    {"window": -5},
+    {"window": float("nan")},
+    {"window": float("inf")},
+    {"window": "60"},
+    {"width": 0},
+    {"width": LIVE_MAX_WIDTH + 1},
+    {"width": True},
+])
+def test_subscription_rejects_invalid_messages(msg):
+    with pytest.raises(ValueError):
+        parse_live_subscription(msg)
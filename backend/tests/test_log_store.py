@@ -0,0 +1,85 @@
+import time
+
+import pytest
+
+from log_store import LogStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = LogStore(str(tmp_path / "logs.duckdb"), flush_interval=0.01, fts_interval=0.0, fts_min_rows=100).start()
+    yield store
+    store.stop()
+
+
+def log_lines(store, n, level="INFO", message="line {}"):
+    for i in range(n):
+        store.append(time.time(), level, "sensor_api", message.format(i))
+    written = store.written + n
+    while store.written < written:
+        time.sleep(0.01)
+
+
+def test_index_is_rebuilt_only_after_enough_new_rows(store, monkeypatch):
+    builds = []
+    def build_index():
+        builds.append(store.unindexed())
+        store.indexed_upto = store._next_id - 1
+    monkeypatch.setattr(store, "_build_index", build_index)
+    store.fts = True
+
+    log_lines(store, 99)
+    time.sleep(0.1)
+    assert builds == []  # a short tail is cheaper to scan than to index
+    log_lines(store, 1)
+    deadline = time.monotonic() + 5.0
+    while not builds and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert builds == [100]
+    time.sleep(0.1)
+    assert builds == [100] and store.unindexed() == 0  # nothing new, no rebuild
+
+
+def test_pages_backwards_without_gaps_or_repeats(store):
+    log_lines(store, 25)
+    seen, before = [], None
+    while True:
+        page, mode = store.query(before=before, limit=10)
+        if not page:
+            break
+        assert mode is None and len(page) <= 10
+        seen += [r["message"] for r in page]
+        before = page[-1]["id"]
+    assert seen == [f"line {i}" for i in reversed(range(25))]
+
+
+def test_polling_after_returns_the_oldest_new_records_newest_first(store):
+    log_lines(store, 5)
+    newest = store.query(limit=1)[0][0]["id"]
+    log_lines(store, 8, message="new {}")
+    page, _ = store.query(after=newest, limit=3)
+    # A burst larger than the limit is read in order: the first three, newest first
+    assert [r["message"] for r in page] == ["new 2", "new 1", "new 0"]
+    page, _ = store.query(after=page[0]["id"], limit=10)
+    assert [r["message"] for r in page] == [f"new {i}" for i in reversed(range(3, 8))]
+    assert store.query(after=page[0]["id"])[0] == []
+
+
+def test_filters_by_level_time_and_search(store):
+    log_lines(store, 4, level="DEBUG", message="debug {}")
+    start = time.time()
+    log_lines(store, 4, level="WARNING", message="warn 10%_{}")
+    log_lines(store, 4, level="ERROR", message="error 100{}")
+
+    page, _ = store.query(levels=["WARN", "ERROR"], limit=100)
+    # logging's WARNING is stored under the frontend's name
+    assert {r["level"] for r in page} == {"WARN", "ERROR"} and len(page) == 8
+    page, _ = store.query(start=start, limit=100)
+    assert all(r["ts"] >= start for r in page) and len(page) == 8
+    assert store.query(end=start - 3600)[0] == []
+
+    # % and _ are matched literally, and case doesn't matter
+    page, mode = store.query(search="0%_", limit=100)
+    assert mode == "ilike" and [r["message"] for r in page] == [f"warn 10%_{i}" for i in reversed(range(4))]
+    page, _ = store.query(search="ERROR 1", levels=["ERROR"], before=page[0]["id"] + 100, limit=2)
+    assert [r["message"] for r in page] == ["error 1003", "error 1002"]
@@ -0,0 +1,104 @@
+import glob
+import os
+
+import duckdb
+import pytest
+
+from parquet_store import SECONDS_PER_DAY, SENSOR_BUCKET_SIZE, SNAPSHOT_FILE, ParquetStore, partition_filter
+
+DAY = 20000 * SECONDS_PER_DAY  # 2024-10-04
+
+
+@pytest.fixture
+def writer():
+    con = duckdb.connect()
+    con.execute("CREATE TABLE sensor_catalog (sensor_key INTEGER, name VARCHAR)")
+    yield con
+    con.close()
+
+
+def write_bucket(store, con, version, bucket, value, days=1):
+    """One sample per hour over `days` days for the first sensor of `bucket`, all `value`."""
+    con.execute(f"""
+        CREATE OR REPLACE TABLE sensors AS
+        SELECT {DAY} + i * 3600.0 AS ts, {bucket * SENSOR_BUCKET_SIZE} AS sensor_key, {value}::DOUBLE AS value
+        FROM range({24 * days}) t(i)
+    """)
+    return store.write_partitions(con, "sensors", "ts", version, bucket)
+
+
+def publish(store, con, partitioned, previous=None):
+    version = store.new_version(previous)
+    con.execute("DELETE FROM sensor_catalog")
+    con.execute("INSERT INTO sensor_catalog VALUES (?, ?)", [version, f"v{version}.csv"])
+    files = {bucket: write(version) for bucket, write in partitioned.items()}
+    # Carried-over buckets keep the previous version's files
+    if previous:
+        for bucket, old in previous["partitioned"]["sensors"].items():
+            files.setdefault(bucket, old)
+    snapshot = store.publish(con, version, {"sensors": files}, ["sensor_catalog"], previous=previous)
+    # Make sure readers see a new mtime even on file systems with coarse timestamps
+    path = store.path(SNAPSHOT_FILE)
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + version * 10_000_000))
+    return snapshot
+
+
+def sums(con):
+    return dict(con.execute("SELECT sensor_bucket, sum(value) FROM sensors GROUP BY 1 ORDER BY 1").fetchall())
+
+
+def test_readers_switch_to_each_published_snapshot(tmp_path, writer):
+    store = ParquetStore(str(tmp_path))
+    reader = duckdb.connect()
+    reader_store = ParquetStore(str(tmp_path))
+    assert not reader_store.refresh(reader)
+
+    v1 = publish(store, writer, {"0": lambda v: write_bucket(store, writer, v, 0, 1.0, days=2),
+                                 "1": lambda v: write_bucket(store, writer, v, 1, 2.0)})
+    assert reader_store.refresh(reader) and reader_store.version == 1
+    assert sums(reader) == {0: 48.0, 1: 48.0}
+    assert reader.execute("SELECT name FROM sensor_catalog").fetchall() == [("v1.csv",)]
+    # Nothing new: one stat, no re-attach
+    assert not reader_store.refresh(reader)
+
+    # v2 rewrites bucket 1 only; bucket 0's files are carried over from v1
+    v2 = publish(store, writer, {"1": lambda v: write_bucket(store, writer, v, 1, 3.0)}, previous=v1)
+    assert v2["partitioned"]["sensors"]["0"] == v1["partitioned"]["sensors"]["0"]
+    assert reader_store.refresh(reader) and reader_store.version == 2
+    assert sums(reader) == {0: 48.0, 1: 72.0}
+    assert reader.execute("SELECT name FROM sensor_catalog").fetchall() == [("v2.csv",)]
+    # v1's own files stay for queries that planned against it
+    assert all(os.path.exists(store.path(f)) for f in v1["partitioned"]["sensors"]["1"])
+
+    v3 = publish(store, writer, {"1": lambda v: write_bucket(store, writer, v, 1, 4.0)}, previous=v2)
+    assert reader_store.refresh(reader) and sums(reader) == {0: 48.0, 1: 96.0}
+    # Only files of v2 and v3 remain
+    kept = {os.path.relpath(p, tmp_path) for p in glob.glob(f"{tmp_path}/v*/**/*.parquet", recursive=True)}
+    referenced = {f for s in (v2, v3) for files in s["partitioned"]["sensors"].values() for f in files}
+    referenced |= {rel for s in (v2, v3) for rel in s["tables"].values()}
+    assert kept == referenced
+    assert not os.path.exists(store.path("v1/sensor_catalog.parquet"))
+
+
+def test_partition_filter_prunes_days_and_buckets(tmp_path, writer):
+    store = ParquetStore(str(tmp_path))
+    publish(store, writer, {"0": lambda v: write_bucket(store, writer, v, 0, 1.0, days=3),
+                            "2": lambda v: write_bucket(store, writer, v, 2, 1.0, days=3)})
+    reader = duckdb.connect()
+    store.refresh(reader)
+    lo, hi = DAY + SECONDS_PER_DAY, DAY + SECONDS_PER_DAY + 7200
+    where = partition_filter(lo, hi, [2 * SENSOR_BUCKET_SIZE])
+    assert where == " AND date BETWEEN DATE '2024-10-05' AND DATE '2024-10-05' AND sensor_bucket IN (2)"
+    rows = reader.execute(f"SELECT count(*), min(ts), max(ts) FROM sensors WHERE ts BETWEEN {lo} AND {hi}{where}")
+    assert rows.fetchone() == (3, lo, hi)
+
+
+def test_new_version_clears_leftovers_of_a_failed_run(tmp_path, writer):
+    store = ParquetStore(str(tmp_path))
+    v1 = publish(store, writer, {"0": lambda v: write_bucket(store, writer, v, 0, 1.0)})
+    os.makedirs(store.path("v2/sensors"))
+    open(store.path("v2/sensors/stale.parquet"), "w").close()
+    assert store.new_version(v1) == 2
+    assert not os.path.exists(store.path("v2"))
+    assert store.read_snapshot()["version"] == 1
@@ -0,0 +1,74 @@
+import asyncio
+import threading
+
+import duckdb
+import pytest
+
+from query_executor import QueryCancelled, QueryExecutor
+
+
+class FakeCursor:
+    def __init__(self):
+        self.interrupted = threading.Event()
+
+    def interrupt(self):
+        self.interrupted.set()
+
+
+def blocking_query(cursor, started):
+    """fn for QueryExecutor.run that runs until its cursor is interrupted."""
+    def fn(ticket):
+        with ticket.attached(cursor):
+            started.set()
+            cursor.interrupted.wait(5.0)
+            raise duckdb.InterruptException("INTERRUPT Error: Interrupted!")
+    return fn
+
+
+def test_cancelling_the_awaiting_task_interrupts_the_query():
+    executor = QueryExecutor(workers=1)
+    cursor, started = FakeCursor(), threading.Event()
+
+    async def scenario():
+        task = asyncio.create_task(executor.run(blocking_query(cursor, started), "client"))
+        while not started.is_set():
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    # Interrupted by the cancellation itself, not by the shutdown below
+    assert cursor.interrupted.wait(1.0)
+    executor.shutdown()
+    assert executor.stats()["cancelled"] == 1 and executor.stats()["clients"] == 0
+
+
+def test_disconnected_client_interrupts_the_query():
+    executor = QueryExecutor(workers=1, poll_interval=0.01)
+    cursor, started = FakeCursor(), threading.Event()
+
+    async def disconnected():
+        return started.is_set()
+
+    with pytest.raises(QueryCancelled, match="client disconnected"):
+        asyncio.run(executor.run(blocking_query(cursor, started), "client", is_disconnected=disconnected))
+    assert cursor.interrupted.wait(1.0)
+    executor.shutdown()
+
+
+def test_newer_generation_supersedes_the_running_query():
+    executor = QueryExecutor(workers=2)
+    cursor, started = FakeCursor(), threading.Event()
+
+    async def scenario():
+        old = asyncio.create_task(executor.run(blocking_query(cursor, started), "client", gen=1))
+        while not started.is_set():
+            await asyncio.sleep(0.01)
+        assert await executor.run(lambda ticket: "new", "client", gen=2) == "new"
+        with pytest.raises(QueryCancelled, match="superseded"):
+            await old
+
+    asyncio.run(scenario())
+    executor.shutdown()
+    assert executor.stats()["superseded"] == 1
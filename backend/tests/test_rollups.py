@@ -0,0 +1,107 @@
+import duckdb
+import numpy as np
+import pyarrow as pa
+import pytest
+
+import main
+from catalog_cache import SensorCatalog
+from ingest_csv import ROLLUP_LEVELS, build_rollups, create_schema, refresh_catalog, register_sensors
+from main import pick_rollup_level, query_buckets
+from metrics import RequestTimer
+from tile_cache import TileCache
+
+ANCHOR = 1_700_000_000.0
+N = 20_000
+
+
+@pytest.fixture(scope="module")
+def con():
+    """Two irregularly sampled sensors over ~2 h, with every rollup level built."""
+    rng = np.random.default_rng(5)
+    con = duckdb.connect()
+    create_schema(con)
+    register_sensors(con, "SELECT unnest(['a.csv', 'b.csv']) AS name")
+    parts = []
+    for key in (1, 2):
+        ts = ANCHOR + np.cumsum(rng.uniform(0.05, 0.65, N))
+        parts.append(pa.table({"ts": ts, "sensor_key": pa.array(np.full(N, key), pa.int32()),
+                               "value": np.cumsum(rng.normal(size=N))}))
+    rows = pa.concat_tables(parts)
+    con.execute("INSERT INTO sensors SELECT * FROM rows")
+    build_rollups(con, verbose=False)
+    refresh_catalog(con)
+    yield con
+    con.close()
+
+
+def sensor_catalog(con, levels):
+    """SensorCatalog offering `levels`; with none, every query reads the raw rows."""
+    rows = con.execute("""
+        SELECT sensor_key, name, sensor_group, first_ts, last_ts, row_count, min_val, max_val
+        FROM sensor_catalog ORDER BY name
+    """).fetchall()
+    return SensorCatalog(rows, levels)
+
+
+@pytest.mark.parametrize("levels, bucket_size, start, expected", [
+    ([1, 10, 60, 600], 120.0, 600.0, 60),
+    ([1, 10, 60, 600], 32.0, 0.0, 1),         # 10 and 60 don't divide a 32 s bucket
+    ([1, 10, 60, 600], 120.0, 630.0, 10),     # 60 s buckets would straddle the edges
+    ([1, 10, 60, 600], 120.0, 600.5, None),   # off the rollup grid entirely
+    ([1, 10, 60, 600], 0.5, 0.0, None),
+    ([1, 8, 64, 512], 1024.0, 4096.0 * 3, 512),
+    ([], 600.0, 0.0, None),
+])
+def test_pick_rollup_level_only_takes_levels_that_tile_the_buckets(levels, bucket_size, start, expected):
+    assert pick_rollup_level(levels, bucket_size, start) == expected
+
+
+@pytest.mark.parametrize("start_offset, bucket_size", [(0.0, 60.0), (100.0, 20.0), (37.3, 61.7), (512.0, 128.0)])
+@pytest.mark.parametrize("agg", ["avg", "m4"])
+def test_untiled_buckets_match_the_raw_rows(con, start_offset, bucket_size, agg):
+    catalog = sensor_catalog(con, ROLLUP_LEVELS)
+    start = ANCHOR + start_offset
+    num_buckets = 50
+    end = start + num_buckets * bucket_size
+    keys, grids = query_buckets(con, catalog, start, end, bucket_size, num_buckets, [1, 2], agg)
+    raw_keys, raw_grids = query_buckets(con, sensor_catalog(con, []), start, end, bucket_size, num_buckets, [1, 2], agg)
+    assert keys == raw_keys
+    for field, grid in grids.items():
+        # The extra bucket at the end only holds samples at exactly `end` on the raw path
+        np.testing.assert_allclose(grid[:, :num_buckets], raw_grids[field][:, :num_buckets], rtol=1e-9, err_msg=field)
+
+
+@pytest.mark.parametrize("exponent", range(-2, 14))
+def test_every_tile_grid_bucket_reads_the_coarsest_level_that_fits(exponent):
+    bucket_size = 2.0 ** exponent
+    expected = max((level for level in ROLLUP_LEVELS if level <= bucket_size), default=None)
+    assert pick_rollup_level(ROLLUP_LEVELS, bucket_size, 12345 * bucket_size) == expected
+
+
+@pytest.mark.parametrize("width", [100, 700, 3000])
+@pytest.mark.parametrize("agg", ["avg", "m4", "minmax"])
+def test_tiled_output_matches_the_raw_rows(con, monkeypatch, width, agg):
+    start, end = ANCHOR + 123.4, ANCHOR + 6789.0
+    results = []
+    for levels in (ROLLUP_LEVELS, []):
+        monkeypatch.setattr(main, "tile_cache", TileCache(64 << 20))
+        results.append(main.aggregate_tiled(con, sensor_catalog(con, levels), start, end, width, [], [1, 2], agg))
+    (times, keys, matrix), (raw_times, raw_keys, raw_matrix) = results
+    np.testing.assert_array_equal(times, raw_times)
+    assert keys == raw_keys == [1, 2]
+    np.testing.assert_allclose(matrix, raw_matrix, rtol=1e-9)
+
+
+def test_explain_reports_tiles_served_from_the_cache(con, monkeypatch):
+    monkeypatch.setattr(main, "tile_cache", TileCache(64 << 20))
+    catalog = sensor_catalog(con, ROLLUP_LEVELS)
+    reports = []
+    for _ in range(2):
+        timer = RequestTimer("data", explain=True)
+        with timer.activate():
+            main.aggregate_tiled(con, catalog, ANCHOR, ANCHOR + 3600.0, 500, [], [1, 2], "avg")
+        reports.append(timer.report())
+    cold, warm = reports
+    assert cold["tile_cache"]["hits"] == 0 and cold["tile_cache"]["misses"] > 0 and cold["queries"]
+    # Everything cached: no query to profile, and the report says why
+    assert warm["tile_cache"] == {"hits": cold["tile_cache"]["misses"], "misses": 0} and warm["queries"] == []
@@ -0,0 +1,100 @@
+import duckdb
+import numpy as np
+import pytest
+
+from ingest_csv import (REGULAR_JITTER, create_sample_tables, delete_samples, register_sensors, samples_between,
+                        write_samples)
+
+ANCHOR = 1.7e9
+N = 10000
+
+
+@pytest.fixture
+def samples():
+    """Sensor 1 every 0.5 s, sensor 2 at irregular times, sensor 3 constant; a few NaNs."""
+    rng = np.random.default_rng(0)
+    regular = ANCHOR + np.arange(N) * 0.5 + rng.uniform(-0.1, 0.1, N) * REGULAR_JITTER * 0.5
+    irregular = ANCHOR + np.sort(rng.uniform(0, N * 0.5, N))
+    values = [np.cumsum(rng.normal(0, 1, N)) * 50, rng.normal(20, 5, N), np.full(N, 3.25)]
+    values[0][[10, 5000]] = np.nan
+    times = np.concatenate([regular, irregular, regular])
+    keys = np.repeat([1, 2, 3], N).astype(np.int32)
+    return times, keys, np.concatenate(values)
+
+
+def stored(layout, samples):
+    con = duckdb.connect()
+    create_sample_tables(con, layout)
+    register_sensors(con, "SELECT unnest(['a.csv', 'b.csv', 'c.csv']) AS name")
+    times, keys, values = samples
+    con.register("new_rows", {"ts": times, "sensor_key": keys, "value": values})
+    write_samples(con, "SELECT * FROM new_rows", layout)
+    con.unregister("new_rows")
+    return con
+
+
+def read_back(con, source="sensors"):
+    table = con.execute(f"SELECT ts, sensor_key, value FROM {source} ORDER BY sensor_key, ts").to_arrow_table()
+    return tuple(col.to_numpy(zero_copy_only=False) for col in table.columns)
+
+
+def quantum(values, bits):
+    """Largest rounding error of write_samples' integer encoding: half its scale."""
+    finite = values[~np.isnan(values)]
+    span = finite.max() - finite.min()
+    return span / (2 * (2 ** (bits - 1) - 1)) / 2 if span else 0.0
+
+
+@pytest.mark.parametrize("layout", [("double", False), ("float", False), ("int32", False), ("int16", False),
+                                    ("float", True), ("int32", True), ("int16", True)])
+def test_round_trip_within_the_encoding_error(layout, samples):
+    con = stored(layout, samples)
+    times, keys, values = read_back(con)
+    np.testing.assert_array_equal(keys, samples[1])
+    encoding, blocks = layout
+    for key in (1, 2, 3):
+        sel = samples[1] == key
+        expected, got = samples[2][sel], values[keys == key]
+        np.testing.assert_array_equal(np.isnan(got), np.isnan(expected))
+        ok = ~np.isnan(expected)
+        error = np.abs(got[ok] - expected[ok])
+        if encoding == "double":
+            assert error.max() == 0.0
+        elif encoding == "float":
+            assert np.all(error <= np.abs(expected[ok]) * 2.0 ** -24)
+        else:
+            assert error.max() <= quantum(expected, int(encoding[3:])) * (1 + 1e-9)
+        # Blocks put samples back on their grid, within the jitter they were accepted with
+        tolerance = REGULAR_JITTER * 0.5 if blocks and key != 2 else 0.0
+        np.testing.assert_allclose(times[keys == key], samples[0][sel], rtol=0, atol=tolerance)
+
+    if blocks:
+        in_blocks = {r[0] for r in con.execute("SELECT DISTINCT sensor_key FROM sensor_blocks").fetchall()}
+        assert in_blocks == {1, 3}  # the irregular sensor stays in rows
+
+
+@pytest.mark.parametrize("layout", [("int16", True), ("double", False)])
+def test_samples_between_slices_the_range(layout, samples):
+    con = stored(layout, samples)
+    lo, hi = ANCHOR + 1234.6, ANCHOR + 2345.2
+    source = samples_between(layout != ("double", False), lo, hi)
+    got = read_back(con, f"{source} WHERE ts BETWEEN {lo} AND {hi}")
+    everything = read_back(con)
+    inside = (everything[0] >= lo) & (everything[0] <= hi)
+    for got_col, col in zip(got, everything):
+        np.testing.assert_array_equal(got_col, col[inside])
+
+
+def test_deleted_sensors_can_be_written_again(samples):
+    layout = ("int16", True)
+    con = stored(layout, samples)
+    delete_samples(con, "SELECT 1")
+    times, keys, values = samples
+    sel = keys == 1
+    con.register("new_rows", {"ts": times[sel], "sensor_key": keys[sel], "value": values[sel] * 10})
+    write_samples(con, "SELECT * FROM new_rows", layout)
+    _, got_keys, got = read_back(con)
+    expected = values[sel] * 10
+    ok = ~np.isnan(expected)
+    assert np.abs(got[got_keys == 1][ok] - expected[ok]).max() <= quantum(expected, 16) * (1 + 1e-9)
+    assert (got_keys == 2).sum() == N
@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+
+from tile_cache import TILE_BUCKETS, TileCache, grid_bucket_size
+
+
+def tile(n_fields=1):
+    return np.zeros((n_fields, TILE_BUCKETS))
+
+
+TILE_BYTES = tile().nbytes
+
+
+def test_get_returns_what_was_put():
+    cache = TileCache(max_bytes=10 * TILE_BYTES)
+    t = tile()
+    cache.put((1, "avg", 0, 5), t)
+    assert cache.get((1, "avg", 0, 5)) is t
+    assert cache.get((1, "extrema", 0, 5)) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_evicts_least_recently_used_over_the_byte_bound():
+    cache = TileCache(max_bytes=3 * TILE_BYTES)
+    for t in range(3):
+        cache.put((1, "avg", 0, t), tile())
+    cache.get((1, "avg", 0, 0))  # 1 is now the oldest
+    cache.put((1, "avg", 0, 3), tile())
+
+    assert cache.get((1, "avg", 0, 1)) is None
+    assert all(cache.get((1, "avg", 0, t)) is not None for t in (0, 2, 3))
+    assert cache.evictions == 1
+    assert cache.bytes == 3 * TILE_BYTES
+
+
+def test_replacing_a_key_keeps_byte_count_exact():
+    cache = TileCache(max_bytes=10 * TILE_BYTES)
+    cache.put((1, "extrema", 0, 0), tile(6))
+    cache.put((1, "extrema", 0, 0), tile(2))
+    assert cache.bytes == tile(2).nbytes
+    assert cache.stats()["tiles"] == 1
+
+
+def test_tile_larger_than_the_cache_is_not_kept():
+    cache = TileCache(max_bytes=TILE_BYTES)
+    cache.put((1, "extrema", 0, 0), tile(6))
+    assert cache.get((1, "extrema", 0, 0)) is None
+    assert cache.bytes == 0
+
+
+def test_put_from_an_older_generation_is_dropped():
+    cache = TileCache(max_bytes=10 * TILE_BYTES)
+    seen = cache.generation  # a reader starts its query
+    cache.invalidate([1], since=0.0)  # a write lands meanwhile
+    cache.put((1, "avg", 0, 0), tile(), seen)
+    assert cache.get((1, "avg", 0, 0)) is None
+
+    cache.put((1, "avg", 0, 0), tile(), cache.generation)
+    assert cache.get((1, "avg", 0, 0)) is not None
+
+
+def test_invalidate_drops_only_touched_tiles():
+    cache = TileCache(max_bytes=100 * TILE_BYTES)
+    span = TILE_BUCKETS * 1.0  # tile length at exponent 0 (1 s buckets)
+    for sensor in (1, 2):
+        for t in range(4):
+            cache.put((sensor, "avg", 0, t), tile())
+    # Coarser tiles of sensor 1 covering [0, 4 * span)
+    cache.put((1, "avg", 2, 0), tile())
+
+    before = cache.generation
+    cache.invalidate([1], since=2.5 * span)
+
+    assert cache.generation == before + 1
+    # Sensor 1: tiles ending at or before `since` stay, later ones and the coarse tile go
+    assert [cache.get((1, "avg", 0, t)) is not None for t in range(4)] == [True, True, False, False]
+    assert cache.get((1, "avg", 2, 0)) is None
+    # Sensor 2 is untouched
+    assert all(cache.get((2, "avg", 0, t)) is not None for t in range(4))
+    assert cache.invalidations == 3
+
+
+def test_clear_empties_and_bumps_generation():
+    cache = TileCache(max_bytes=10 * TILE_BYTES)
+    cache.put((1, "avg", 0, 0), tile())
+    before = cache.generation
+    cache.clear()
+    assert cache.generation == before + 1
+    assert cache.bytes == 0 and cache.get((1, "avg", 0, 0)) is None
+
+
+@pytest.mark.parametrize("duration, width", [(3600.0, 1000), (1.0, 1920), (86400.0 * 365, 800), (1000.0, 1000)])
+def test_grid_bucket_size_is_a_power_of_two_giving_width_to_twice_width_buckets(duration, width):
+    exponent, size = grid_bucket_size(duration, width)
+    assert size == 2.0 ** exponent
+    assert width <= duration / size < 2 * width
@@ -0,0 +1,98 @@
+import math
+import threading
+from collections import OrderedDict
+
+# Buckets per cached tile. A tile covers TILE_BUCKETS * bucket_size seconds.
+TILE_BUCKETS = 256
+
+
+def grid_bucket_size(duration, width):
+    """Snaps the requested bucket width (duration / width) down to a power of two seconds.
+
+    Every request at the same zoom level therefore uses the same global bucket grid
+    (bucket i covers [i * size, (i + 1) * size)), so tiles can be shared between
+    requests whose start/end differ by arbitrary amounts. The returned size yields
+    between width and 2 * width buckets for the requested range.
+    """
+    exponent = math.floor(math.log2(duration / width))
+    return exponent, 2.0 ** exponent
+
+
+class TileCache:
+    """Thread-safe LRU of NumPy tiles, bounded by total array bytes.
+
+    Keys are (sensor_key, kind, resolution exponent, tile index); values are arrays of
+    shape (n_fields, TILE_BUCKETS) with NaN for empty buckets.
+
+    `generation` increases on every invalidate(). A reader passes the generation it saw
+    before querying to put(), so a tile computed from a snapshot older than the latest
+    write is used for that response but never cached.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+        self.generation = 0
+
+        # Metrics
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is None:
+                self.misses += 1
+                return None
+            self._tiles.move_to_end(key)
+            self.hits += 1
+            return tile
+
+    def put(self, key, tile, generation=None):
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            old = self._tiles.pop(key, None)
+            if old is not None:
+                self.bytes -= old.nbytes
+            self._tiles[key] = tile
+            self.bytes += tile.nbytes
+            while self.bytes > self.max_bytes and self._tiles:
+                _, evicted = self._tiles.popitem(last=False)
+                self.bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def invalidate(self, sensor_keys, since):
+        """Drops the tiles of `sensor_keys` that end after `since` (new data landed there)."""
+        sensor_keys = set(sensor_keys)
+        with self._lock:
+            self.generation += 1
+            stale = [key for key in self._tiles
+                     if key[0] in sensor_keys and (key[3] + 1) * TILE_BUCKETS * 2.0 ** key[2] > since]
+            for key in stale:
+                self.bytes -= self._tiles.pop(key).nbytes
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._tiles.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "tiles": len(self._tiles),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
@@ -15,9 +15,9 @@ export function SensorSelector() {
     const [selected, setSelected] = useState<Set<string>>(new Set())
     const [searchTerm, setSearchTerm] = useState('')
 
-    // Fetch sensors and build tree
+    // Fetch sensors and build tree (again after an upload added one)
     useEffect(() => {
-        fetch('http://localhost:8000/api/sensors')
+        const loadSensors = () => fetch('http://localhost:8000/api/sensors')
             .then(res => res.json())
             .then((data: Record<string, string[]>) => {
                 const tree: SensorNode[] = []
@@ -55,6 +55,10 @@ export function SensorSelector() {
                 }
             })
             .catch(err => console.error("Failed to load sensors:", err))
+
+        loadSensors()
+        window.addEventListener('sensor-catalog-change', loadSensors)
+        return () => window.removeEventListener('sensor-catalog-change', loadSensors)
     }, [])
 
     const updateUrl = (newSelected: Set<string>) => {
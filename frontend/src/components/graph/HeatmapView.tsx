@@ -1,18 +1,65 @@
 import { useRef, useEffect, useState } from 'react'
+import { decodeGridFrame, GridFrame, GRID_NO_DATA } from '../../utils/binaryFrame'
 
 interface HeatmapViewProps {
-    sensorCount?: number
-    timeSteps?: number
+    start?: number | null
+    end?: number | null
 }
 
-// Generate some coherent noise for the demo
-function noise(x: number, y: number) {
-    return (Math.sin(x * 0.05) + Math.sin(y * 0.1) + Math.sin((x + y) * 0.02)) * 0.33
-}
+// Color Mapping (Blue -> Green -> Red), precomputed for the 255 uint8 levels
+const PALETTE = (() => {
+    const lut = new Uint8ClampedArray(256 * 4)
+    for (let i = 0; i < GRID_NO_DATA; i++) {
+        const val = i / (GRID_NO_DATA - 1)
+        lut[i * 4] = Math.floor(val * 255)
+        lut[i * 4 + 1] = Math.floor((1 - Math.abs(val - 0.5) * 2) * 255)
+        lut[i * 4 + 2] = Math.floor((1 - val) * 255)
+        lut[i * 4 + 3] = 255
+    }
+    // No data: transparent (the black background shows through)
+    return lut
+})()
 
-export function HeatmapView({ sensorCount = 500, timeSteps = 1000 }: HeatmapViewProps) {
+export function HeatmapView({ start = null, end = null }: HeatmapViewProps) {
     const canvasRef = useRef<HTMLCanvasElement>(null)
-    const [hoverInfo, setHoverInfo] = useState<{ x: number, y: number, val: number } | null>(null)
+    const [grid, setGrid] = useState<GridFrame | null>(null)
+    const [hoverInfo, setHoverInfo] = useState<{ x: number, y: number, sensors: string, time: number, val: number | null } | null>(null)
+
+    // One request for the whole sensors x time matrix: one row per sensor (grouped when
+    // there are more sensors than pixel rows), one column per pixel, uint8 cells.
+    useEffect(() => {
+        let controller = new AbortController()
+
+        const fetchGrid = async () => {
+            controller.abort()
+            controller = new AbortController()
+            const parent = canvasRef.current?.parentElement
+            const width = parent?.clientWidth || 800
+            const height = parent?.clientHeight || 600
+            const sensorsParam = new URLSearchParams(window.location.search).get('sensors') || ''
+
+            let url = `http://localhost:8000/api/heatmap?width=${width}&height=${height}&ids=${sensorsParam}&normalize=sensor&dtype=uint8`
+            if (start !== null && end !== null) url += `&start=${start}&end=${end}`
+
+            try {
+                const response = await fetch(url, { signal: controller.signal })
+                if (response.status === 409) return
+                if (!response.ok) throw new Error("Heatmap API call failed")
+                setGrid(decodeGridFrame(await response.arrayBuffer()))
+            } catch (err) {
+                if (err instanceof DOMException && err.name === 'AbortError') return
+                console.error("Failed to fetch heatmap:", err)
+                setGrid(null)
+            }
+        }
+
+        fetchGrid()
+        window.addEventListener('sensor-selection-change', fetchGrid)
+        return () => {
+            window.removeEventListener('sensor-selection-change', fetchGrid)
+            controller.abort()
+        }
+    }, [start, end])
 
     useEffect(() => {
         const canvas = canvasRef.current
@@ -23,34 +70,22 @@ export function HeatmapView({ sensorCount = 500, timeSteps = 1000 }: HeatmapView
         // Set canvas size
         const width = canvas.width = canvas.parentElement?.clientWidth || 800
         const height = canvas.height = canvas.parentElement?.clientHeight || 600
+        ctx.clearRect(0, 0, width, height)
+        if (!grid || grid.rows === 0 || grid.cols === 0 || grid.dtype !== 'uint8') return
 
-        // Render Heatmap
-        const imageData = ctx.createImageData(width, height)
-        const data = imageData.data
-
-        for (let y = 0; y < height; y++) {
-            for (let x = 0; x < width; x++) {
-                // Map pixel to sensor/time space
-                const sensorIdx = Math.floor((y / height) * sensorCount)
-                const timeIdx = Math.floor((x / width) * timeSteps)
-
-                // Generate value (0-1)
-                const val = (noise(timeIdx, sensorIdx) + 1) / 2
-
-                // Color Mapping (Blue -> Green -> Red)
-                const r = Math.floor(val * 255)
-                const g = Math.floor((1 - Math.abs(val - 0.5) * 2) * 255)
-                const b = Math.floor((1 - val) * 255)
-
-                const index = (y * width + x) * 4
-                data[index] = r     // Red
-                data[index + 1] = g // Green
-                data[index + 2] = b // Blue
-                data[index + 3] = 255 // Alpha
-            }
-        }
+        // Render the grid at its own resolution, then scale it onto the canvas
+        const image = new ImageData(grid.cols, grid.rows)
+        const pixels = new Uint32Array(image.data.buffer)
+        const palette = new Uint32Array(PALETTE.buffer)
+        const cells = grid.cells as Uint8Array
+        for (let i = 0; i < cells.length; i++) pixels[i] = palette[cells[i]]
 
-        ctx.putImageData(imageData, 0, 0)
+        const offscreen = document.createElement('canvas')
+        offscreen.width = grid.cols
+        offscreen.height = grid.rows
+        offscreen.getContext('2d')!.putImageData(image, 0, 0)
+        ctx.imageSmoothingEnabled = false
+        ctx.drawImage(offscreen, 0, 0, width, height)
 
         // Draw Grid Lines
         ctx.strokeStyle = 'rgba(255, 255, 255, 0.1)'
@@ -62,18 +97,25 @@ export function HeatmapView({ sensorCount = 500, timeSteps = 1000 }: HeatmapView
         }
         ctx.stroke()
 
-    }, [sensorCount, timeSteps])
+    }, [grid])
 
     const handleMouseMove = (e: React.MouseEvent<HTMLCanvasElement>) => {
         const rect = canvasRef.current?.getBoundingClientRect()
-        if (!rect) return
+        if (!rect || !grid || grid.rows === 0) return
         const x = e.clientX - rect.left
         const y = e.clientY - rect.top
-        const relY = y / rect.height
+        const row = Math.min(Math.floor((y / rect.height) * grid.rows), grid.rows - 1)
+        const col = Math.min(Math.floor((x / rect.width) * grid.cols), grid.cols - 1)
+
+        const first = grid.row_start[row]
+        const last = (row + 1 < grid.rows ? grid.row_start[row + 1] : grid.ids.length) - 1
+        const cell = grid.cells[row * grid.cols + col]
         setHoverInfo({
             x: Math.floor(x),
             y: Math.floor(y),
-            val: Math.floor(relY * sensorCount)
+            sensors: first === last ? grid.ids[first] : `${grid.ids[first]} .. ${grid.ids[last]} (${last - first + 1})`,
+            time: grid.start + ((col + 0.5) / grid.cols) * (grid.end - grid.start),
+            val: cell === GRID_NO_DATA ? null : cell / (GRID_NO_DATA - 1),
         })
     }
 
@@ -90,12 +132,13 @@ export function HeatmapView({ sensorCount = 500, timeSteps = 1000 }: HeatmapView
                     className="absolute bg-slate-900 border border-slate-700 p-2 rounded pointer-events-none text-xs text-white shadow-xl"
                     style={{ top: hoverInfo.y + 10, left: hoverInfo.x + 10 }}
                 >
-                    <p className="font-bold">Sensor ID: {hoverInfo.val}</p>
-                    <p className="text-slate-400">Time: +{hoverInfo.x}ms</p>
+                    <p className="font-bold">Sensor: {hoverInfo.sensors}</p>
+                    <p className="text-slate-400">Time: {new Date(hoverInfo.time * 1000).toLocaleString()}</p>
+                    <p className="text-slate-400">Level: {hoverInfo.val === null ? '--' : `${(hoverInfo.val * 100).toFixed(0)}%`}</p>
                 </div>
             )}
             <div className="absolute top-2 right-2 bg-black/50 p-1 rounded text-xs text-white">
-                Heatmap Mode (GPU Accelerated)
+                Heatmap Mode ({grid ? `${grid.ids.length} sensors` : 'loading'})
             </div>
         </div>
     )
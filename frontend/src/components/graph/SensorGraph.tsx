@@ -107,6 +107,8 @@ export function SensorGraph({ data, seriesConfig, title = "Sensor Stream", heigh
                 label: conf.label,
                 stroke: conf.stroke,
                 width: conf.width || 2,
+                // Binary responses are Float64Arrays where empty buckets are NaN instead of null
+                value: (_self: uPlot, raw: number | null) => raw == null || Number.isNaN(raw) ? '--' : raw.toFixed(3),
                 points: { show: false },
                 spanGaps: true // Fix "dots" by connecting lines over nulls
             })
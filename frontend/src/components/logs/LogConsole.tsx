@@ -1,34 +1,48 @@
-import { useRef } from 'react'
+import { useEffect, useRef } from 'react'
 import { useVirtualizer } from '@tanstack/react-virtual'
 
-interface LogEntry {
+export interface LogEntry {
     id: number
     timestamp: string
-    level: 'INFO' | 'WARN' | 'ERROR' | 'DEBUG'
+    level: 'INFO' | 'WARN' | 'ERROR' | 'DEBUG' | 'CRITICAL'
+    logger?: string
     message: string
 }
 
 interface LogConsoleProps {
     logs: LogEntry[]
+    // Paged sources: an extra loader row is shown while more pages exist, and
+    // onLoadMore is called once it scrolls into view
+    hasMore?: boolean
+    loading?: boolean
+    onLoadMore?: () => void
+    live?: boolean
 }
 
-export function LogConsole({ logs }: LogConsoleProps) {
+export function LogConsole({ logs, hasMore = false, loading = false, onLoadMore, live = true }: LogConsoleProps) {
     const parentRef = useRef<HTMLDivElement>(null)
 
     const rowVirtualizer = useVirtualizer({
-        count: logs.length,
+        count: hasMore ? logs.length + 1 : logs.length,
         getScrollElement: () => parentRef.current,
         estimateSize: () => 24, // Estimate row height (24px)
         overscan: 5,
     })
 
+    const virtualItems = rowVirtualizer.getVirtualItems()
+    const lastIndex = virtualItems.length ? virtualItems[virtualItems.length - 1].index : -1
+
+    useEffect(() => {
+        if (hasMore && !loading && lastIndex >= logs.length - 1) onLoadMore?.()
+    }, [hasMore, loading, lastIndex, logs.length, onLoadMore])
+
     return (
         <div className="flex flex-col h-full border rounded-lg bg-black font-mono text-sm overflow-hidden shadow-inner">
             <div className="flex items-center justify-between px-4 py-2 bg-slate-900 border-b border-slate-800">
-                <span className="text-muted-foreground text-xs">Console Output ({logs.length} lines)</span>
+                <span className="text-muted-foreground text-xs">Console Output ({logs.length}{hasMore ? "+" : ""} lines)</span>
                 <div className="flex gap-2">
-                    <span className="h-2 w-2 rounded-full bg-red-500 animate-pulse"></span>
-                    <span className="text-xs text-red-500">Live</span>
+                    {live && <span className="h-2 w-2 rounded-full bg-red-500 animate-pulse"></span>}
+                    {live && <span className="text-xs text-red-500">Live</span>}
                 </div>
             </div>
 
@@ -43,8 +57,22 @@ export function LogConsole({ logs }: LogConsoleProps) {
                         position: 'relative',
                     }}
                 >
-                    {rowVirtualizer.getVirtualItems().map((virtualRow) => {
+                    {virtualItems.map((virtualRow) => {
                         const log = logs[virtualRow.index]
+                        if (!log) {
+                            return (
+                                <div
+                                    key="loader"
+                                    className="absolute top-0 left-0 w-full px-4 text-slate-500"
+                                    style={{
+                                        height: `${virtualRow.size}px`,
+                                        transform: `translateY(${virtualRow.start}px)`,
+                                    }}
+                                >
+                                    {loading ? 'Loading older lines...' : ''}
+                                </div>
+                            )
+                        }
                         return (
                             <div
                                 key={virtualRow.index}
@@ -57,13 +85,13 @@ export function LogConsole({ logs }: LogConsoleProps) {
                                 <span className="text-slate-500 w-[160px] shrink-0 select-none block truncate">
                                     {log.timestamp}
                                 </span>
-                                <span className={`w-[50px] shrink-0 font-bold ${log.level === 'ERROR' ? 'text-red-500' :
+                                <span className={`w-[50px] shrink-0 font-bold ${log.level === 'ERROR' || log.level === 'CRITICAL' ? 'text-red-500' :
                                         log.level === 'WARN' ? 'text-yellow-500' :
                                             log.level === 'DEBUG' ? 'text-blue-500' : 'text-green-500'
                                     }`}>
                                     {log.level}
                                 </span>
-                                <span className="text-slate-300 truncate">
+                                <span className="text-slate-300 truncate" title={log.logger}>
                                     {log.message}
                                 </span>
                             </div>
@@ -1,24 +1,74 @@
-import { useState, useEffect } from 'react'
+import { useState, useEffect, useRef } from 'react'
 import { SensorGraph } from '../components/graph/SensorGraph'
 import { HeatmapView } from '../components/graph/HeatmapView'
 import { SensorSelector } from '../components/controls/SensorSelector'
 import { TimeControls } from '../components/controls/TimeControls'
+import { decodeF64Frame } from '../utils/binaryFrame'
+import { LIVE_SOCKET_URL, mergeLiveFrame } from '../utils/liveStream'
+import { readNdjsonBatches, toSeriesArray } from '../utils/ndjsonStream'
+import { uploadCsv } from '../utils/csvUpload'
+import { fetchViewports, joinStrip, sliceStrip, PanStrip, SeriesWindow } from '../utils/viewportBatch'
 import uPlot from 'uplot'
-import { BarChart2, Grid } from 'lucide-react'
-
-
+import { BarChart2, Grid, Radio } from 'lucide-react'
+
+// Identifies this dashboard to the backend. Every request carries an increasing generation,
+// so the server can interrupt older in-flight queries when the user pans/zooms quickly.
+const CLIENT_ID = Math.random().toString(36).slice(2)
+let requestGeneration = 0
+
+// Trailing window shown in live mode (seconds)
+const LIVE_WINDOW_SECONDS = 300
+
+// Selections larger than this (or "all sensors") are streamed as NDJSON and drawn as the
+// series arrive, instead of waiting for one large f64 frame
+const STREAM_THRESHOLD = 100
+
+// Zoomed-in selections up to this size are fetched through /api/data/batch together with
+// the windows left and right of the view, so the first pan is drawn without a round trip.
+// The full (unzoomed) view can't be panned and stays on format=f64.
+const PREFETCH_MAX_SENSORS = 16
+
+const SERIES_COLORS = [
+    "#22d3ee", "#d946ef", "#84cc16", "#f59e0b", "#ef4444", "#3b82f6"
+]
+
+const seriesConfigFor = (ids: string[]) => ids.map((id, idx) => ({
+    label: id,
+    stroke: SERIES_COLORS[idx % SERIES_COLORS.length],
+    width: 2
+}))
+
+const selectedSensorIds = () => {
+    const sensorsParam = new URLSearchParams(window.location.search).get('sensors')
+    return sensorsParam ? sensorsParam.split(',').filter(Boolean) : []
+}
 
 export default function LiveDashboard() {
     const [data, setData] = useState<uPlot.AlignedData>([[]])
     const [seriesConfig, setSeriesConfig] = useState<any[]>([])
     const [viewMode, setViewMode] = useState<'graph' | 'heatmap'>('graph')
-    const [loading, setLoading] = useState(false)
+    // Progress of a CSV upload to /api/ingest-csv, null when none is running
+    const [uploadStatus, setUploadStatus] = useState<string | null>(null)
     const [timeRange, setTimeRange] = useState<{ start: number | null, end: number | null }>({ start: null, end: null })
     const [interactionMode, setInteractionMode] = useState<'zoom' | 'pan'>('zoom')
+    // Downsampling mode sent to the backend. m4 keeps spikes visible in a single request.
+    const [aggMode, setAggMode] = useState<'avg' | 'm4' | 'minmax' | 'lttb'>('m4')
+    // Live mode: the backend pushes new buckets over /ws/live instead of us re-fetching the window
+    const [live, setLive] = useState(false)
+    // Sensor ids of the chart's series, in order (live frames are merged by id)
+    const seriesIds = useRef<string[]>([])
+    // Last prefetched view plus its neighbors (see utils/viewportBatch.ts)
+    const panStrip = useRef<PanStrip | null>(null)
 
     // Fetch real data from Backend API
     useEffect(() => {
+        // Aborting disconnects stale requests, which also cancels their query on the backend
+        let controller = new AbortController()
+
         const fetchData = async () => {
+            controller.abort()
+            controller = new AbortController()
+            const gen = ++requestGeneration
             try {
                 // Determine width for downsampling (default to window width)
                 const width = window.innerWidth;
@@ -27,51 +77,49 @@ export default function LiveDashboard() {
                 const params = new URLSearchParams(window.location.search);
                 const sensorsParam = params.get('sensors');
                 const cleanIds = sensorsParam ? sensorsParam : ""; // Send empty or CSV
+                const streamed = !cleanIds || cleanIds.split(',').length > STREAM_THRESHOLD
+
+                const ids = cleanIds ? cleanIds.split(',') : []
+                const { start, end } = timeRange
+                const zoomed = start !== null && end !== null
+                if (zoomed && ids.length > 0 && ids.length <= PREFETCH_MAX_SENSORS) {
+                    await renderPrefetched(ids, start, end, width, gen)
+                    return
+                }
 
-                let url = `http://localhost:8000/api/data?width=${width}&ids=${cleanIds}`;
+                // format=f64: packed Float64 arrays instead of JSON (see utils/binaryFrame.ts)
+                // format=ndjson: one sensor per line, streamed (see utils/ndjsonStream.ts)
+                let url = `http://localhost:8000/api/data?width=${width}&ids=${cleanIds}&agg=${aggMode}&format=${streamed ? 'ndjson' : 'f64'}&client=${CLIENT_ID}&gen=${gen}`;
                 // Add time range if zoomed
-                if (timeRange.start !== null && timeRange.end !== null) {
-                    url += `&start=${timeRange.start}&end=${timeRange.end}`
+                if (zoomed) {
+                    url += `&start=${start}&end=${end}`
                 }
 
-                const response = await fetch(url)
+                const response = await fetch(url, { signal: controller.signal })
+                // 409: superseded by a newer request from this dashboard, which will update the chart
+                if (response.status === 409) return
                 if (!response.ok) throw new Error("API call failed")
 
-                const json = await response.json()
-                // Backend returns { time: [], series: [{id, data: []}, ...] }
-
-                console.log("🔥 API Response:", json)
-
-                if (json && json.time && json.series) {
-                    const times = json.time
+                if (streamed) {
+                    await renderStream(response)
+                    return
+                }
 
-                    // Construct AlignedData: [ [time], [s1], [s2]... ]
-                    const alignedData: any[] = [times]
-                    const newConfig: any[] = []
+                const frame = decodeF64Frame(await response.arrayBuffer())
+                // Backend returns time + one Float64Array per sensor (NaN = no data in bucket)
 
-                    const colors = [
-                        "#22d3ee", "#d946ef", "#84cc16", "#f59e0b", "#ef4444", "#3b82f6"
-                    ]
+                console.log("🔥 API Response:", frame)
 
-                    json.series.forEach((s: any, idx: number) => {
-                        alignedData.push(s.data)
-                        newConfig.push({
-                            label: s.id,
-                            stroke: colors[idx % colors.length],
-                            width: 2
-                        })
-                    })
+                // Construct AlignedData: [ [time], [s1], [s2]... ] directly from the typed array views
+                const alignedData: uPlot.AlignedData = [frame.time, ...frame.series]
 
-                    console.log(`🔥 Received ${times.length} points for ${json.series.length} sensors`)
+                console.log(`🔥 Received ${frame.time.length} points for ${frame.ids.length} sensors`)
 
-                    setData(alignedData as uPlot.AlignedData)
-                    setSeriesConfig(newConfig)
-                } else {
-                    console.error("🔥 Invalid API Data Structure", json)
-                    setData([[]])
-                    setSeriesConfig([])
-                }
+                seriesIds.current = frame.ids
+                setData(alignedData)
+                setSeriesConfig(seriesConfigFor(frame.ids))
             } catch (err) {
+                if (err instanceof DOMException && err.name === 'AbortError') return
                 console.error("Failed to fetch from backend:", err)
                 // Fallback (empty for now, removed mock generator)
                 setData([[]])
@@ -79,6 +127,53 @@ export default function LiveDashboard() {
             }
         }
 
+        const renderWindow = (view: SeriesWindow) => {
+            seriesIds.current = view.ids
+            setData([view.time, ...view.series])
+            setSeriesConfig(seriesConfigFor(view.ids))
+        }
+
+        // Draws the window from the previous prefetch if it covers it (a pan), then fetches
+        // the window and its neighbors, which become the next prefetch
+        const renderPrefetched = async (ids: string[], start: number, end: number, width: number, gen: number) => {
+            const key = `${ids.join(',')}|${aggMode}|${width}`
+            const cached = panStrip.current ? sliceStrip(panStrip.current, key, start, end, width) : null
+            if (cached) renderWindow(cached)
+
+            const results = await fetchViewports([{ ids, start, end, width, agg: aggMode }],
+                { neighbors: true, client: CLIENT_ID, gen, signal: controller.signal })
+            // null: superseded by a newer request from this dashboard, which will update the chart
+            if (!results) return
+            panStrip.current = joinStrip(key, start, end, results[0])
+            renderWindow(results[0])
+        }
+
+        // Adds series to the chart as they arrive, one state update per network chunk
+        const renderStream = async (response: Response) => {
+            let time = new Float64Array(0)
+            const ids: string[] = []
+            const series: Float64Array[] = []
+            for await (const records of readNdjsonBatches(response)) {
+                for (const record of records) {
+                    if (record.type === 'meta') {
+                        time = Float64Array.from(record.time)
+                    } else if (record.type === 'series') {
+                        ids.push(record.id)
+                        series.push(toSeriesArray(record.data))
+                    } else if (record.type === 'error') {
+                        // 409: superseded by a newer request, which will redraw the chart
+                        if (record.status === 409) return
+                        throw new Error(`Stream failed: ${record.detail}`)
+                    } else {
+                        console.log(`🔥 Streamed ${time.length} points for ${record.sensors} sensors`, record)
+                    }
+                }
+                seriesIds.current = [...ids]
+                setData([time, ...series])
+                setSeriesConfig(seriesConfigFor(ids))
+            }
+        }
+
         fetchData()
 
         // Listen for selection changes from Sidebar
@@ -90,30 +185,84 @@ export default function LiveDashboard() {
 
         return () => {
             window.removeEventListener('sensor-selection-change', handleSelectionChange)
+            controller.abort()
+        }
+    }, [timeRange, aggMode])
+
+    // Live updates: subscribe to the selected sensors and merge every pushed frame
+    useEffect(() => {
+        if (!live) return
+
+        const socket = new WebSocket(LIVE_SOCKET_URL)
+        socket.binaryType = 'arraybuffer'
+
+        const subscribe = () => {
+            if (socket.readyState !== WebSocket.OPEN) return
+            socket.send(JSON.stringify({
+                ids: selectedSensorIds(),
+                window: LIVE_WINDOW_SECONDS,
+                width: window.innerWidth,
+                agg: aggMode,
+            }))
+        }
+        socket.onopen = subscribe
+        socket.onmessage = (event) => {
+            if (typeof event.data === 'string') {
+                console.warn("Live socket:", event.data)
+                return
+            }
+            const frame = decodeF64Frame(event.data)
+            setData(prev => mergeLiveFrame(prev, seriesIds.current, frame, LIVE_WINDOW_SECONDS))
         }
-    }, [timeRange])
+        socket.onerror = (err) => console.error("Live socket error:", err)
+
+        window.addEventListener('sensor-selection-change', subscribe)
+        return () => {
+            window.removeEventListener('sensor-selection-change', subscribe)
+            socket.close()
+        }
+    }, [live, aggMode])
+
+    const toggleLive = () => {
+        if (live) {
+            setLive(false)
+            return
+        }
+        // Load the trailing window once; the socket keeps it up to date from here
+        const now = Date.now() / 1000
+        setTimeRange({ start: now - LIVE_WINDOW_SECONDS, end: now })
+        setLive(true)
+    }
 
     const handleFileUpload = async (event: React.ChangeEvent<HTMLInputElement>) => {
         const file = event.target.files?.[0]
+        event.target.value = '' // allow uploading the same file again
         if (!file) return
 
-        setLoading(true)
+        setUploadStatus('Uploading 0%')
         try {
-            const { parseCSV } = await import('../utils/csvLoader')
-            const parsedData = await parseCSV(file)
-            setData(parsedData)
-            // Mock config for CSV for now
-            setSeriesConfig([{ label: "CSV Data", stroke: "#fff" }])
+            const job = await uploadCsv(file, progress => {
+                if ('sent' in progress) setUploadStatus(`Uploading ${Math.round(progress.sent * 100)}%`)
+                else if (progress.job.stage !== 'receiving') setUploadStatus(`Ingesting (${progress.job.stage})`)
+            })
+            console.log(`📥 Ingested ${job.rows} rows as ${job.sensor}`)
+            // Show the new sensor: the sidebar reloads the catalog, the chart follows the selection
+            const params = new URLSearchParams(window.location.search)
+            params.set('sensors', job.sensor)
+            window.history.replaceState(null, '', `${window.location.pathname}?${params.toString()}`)
+            window.dispatchEvent(new Event('sensor-catalog-change'))
+            window.dispatchEvent(new Event('sensor-selection-change'))
         } catch (err) {
-            console.error("CSV Parse Error", err)
-            alert("Failed to parse CSV")
+            console.error("CSV Upload Error", err)
+            alert(`Failed to upload CSV: ${err instanceof Error ? err.message : err}`)
         } finally {
-            setLoading(false)
+            setUploadStatus(null)
         }
     }
 
     const handleZoom = (min: number, max: number) => {
         console.log(`Zooming to: ${min} - ${max}`)
+        setLive(false)
         setTimeRange({ start: min, end: max })
     }
 
@@ -134,6 +283,7 @@ export default function LiveDashboard() {
         const newStart = currentStart! + deltaSeconds
         const newEnd = currentEnd! + deltaSeconds
 
+        setLive(false)
         setTimeRange({ start: newStart, end: newEnd })
     }
 
@@ -165,9 +315,28 @@ export default function LiveDashboard() {
                                 Pan
                             </button>
                         </div>
+                        <div className="flex bg-slate-900 rounded p-1 border border-slate-700">
+                            {(['avg', 'm4', 'minmax', 'lttb'] as const).map(mode => (
+                                <button
+                                    key={mode}
+                                    onClick={() => setAggMode(mode)}
+                                    title="Downsampling mode"
+                                    className={`px-3 py-1 rounded text-xs font-bold uppercase transition-colors ${aggMode === mode ? 'bg-cyan-500/20 text-cyan-400' : 'text-slate-400 hover:text-white'}`}
+                                >
+                                    {mode}
+                                </button>
+                            ))}
+                        </div>
+                        <button
+                            onClick={toggleLive}
+                            title="Live mode (stream new data)"
+                            className={`px-3 py-1 flex items-center gap-2 rounded text-xs font-bold border transition-colors ${live ? 'bg-lime-500/20 text-lime-400 border-lime-500/50' : 'bg-slate-900 text-slate-400 border-slate-700 hover:text-white'}`}
+                        >
+                            <Radio size={14} /> Live
+                        </button>
                         {timeRange.start !== null && (
                             <button
-                                onClick={() => setTimeRange({ start: null, end: null })}
+                                onClick={() => { setLive(false); setTimeRange({ start: null, end: null }) }}
                                 className="px-3 py-1 bg-red-500/20 text-red-500 border border-red-500/50 rounded text-xs font-bold hover:bg-red-500/30 transition-colors"
                             >
                                 Reset Zoom
@@ -182,10 +351,11 @@ export default function LiveDashboard() {
                                 type="file"
                                 accept=".csv"
                                 onChange={handleFileUpload}
+                                disabled={uploadStatus !== null}
                                 className="absolute inset-0 w-full h-full opacity-0 cursor-pointer"
                             />
-                            <button className={`px-3 py-1 flex items-center gap-2 text-xs font-medium border rounded transition-colors ${loading ? 'bg-yellow-500/20 border-yellow-500/50 text-yellow-500' : 'bg-slate-900 border-slate-700 hover:border-slate-500'}`}>
-                                {loading ? 'Parsing...' : 'Upload CSV'}
+                            <button className={`px-3 py-1 flex items-center gap-2 text-xs font-medium border rounded transition-colors ${uploadStatus ? 'bg-yellow-500/20 border-yellow-500/50 text-yellow-500' : 'bg-slate-900 border-slate-700 hover:border-slate-500'}`}>
+                                {uploadStatus ?? 'Upload CSV'}
                             </button>
                         </div>
 
@@ -244,7 +414,7 @@ export default function LiveDashboard() {
                                 onPan={handlePan}
                             />
                         ) : (
-                            <HeatmapView />
+                            <HeatmapView start={timeRange.start} end={timeRange.end} />
                         )}
                     </div>
                 </div>
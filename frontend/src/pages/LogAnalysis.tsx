@@ -1,60 +1,129 @@
-import { useState, useEffect } from 'react'
-import { LogConsole } from '../components/logs/LogConsole'
+import { useState, useEffect, useCallback, useRef } from 'react'
+import { LogConsole, LogEntry } from '../components/logs/LogConsole'
 
-interface LogEntry {
+// Server logs from /api/logs (backend/log_store.py), newest first. Older pages are
+// loaded as the console scrolls down; new lines are polled and put on top.
+const LOGS_URL = 'http://localhost:8000/api/logs'
+const PAGE_SIZE = 500
+const POLL_INTERVAL_MS = 2000
+const LEVELS = ['DEBUG', 'INFO', 'WARN', 'ERROR'] as const
+
+interface ApiLogRecord {
     id: number
-    timestamp: string
-    level: 'INFO' | 'WARN' | 'ERROR' | 'DEBUG'
+    ts: number
+    level: LogEntry['level']
+    logger: string
     message: string
 }
 
-const MOCK_MESSAGES = [
-    "Connection established to TimescaleDB node #1",
-    "Ingesting data chunk (4MB)",
-    "Aggregation complete for window [10m]",
-    "Sensor #492 reporting high latency",
-    "Worker process spawned",
-    "Garbage collection triggered",
-    "User query received: range=1h",
-]
-
-function generateLogs(count: number): LogEntry[] {
-    const logs: LogEntry[] = []
-    const now = Date.now()
-    for (let i = 0; i < count; i++) {
-        logs.push({
-            id: i,
-            timestamp: new Date(now - (count - i) * 1000).toISOString().replace('T', ' ').split('.')[0],
-            level: i % 50 === 0 ? 'ERROR' : i % 20 === 0 ? 'WARN' : 'INFO',
-            message: `${MOCK_MESSAGES[Math.floor(Math.random() * MOCK_MESSAGES.length)]} [ID:${Math.floor(Math.random() * 1000)}]`
-        })
-    }
-    return logs
-}
+const toEntry = (r: ApiLogRecord): LogEntry => ({
+    id: r.id,
+    timestamp: new Date(r.ts * 1000).toISOString().replace('T', ' ').split('.')[0],
+    level: r.level,
+    logger: r.logger,
+    message: r.message,
+})
 
 export default function LogAnalysis() {
     const [logs, setLogs] = useState<LogEntry[]>([])
+    const [cursor, setCursor] = useState<number | null>(null)
+    const [hasMore, setHasMore] = useState(true)
+    const [loading, setLoading] = useState(false)
+    const [search, setSearch] = useState('')
+    const [query, setQuery] = useState('')
+    const [levels, setLevels] = useState<string[]>(['INFO', 'WARN', 'ERROR'])
+    // Filters of the current result set; a change starts over from the newest line
+    const filterKey = `${query}|${levels.join(',')}`
+    const activeKey = useRef(filterKey)
 
+    // Debounce typing into the search box
     useEffect(() => {
-        // Generate 50,000 logs to demonstrate performance
-        setLogs(generateLogs(50000))
-    }, [])
+        const timer = setTimeout(() => setQuery(search.trim()), 300)
+        return () => clearTimeout(timer)
+    }, [search])
+
+    const fetchPage = useCallback(async (params: Record<string, string>) => {
+        const url = new URLSearchParams({ limit: String(PAGE_SIZE), level: levels.join(','), q: query, ...params })
+        const response = await fetch(`${LOGS_URL}?${url}`)
+        if (!response.ok) throw new Error("API call failed")
+        return await response.json() as { entries: ApiLogRecord[], next_cursor: number | null }
+    }, [levels, query])
+
+    const loadMore = useCallback(async () => {
+        setLoading(true)
+        const key = activeKey.current
+        try {
+            const page = await fetchPage(cursor === null ? {} : { before: String(cursor) })
+            if (key !== activeKey.current) return // filters changed while loading
+            setLogs(prev => [...prev, ...page.entries.map(toEntry)])
+            setCursor(page.next_cursor)
+            setHasMore(page.next_cursor !== null)
+        } catch (err) {
+            console.error("Failed to fetch logs:", err)
+            setHasMore(false)
+        } finally {
+            setLoading(false)
+        }
+    }, [cursor, fetchPage])
+
+    // New filters: drop what is loaded, the console then requests the first page
+    useEffect(() => {
+        activeKey.current = filterKey
+        setLogs([])
+        setCursor(null)
+        setHasMore(true)
+    }, [filterKey])
+
+    // Poll for lines newer than the newest one shown
+    const newestId = logs.length ? logs[0].id : null
+    useEffect(() => {
+        if (newestId === null) return
+        const key = activeKey.current
+        const timer = setInterval(async () => {
+            try {
+                const page = await fetchPage({ after: String(newestId) })
+                if (key === activeKey.current && page.entries.length) {
+                    setLogs(prev => [...page.entries.map(toEntry), ...prev])
+                }
+            } catch (err) {
+                console.error("Failed to poll logs:", err)
+            }
+        }, POLL_INTERVAL_MS)
+        return () => clearInterval(timer)
+    }, [newestId, fetchPage])
+
+    const toggleLevel = (level: string) => {
+        setLevels(prev => prev.includes(level) ? prev.filter(l => l !== level) : [...prev, level])
+    }
 
     return (
         <div className="p-6 h-[calc(100vh-2rem)] flex flex-col">
             <div className="flex justify-between items-center mb-4">
                 <h1 className="text-3xl font-bold">System Logs</h1>
                 <div className="flex gap-2">
+                    <div className="flex bg-slate-900 rounded p-1 border border-slate-700">
+                        {LEVELS.map(level => (
+                            <button
+                                key={level}
+                                onClick={() => toggleLevel(level)}
+                                className={`px-3 py-1 rounded text-xs font-bold transition-colors ${levels.includes(level) ? 'bg-cyan-500/20 text-cyan-400' : 'text-slate-400 hover:text-white'}`}
+                            >
+                                {level}
+                            </button>
+                        ))}
+                    </div>
                     <input
                         type="text"
                         placeholder="Search logs..."
+                        value={search}
+                        onChange={e => setSearch(e.target.value)}
                         className="bg-background border rounded px-3 py-1 text-sm w-64 focus:outline-none focus:ring-1 focus:ring-primary"
                     />
                 </div>
             </div>
 
             <div className="flex-1 min-h-0">
-                <LogConsole logs={logs} />
+                <LogConsole logs={logs} hasMore={hasMore} loading={loading} onLoadMore={loadMore} />
             </div>
         </div>
     )
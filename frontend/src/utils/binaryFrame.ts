@@ -0,0 +1,75 @@
+// Decoder for the backend's packed Float64 format (`/api/data?format=f64`).
+// Layout (little-endian, see backend/encoding.py):
+//   "SF64" | uint32 headerLength | JSON header (padded to 8 bytes) | time[n] | series_0[n] | series_1[n] ...
+// The arrays are returned as Float64Array views on the response buffer - no copying, no JSON.parse.
+
+export interface F64Frame {
+    ids: string[]
+    agg: string
+    time: Float64Array
+    series: Float64Array[]
+    [key: string]: unknown
+}
+
+const MAGIC = 'SF64'
+
+export const decodeF64Frame = (buffer: ArrayBuffer): F64Frame => {
+    const view = new DataView(buffer)
+    const magic = String.fromCharCode(view.getUint8(0), view.getUint8(1), view.getUint8(2), view.getUint8(3))
+    if (magic !== MAGIC) throw new Error(`Invalid frame magic: ${magic}`)
+
+    const headerLength = view.getUint32(4, true)
+    const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 8, headerLength)))
+
+    const points: number = header.points
+    let offset = 8 + headerLength
+
+    // Float64Array views require 8-byte aligned offsets; the backend pads the header for this.
+    // Byte order: typed arrays use platform order, which is little-endian on every browser target we support.
+    const time = new Float64Array(buffer, offset, points)
+    offset += points * 8
+
+    const series: Float64Array[] = header.ids.map(() => {
+        const arr = new Float64Array(buffer, offset, points)
+        offset += points * 8
+        return arr
+    })
+
+    return { ...header, time, series }
+}
+
+// Decoder for `/api/heatmap` grids (backend/encoding.py encode_grid):
+//   "SGRD" | uint32 headerLength | JSON header (padded to 8 bytes) | rows*cols cells, row-major
+// uint8 cells hold 0..254 (normalized value) with 255 = no data; float32 cells use NaN.
+
+export const GRID_NO_DATA = 255
+
+export interface GridFrame {
+    rows: number
+    cols: number
+    dtype: 'uint8' | 'float32'
+    ids: string[]
+    row_start: number[]
+    start: number
+    end: number
+    cells: Uint8Array | Float32Array
+    [key: string]: unknown
+}
+
+const GRID_MAGIC = 'SGRD'
+
+export const decodeGridFrame = (buffer: ArrayBuffer): GridFrame => {
+    const view = new DataView(buffer)
+    const magic = String.fromCharCode(view.getUint8(0), view.getUint8(1), view.getUint8(2), view.getUint8(3))
+    if (magic !== GRID_MAGIC) throw new Error(`Invalid grid magic: ${magic}`)
+
+    const headerLength = view.getUint32(4, true)
+    const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 8, headerLength)))
+    const offset = 8 + headerLength
+    const count = header.rows * header.cols
+
+    const cells = header.dtype === 'float32'
+        ? new Float32Array(buffer, offset, count)
+        : new Uint8Array(buffer, offset, count)
+    return { ...header, cells }
+}
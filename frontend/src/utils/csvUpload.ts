@@ -0,0 +1,54 @@
+// CSV upload to the backend's /api/ingest-csv: the browser streams the file straight
+// from disk as the request body (nothing is parsed or held in JS memory), the backend
+// spools and ingests it in the background, and we poll the job until it's done.
+export const UPLOAD_URL = 'http://localhost:8000/api/ingest-csv'
+const POLL_INTERVAL_MS = 500
+
+export interface UploadJob {
+    id: number
+    sensor: string
+    stage: 'receiving' | 'queued' | 'loading' | 'rollups' | 'events' | 'done' | 'failed'
+    bytes_received: number
+    bytes_total: number | null
+    rows: number | null
+    error: string | null
+}
+
+// Uploads `file` and resolves with the finished job (rejects if ingest failed).
+// onProgress gets the sent fraction while uploading, then every polled job state.
+export const uploadCsv = (
+    file: File,
+    onProgress: (progress: { sent: number } | { job: UploadJob }) => void
+): Promise<UploadJob> => {
+    return new Promise((resolve, reject) => {
+        // XHR rather than fetch: only XHR reports upload progress
+        const xhr = new XMLHttpRequest()
+        xhr.open('POST', `${UPLOAD_URL}?name=${encodeURIComponent(file.name)}`)
+        xhr.setRequestHeader('Content-Type', 'text/csv')
+        xhr.upload.onprogress = (e) => {
+            if (e.lengthComputable) onProgress({ sent: e.loaded / e.total })
+        }
+        xhr.onerror = () => reject(new Error('Upload failed'))
+        xhr.onload = () => {
+            if (xhr.status !== 202) {
+                reject(new Error(`Upload failed: ${xhr.responseText}`))
+                return
+            }
+            const poll = async (job: UploadJob) => {
+                onProgress({ job })
+                if (job.stage === 'done') return resolve(job)
+                if (job.stage === 'failed') return reject(new Error(job.error ?? 'Ingest failed'))
+                await new Promise(r => setTimeout(r, POLL_INTERVAL_MS))
+                try {
+                    const response = await fetch(`${UPLOAD_URL}/${job.id}`)
+                    if (!response.ok) throw new Error(`Upload status failed (${response.status})`)
+                    poll(await response.json())
+                } catch (err) {
+                    reject(err)
+                }
+            }
+            poll(JSON.parse(xhr.responseText))
+        }
+        xhr.send(file)
+    })
+}
@@ -0,0 +1,54 @@
+// Live mode: merges the incremental bucket frames pushed by the backend's /ws/live
+// (same f64 layout as /api/data?format=f64, see binaryFrame.ts) into the chart data.
+import uPlot from 'uplot'
+import { F64Frame } from './binaryFrame'
+
+export const LIVE_SOCKET_URL = 'ws://localhost:8000/ws/live'
+
+// First index i with arr[i] >= value (arr is sorted)
+const lowerBound = (arr: ArrayLike<number>, value: number) => {
+    let lo = 0
+    let hi = arr.length
+    while (lo < hi) {
+        const mid = (lo + hi) >> 1
+        if (arr[mid] < value) lo = mid + 1
+        else hi = mid
+    }
+    return lo
+}
+
+// Every bucket from the frame's `from` on is replaced by the frame (the backend re-sends
+// the bucket new data landed in; lttb points may sit later than its start), newer ones
+// are appended and anything older than
+// `windowSeconds` before the newest bucket is dropped. Series follow the chart's `ids`;
+// sensors missing from the frame get NaN for the new buckets.
+export const mergeLiveFrame = (
+    data: uPlot.AlignedData,
+    ids: string[],
+    frame: F64Frame,
+    windowSeconds: number
+): uPlot.AlignedData => {
+    if (frame.time.length === 0) return data
+
+    const oldTime = (data[0] ?? []) as ArrayLike<number>
+    const latest = frame.time[frame.time.length - 1]
+    const from = lowerBound(oldTime, latest - windowSeconds)
+    const first = typeof frame.from === 'number' ? frame.from : frame.time[0]
+    const keep = Math.max(lowerBound(oldTime, first), from)
+    const kept = keep - from
+
+    const merge = (old: ArrayLike<number | null | undefined> | undefined, fresh: Float64Array | undefined) => {
+        const out = new Float64Array(kept + frame.time.length)
+        for (let i = 0; i < kept; i++) out[i] = old?.[from + i] ?? NaN
+        if (fresh) out.set(fresh, kept)
+        else out.fill(NaN, kept)
+        return out
+    }
+
+    const time = merge(oldTime, frame.time)
+    const series = ids.map((id, idx) => {
+        const pos = frame.ids.indexOf(id)
+        return merge(data[idx + 1] as ArrayLike<number | null | undefined>, pos >= 0 ? frame.series[pos] : undefined)
+    })
+    return [time, ...series]
+}
@@ -0,0 +1,58 @@
+// Reader for `/api/data?format=ndjson` (backend/main.py stream_sensor_data).
+// One JSON record per line:
+//   {"type": "meta", "agg", "time": [...], "bucket", "sensors"}   first, the shared time axis
+//   {"type": "series", "id", "data": [...]}                       one per sensor, in name order
+//   {"type": "end", "sensors", "timings_ms", ...}                 or {"type": "error", "status", "detail"}
+// Series arrive while the backend is still aggregating the next chunk of sensors,
+// so large selections can be drawn progressively.
+
+export interface StreamMeta {
+    type: 'meta'
+    agg: string
+    time: number[]
+    bucket?: number
+    sensors: number
+}
+
+export interface StreamSeries {
+    type: 'series'
+    id: string
+    data: (number | null)[]
+}
+
+export interface StreamEnd {
+    type: 'end'
+    sensors: number
+    [key: string]: unknown
+}
+
+export interface StreamError {
+    type: 'error'
+    status: number
+    detail: string
+}
+
+export type StreamRecord = StreamMeta | StreamSeries | StreamEnd | StreamError
+
+// Yields the records of every network chunk together, so callers can update once per chunk
+export async function* readNdjsonBatches(response: Response): AsyncGenerator<StreamRecord[]> {
+    if (!response.body) throw new Error("Response has no body")
+    const reader = response.body.getReader()
+    const decoder = new TextDecoder()
+    let pending = ''
+
+    while (true) {
+        const { done, value } = await reader.read()
+        pending += done ? decoder.decode() : decoder.decode(value, { stream: true })
+        const lines = pending.split('\n')
+        // The last piece is an incomplete line (or '' after a newline); keep it for the next chunk
+        pending = done ? '' : lines.pop()!
+        const records = lines.filter(Boolean).map(line => JSON.parse(line) as StreamRecord)
+        if (records.length) yield records
+        if (done) return
+    }
+}
+
+// JSON has no NaN: empty buckets arrive as null, uPlot wants NaN gaps like the f64 frames
+export const toSeriesArray = (data: (number | null)[]): Float64Array =>
+    Float64Array.from(data, v => (v === null ? NaN : v))
@@ -0,0 +1,135 @@
+// Client for the backend's /api/data/batch: several viewports in one request, each
+// optionally with its left/right neighbors (the windows one full width to either side,
+// at the same resolution). A PanStrip joins a viewport's three windows, so a pan that
+// stays inside them is drawn from memory while the next request is in flight.
+import { toSeriesArray } from './ndjsonStream'
+
+export const BATCH_URL = 'http://localhost:8000/api/data/batch'
+
+export interface Viewport {
+    ids: string[]
+    start: number | null
+    end: number | null
+    width: number
+    agg: string
+}
+
+export interface SeriesWindow {
+    time: Float64Array
+    ids: string[]
+    series: Float64Array[]
+}
+
+export interface ViewportResult extends SeriesWindow {
+    agg: string
+    bucket: number | null
+    left?: SeriesWindow
+    right?: SeriesWindow
+}
+
+interface RawWindow {
+    time: number[]
+    series: { id: string, data: (number | null)[] }[]
+}
+
+const toWindow = (raw: RawWindow): SeriesWindow => ({
+    time: Float64Array.from(raw.time),
+    ids: raw.series.map(s => s.id),
+    series: raw.series.map(s => toSeriesArray(s.data)),
+})
+
+// Resolves with one result per viewport, or null if a newer request from the same
+// client superseded this one (409)
+export const fetchViewports = async (
+    viewports: Viewport[],
+    options: { neighbors?: boolean, client?: string, gen?: number, signal?: AbortSignal } = {}
+): Promise<ViewportResult[] | null> => {
+    const params = new URLSearchParams()
+    if (options.client) params.set('client', options.client)
+    if (options.gen !== undefined) params.set('gen', String(options.gen))
+    const response = await fetch(`${BATCH_URL}?${params}`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ viewports, neighbors: options.neighbors ?? false }),
+        signal: options.signal,
+    })
+    if (response.status === 409) return null
+    if (!response.ok) throw new Error(`Batch request failed (${response.status})`)
+    const body = await response.json()
+    return body.viewports.map((raw: RawWindow & { agg: string, bucket: number | null, left?: RawWindow, right?: RawWindow }) => ({
+        agg: raw.agg,
+        bucket: raw.bucket,
+        ...toWindow(raw),
+        left: raw.left && toWindow(raw.left),
+        right: raw.right && toWindow(raw.right),
+    }))
+}
+
+// Same snapping as the backend's tile_cache.grid_bucket_size
+const gridBucketSize = (duration: number, width: number) => 2 ** Math.floor(Math.log2(duration / width))
+
+// First index i with arr[i] >= value (arr is sorted)
+const lowerBound = (arr: ArrayLike<number>, value: number) => {
+    let lo = 0
+    let hi = arr.length
+    while (lo < hi) {
+        const mid = (lo + hi) >> 1
+        if (arr[mid] < value) lo = mid + 1
+        else hi = mid
+    }
+    return lo
+}
+
+// A viewport's left, view and right windows as one run of buckets [first, last]; `key`
+// names the selection (ids, agg, width) it was fetched for
+export interface PanStrip extends SeriesWindow {
+    key: string
+    bucket: number
+    first: number
+    last: number
+}
+
+// `start`/`end` are the view's range as requested; the neighbors are one view width of
+// buckets to either side (see the backend's batch_sensor_data)
+export const joinStrip = (key: string, start: number, end: number, result: ViewportResult): PanStrip | null => {
+    if (result.bucket === null || !result.left || !result.right) return null
+    const viewFirst = Math.floor(start / result.bucket)
+    const viewLast = Math.floor(end / result.bucket)
+    const n = viewLast - viewFirst + 1
+    const windows = [result.left, result, result.right]
+    const ids = [...new Set(windows.flatMap(w => w.ids))].sort()
+    const length = windows.reduce((total, w) => total + w.time.length, 0)
+    const time = new Float64Array(length)
+    const series = ids.map(() => new Float64Array(length).fill(NaN))
+    let offset = 0
+    for (const w of windows) {
+        time.set(w.time, offset)
+        // A window leaves out sensors without data in it; they stay NaN here
+        w.ids.forEach((id, i) => series[ids.indexOf(id)].set(w.series[i], offset))
+        offset += w.time.length
+    }
+    return { key, bucket: result.bucket, first: viewFirst - n, last: viewLast + n, time, ids, series }
+}
+
+// The buckets /api/data would return for [start, end] at `width`, cut out of the strip
+// by time (lttb points sit at their own times, not on the bucket grid), or null if that
+// window has another resolution or isn't fully inside the strip
+export const sliceStrip = (strip: PanStrip, key: string, start: number, end: number, width: number): SeriesWindow | null => {
+    if (strip.key !== key || end <= start || gridBucketSize(end - start, width) !== strip.bucket) return null
+    const first = Math.floor(start / strip.bucket)
+    const last = Math.floor(end / strip.bucket)
+    if (first < strip.first || last > strip.last) return null
+
+    const lo = lowerBound(strip.time, first * strip.bucket)
+    const hi = lowerBound(strip.time, (last + 1) * strip.bucket)
+    const ids: string[] = []
+    const series: Float64Array[] = []
+    strip.ids.forEach((id, i) => {
+        const data = strip.series[i].subarray(lo, hi)
+        if (data.some(v => !Number.isNaN(v))) {
+            ids.push(id)
+            series.push(data)
+        }
+    })
+    return { time: strip.time.subarray(lo, hi), ids, series }
+}